@@ -0,0 +1,40 @@
+from typing import Any
+from fastapi import Depends, Request
+from fastapi.exceptions import RequestValidationError
+from pydantic import BaseModel, ValidationError
+
+from app.core.config import settings
+
+def validate_body(model: type[BaseModel], max_size: int | None = None) -> Any:
+    """
+    Зависимость для маршрутов, которым нужна проверка тела на шлюзе.
+    Буферизуется только тело с Content-Length не больше max_size (по
+    умолчанию VALIDATE_BODY_MAX_SIZE), поэтому память на запрос ограничена
+    этим пределом. Большие и chunked тела уходят в upstream потоком без
+    проверки — ее выполняет сам сервис. max_size=0 отключает проверку.
+    """
+    async def _validate(request: Request) -> None:
+        limit = settings.VALIDATE_BODY_MAX_SIZE if max_size is None else max_size
+        length = request.headers.get("content-length")
+        if not limit or length is None or not length.isdigit() or int(length) > limit:
+            return
+        try:
+            model.model_validate_json(await request.body())
+        except ValidationError as exc:
+            raise RequestValidationError(
+                [{**err, "loc": ("body", *err["loc"])} for err in exc.errors(include_url=False)]
+            )
+
+    return Depends(_validate)
+
+def body_schema(model: type[BaseModel]) -> dict[str, Any]:
+    """
+    Описание тела запроса для OpenAPI: модель больше не объявлена
+    параметром эндпоинта, поэтому FastAPI сам схему не построит.
+    """
+    return {
+        "requestBody": {
+            "required": True,
+            "content": {"application/json": {"schema": model.model_json_schema()}},
+        }
+    }
\ No newline at end of file
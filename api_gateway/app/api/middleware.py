@@ -0,0 +1,255 @@
+import random
+import time
+import zlib
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.tracing import (
+    KIND_SERVER,
+    TRACEPARENT_HEADER,
+    current_span,
+    new_trace,
+    parse_traceparent,
+    record_span,
+)
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Потоковые ответы (SSE) сжимать нельзя: клиент ждет каждое событие сразу
+UNCOMPRESSIBLE_TYPES = ("text/event-stream", "image/", "video/", "audio/", "application/zip")
+
+class _GzipEncoder:
+    def __init__(self, level: int):
+        self._obj = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._obj.compress(data)
+
+    def finish(self) -> bytes:
+        return self._obj.flush()
+
+class _BrotliEncoder:
+    def __init__(self, level: int):
+        self._obj = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._obj.process(data)
+
+    def finish(self) -> bytes:
+        return self._obj.finish()
+
+class _ZstdEncoder:
+    def __init__(self, level: int):
+        self._obj = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._obj.compress(data)
+
+    def finish(self) -> bytes:
+        return self._obj.flush()
+
+def available_encodings() -> dict[str, type]:
+    encoders: dict[str, type] = {"gzip": _GzipEncoder}
+    if brotli is not None:
+        encoders["br"] = _BrotliEncoder
+    if zstandard is not None:
+        encoders["zstd"] = _ZstdEncoder
+    return encoders
+
+def negotiate_encoding(accept_encoding: str, preferred: list[str]) -> str | None:
+    """
+    Выбирает кодировку с максимальным q из Accept-Encoding; при равных q
+    побеждает та, что раньше в списке предпочтений сервера.
+    """
+    weights: dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[token] = q
+
+    best, best_q = None, 0.0
+    for encoding in preferred:
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+class CompressionMiddleware:
+    """
+    Сжимает ответы шлюза согласно Accept-Encoding клиента (br, zstd, gzip).
+    Тело сжимается потоком по мере прихода кусков от upstream, без
+    буферизации всего ответа. Маленькие ответы, уже сжатые ответы и SSE
+    передаются как есть.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        *,
+        minimum_size: int,
+        levels: dict[str, int],
+        preferred: list[str],
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.levels = levels
+        self.encoders = available_encodings()
+        self.preferred = [name for name in preferred if name in self.encoders]
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = Headers(scope=scope).get("accept-encoding", "")
+        encoding = negotiate_encoding(accept_encoding, self.preferred) if accept_encoding else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = _CompressionResponder(
+            send, encoding, self.encoders[encoding], self.levels.get(encoding), self.minimum_size
+        )
+        await self.app(scope, receive, responder.send)
+
+class _CompressionResponder:
+    """
+    Решение о сжатии принимается по Content-Length из заголовков ответа
+    (upstream его присылает, шлюз копирует). Без Content-Length куски тела
+    копятся, пока их не наберется minimum_size или тело не закончится:
+    ответы шлюза — StreamingResponse, и первый кусок почти никогда не
+    бывает последним.
+    """
+
+    def __init__(self, send: Send, encoding: str, encoder_cls: type, level: int, minimum_size: int):
+        self._send = send
+        self.encoding = encoding
+        self.encoder_cls = encoder_cls
+        self.level = level
+        self.minimum_size = minimum_size
+        self.start_message: Message | None = None
+        self.pending = bytearray()
+        self.encoder = None
+        self.passthrough = False
+
+    async def send(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            content_type = headers.get("content-type", "")
+            content_length = headers.get("content-length")
+            self.passthrough = (
+                "content-encoding" in headers
+                or message["status"] in (204, 304)
+                or content_type.startswith(UNCOMPRESSIBLE_TYPES)
+                or (content_length is not None and content_length.isdigit()
+                    and int(content_length) < self.minimum_size)
+            )
+            if self.passthrough:
+                await self._send(message)
+            else:
+                self.start_message = message
+            return
+
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.start_message is not None:
+            start = self.start_message
+            if "content-length" not in Headers(raw=start["headers"]):
+                self.pending += body
+                if more_body and len(self.pending) < self.minimum_size:
+                    return
+                body, self.pending = bytes(self.pending), bytearray()
+                if not more_body and len(body) < self.minimum_size:
+                    self.start_message = None
+                    self.passthrough = True
+                    await self._send(start)
+                    await self._send({"type": "http.response.body", "body": body, "more_body": False})
+                    return
+            self.start_message = None
+
+            self.encoder = self.encoder_cls(self.level)
+            headers = MutableHeaders(raw=start["headers"])
+            headers["Content-Encoding"] = self.encoding
+            headers.add_vary_header("Accept-Encoding")
+            del headers["Content-Length"]
+            etag = headers.get("etag")
+            if etag and not etag.startswith("W/"):
+                # Байты ответа изменились — сильный ETag становится слабым
+                headers["ETag"] = f"W/{etag}"
+            await self._send(start)
+
+        chunk = self.encoder.compress(body)
+        if not more_body:
+            chunk += self.encoder.finish()
+        if chunk or not more_body:
+            await self._send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+class TracingMiddleware:
+    """
+    Начинает трассу саги на входе в систему: продолжает traceparent клиента
+    или открывает новую (с вероятностью sample_ratio). Идентификатор трассы
+    возвращается клиенту в X-Trace-Id, чтобы по нему найти спаны.
+    """
+
+    def __init__(self, app: ASGIApp, sample_ratio: float = 1.0):
+        self.app = app
+        self.sample_ratio = sample_ratio
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        parent = parse_traceparent(Headers(scope=scope).get(TRACEPARENT_HEADER))
+        if parent is not None:
+            context = parent.child()
+        else:
+            context = new_trace(sampled=random.random() < self.sample_ratio)
+        token = current_span.set(context)
+        status = 500
+        started = time.time_ns()
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if context.sampled:
+                    MutableHeaders(scope=message)["X-Trace-Id"] = context.trace_id
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_span.reset(token)
+            route = scope.get("route")
+            record_span(
+                f"HTTP {scope['method']} {route.path if route else scope['path']}",
+                parent, started, time.time_ns(),
+                kind=KIND_SERVER,
+                attributes={"http.status_code": status},
+                context=context,
+                error=status >= 500,
+            )
\ No newline at end of file
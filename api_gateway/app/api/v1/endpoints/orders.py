@@ -1,22 +1,59 @@
-from fastapi import APIRouter, Request, Query
+from datetime import datetime
+
+from fastapi import APIRouter, Header, Request, Query
 from app.core.config import settings
 from app.services.proxy_client import proxy_client
+from app.api.dependencies import validate_body, body_schema
 from app.api.v1.schemas.orders_schemas import (
     OrderCreateRequest,
     OrderResponse,
+    UserOrderStatsResponse,
 )
 
 router = APIRouter()
 BASE_URL = settings.ORDERS_SERVICE_URL
 
-@router.post("/", response_model=OrderResponse, status_code=201)
-async def create_order(request: Request, _: OrderCreateRequest):
-    return await proxy_client.forward_request(BASE_URL, request)
+WAIT_PATTERN = r"^\d+(\.\d+)?s?$"
+# If-None-Match и ETag проксируются как есть, 304 от сервиса отдается клиенту без тела
+NOT_MODIFIED = {304: {"description": "Ресурс не изменился (If-None-Match)"}}
 
-@router.get("/", response_model=list[OrderResponse])
-async def list_orders(request: Request, user_id: int = Query(..., gt=0)):
+@router.post(
+    "/",
+    response_model=OrderResponse,
+    status_code=201,
+    dependencies=[validate_body(OrderCreateRequest)],
+    openapi_extra=body_schema(OrderCreateRequest),
+)
+async def create_order(request: Request, idempotency_key: str | None = Header(None)):
+    # Idempotency-Key передается в orders_service как есть
     return await proxy_client.forward_request(BASE_URL, request)
 
-@router.get("/{order_id}", response_model=OrderResponse)
-async def get_order(request: Request, order_id: int, user_id: int = Query(..., gt=0)):
-    return await proxy_client.forward_request(BASE_URL, request)
\ No newline at end of file
+@router.get("/", response_model=list[OrderResponse], responses=NOT_MODIFIED)
+async def list_orders(
+    request: Request,
+    user_id: int = Query(..., gt=0),
+    since: datetime | None = Query(None),
+):
+    return await proxy_client.forward_request(BASE_URL, request, hedge=True)
+
+@router.get("/stats", response_model=UserOrderStatsResponse)
+async def get_user_stats(request: Request, user_id: int = Query(..., gt=0)):
+    return await proxy_client.forward_request(BASE_URL, request, hedge=True)
+
+@router.get("/{order_id}", response_model=OrderResponse, responses=NOT_MODIFIED)
+async def get_order(
+    request: Request,
+    order_id: int,
+    user_id: int = Query(..., gt=0),
+    wait: str | None = Query(None, pattern=WAIT_PATTERN),
+):
+    if wait:
+        # Long-poll: ждем upstream дольше обычного и не хеджируем ожидание
+        timeout = float(wait.rstrip("s")) + settings.UPSTREAM_TIMEOUT
+        return await proxy_client.forward_request(BASE_URL, request, timeout=timeout, limit=False)
+    return await proxy_client.forward_request(BASE_URL, request, hedge=True)
+
+@router.get("/{order_id}/events")
+async def order_events(request: Request, order_id: int, user_id: int = Query(..., gt=0)):
+    """Server-Sent Events со статусом заказа вместо периодического опроса."""
+    return await proxy_client.forward_request(BASE_URL, request, timeout=None, limit=False)
@@ -1,6 +1,7 @@
-from fastapi import APIRouter, Request
+from fastapi import APIRouter, Header, Request
 from app.core.config import settings
 from app.services.proxy_client import proxy_client
+from app.api.dependencies import validate_body, body_schema
 from app.api.v1.schemas.payments_schemas import (
     AccountCreateRequest,
     DepositRequest,
@@ -10,14 +11,30 @@ from app.api.v1.schemas.payments_schemas import (
 router = APIRouter()
 BASE_URL = settings.PAYMENTS_SERVICE_URL
 
-@router.post("/accounts", response_model=AccountResponse, status_code=201)
-async def create_account(request: Request, _: AccountCreateRequest):
+@router.post(
+    "/accounts",
+    response_model=AccountResponse,
+    status_code=201,
+    dependencies=[validate_body(AccountCreateRequest)],
+    openapi_extra=body_schema(AccountCreateRequest),
+)
+async def create_account(request: Request):
     return await proxy_client.forward_request(BASE_URL, request)
 
-@router.post("/accounts/deposit", response_model=AccountResponse)
-async def deposit_to_account(request: Request, _: DepositRequest):
+@router.post(
+    "/accounts/deposit",
+    response_model=AccountResponse,
+    dependencies=[validate_body(DepositRequest)],
+    openapi_extra=body_schema(DepositRequest),
+)
+async def deposit_to_account(request: Request, idempotency_key: str | None = Header(None)):
+    # Idempotency-Key передается в payments_service как есть
     return await proxy_client.forward_request(BASE_URL, request)
 
-@router.get("/accounts/{user_id}", response_model=AccountResponse)
+@router.get(
+    "/accounts/{user_id}",
+    response_model=AccountResponse,
+    responses={304: {"description": "Ресурс не изменился (If-None-Match)"}},
+)
 async def get_account_balance(request: Request, user_id: int):
-    return await proxy_client.forward_request(BASE_URL, request)
\ No newline at end of file
+    return await proxy_client.forward_request(BASE_URL, request, hedge=True)
\ No newline at end of file
@@ -24,4 +24,11 @@ class OrderResponse(BaseModel):
     user_id: int
     amount: DecimalType
     description: str
-    status: OrderStatus
\ No newline at end of file
+    status: OrderStatus
+
+class UserOrderStatsResponse(BaseModel):
+    user_id: int
+    new_count: int
+    finished_count: int
+    cancelled_count: int
+    total_spent: DecimalType
\ No newline at end of file
@@ -1,3 +1,4 @@
+from typing import Literal
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
@@ -5,8 +6,70 @@ class Settings(BaseSettings):
         env_file=".env",
         env_file_encoding='utf-8'
     )
-    
+
+    # http — сервисы в отдельных контейнерах; inprocess — orders и payments
+    # импортируются в процесс шлюза и вызываются через ASGI без сети
+    DEPLOYMENT_MODE: Literal["http", "inprocess"] = "http"
+    ORDERS_SERVICE_PATH: str = "../orders_service"
+    PAYMENTS_SERVICE_PATH: str = "../payments_service"
+
     ORDERS_SERVICE_URL: str = "http://orders_service:8000"
     PAYMENTS_SERVICE_URL: str = "http://payments_service:8000"
+    # Дополнительные реплики, на которые уходят хеджирующие запросы (JSON-список)
+    ORDERS_SERVICE_REPLICAS: list[str] = []
+    PAYMENTS_SERVICE_REPLICAS: list[str] = []
+
+    # Сервисы получают дедлайн запроса и не работают дольше, чем шлюз ждет ответ
+    UPSTREAM_TIMEOUT: float = 10.0
+    UPSTREAM_CONNECT_TIMEOUT: float = 5.0
+
+    # Тело запроса передается в upstream потоком, кусками не больше BODY_CHUNK_SIZE
+    STREAM_REQUEST_BODIES: bool = True
+    BODY_CHUNK_SIZE: int = 64 * 1024
+    # Проверка тела на шлюзе буферизует его, поэтому по умолчанию проверяются
+    # только тела с Content-Length не больше этого размера; большие и chunked
+    # тела уходят потоком и проверяются сервисом. Маршрут может задать свой
+    # предел в validate_body, 0 — не проверять на шлюзе вовсе
+    VALIDATE_BODY_MAX_SIZE: int = 64 * 1024
+
+    # Адаптивное ограничение параллельных запросов к каждому upstream
+    LIMITER_ENABLED: bool = True
+    LIMITER_INITIAL_LIMIT: int = 20
+    LIMITER_MIN_LIMIT: int = 2
+    LIMITER_MAX_LIMIT: int = 200
+    LIMITER_MAX_QUEUE: int = 50
+    LIMITER_QUEUE_TIMEOUT: float = 0.5
+    LIMITER_RETRY_AFTER: int = 1
+
+    # Хеджирование безопасных запросов и бюджет на повторы
+    HEDGING_ENABLED: bool = True
+    HEDGE_MIN_DELAY: float = 0.01
+    HEDGE_MAX_DELAY: float = 1.0
+    RETRY_BUDGET_RATIO: float = 0.1
+    RETRY_BUDGET_MAX_TOKENS: float = 10.0
+
+    # Сжатие ответов по Accept-Encoding; br и zstd — если установлены библиотеки
+    COMPRESSION_ENABLED: bool = True
+    COMPRESSION_MINIMUM_SIZE: int = 1024
+    COMPRESSION_ENCODINGS: list[str] = ["br", "zstd", "gzip"]
+    GZIP_LEVEL: int = 6
+    BROTLI_QUALITY: int = 4
+    ZSTD_LEVEL: int = 3
+
+    # Трассировка саги: шлюз начинает трассу и передает traceparent сервисам
+    TRACING_ENABLED: bool = False
+    TRACE_SAMPLE_RATIO: float = 1.0
+    TRACES_PATH: str = "/var/log/traces"
+
+    # Монитор event loop: задержка планирования и стеки долгих блокировок
+    LOOP_MONITOR_ENABLED: bool = True
+    LOOP_MONITOR_INTERVAL: float = 0.1
+    LOOP_SLOW_CALLBACK_THRESHOLD: float = 0.25
+
+    # POST /admin/profile: выключен по умолчанию и требует X-Admin-Token
+    PROFILER_ENABLED: bool = False
+    PROFILER_TOKEN: str = ""
+    PROFILER_MAX_SECONDS: float = 60.0
+    PROFILER_SAMPLE_INTERVAL: float = 0.005
 
 settings = Settings()
\ No newline at end of file
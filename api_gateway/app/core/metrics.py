@@ -0,0 +1,204 @@
+"""
+Минимальный реестр метрик в текстовом формате Prometheus.
+
+Метрики обновляются только из потока event loop, поэтому обходятся без
+блокировок: инкремент — одно сложение с полем объекта, observe гистограммы —
+bisect по границам бакетов. Дочерние серии по меткам кешируются, так что
+на горячем пути нет ни форматирования, ни поиска по строкам.
+"""
+import bisect
+import inspect
+import logging
+import math
+from typing import Awaitable, Callable, Iterable
+
+log = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+    def set_total(self, value: float) -> None:
+        """Для счетчиков, которые ведет сам наблюдаемый объект."""
+        self.value = value
+
+class _GaugeChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.value -= amount
+
+class _HistogramChild:
+    __slots__ = ("upper_bounds", "counts", "sum", "count")
+
+    def __init__(self, upper_bounds: tuple[float, ...]):
+        self.upper_bounds = upper_bounds
+        self.counts = [0] * (len(upper_bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.upper_bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: dict[tuple[str, ...], object] = {}
+        if not self.labelnames:
+            self._default = self._children[()] = self._new_child()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: object):
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _samples(self, key: tuple[str, ...], child) -> Iterable[str]:
+        yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.value)}"
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.type}"
+        for key, child in list(self._children.items()):
+            yield from self._samples(key, child)
+
+class Counter(_Metric):
+    type = "counter"
+
+    def _new_child(self) -> _CounterChild:
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._default.value += amount
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def _new_child(self) -> _GaugeChild:
+        return _GaugeChild()
+
+    def set(self, value: float) -> None:
+        self._default.value = value
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._default.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self._default.value -= amount
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        buckets: Iterable[float] = DEFAULT_BUCKETS,
+    ):
+        self.upper_bounds = tuple(sorted(float(b) for b in buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.upper_bounds)
+
+    def observe(self, value: float) -> None:
+        self._default.observe(value)
+
+    def _samples(self, key: tuple[str, ...], child: _HistogramChild) -> Iterable[str]:
+        names = (*self.labelnames, "le")
+        cumulative = 0
+        for bound, count in zip((*self.upper_bounds, math.inf), child.counts):
+            cumulative += count
+            labels = _format_labels(names, (*key, _format_value(bound)))
+            yield f"{self.name}_bucket{labels} {cumulative}"
+        labels = _format_labels(self.labelnames, key)
+        yield f"{self.name}_sum{labels} {_format_value(child.sum)}"
+        yield f"{self.name}_count{labels} {child.count}"
+
+Collector = Callable[[], Awaitable[None] | None]
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: list[_Metric] = []
+        self._collectors: list[Collector] = []
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        buckets: Iterable[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Collector) -> None:
+        """Функция, обновляющая метрики перед каждым сбором (например, запросом в БД)."""
+        self._collectors.append(collector)
+
+    async def collect(self) -> str:
+        for collector in self._collectors:
+            try:
+                result = collector()
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                log.warning(f"Metrics collector {collector!r} failed: {e}")
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
\ No newline at end of file
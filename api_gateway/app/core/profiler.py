@@ -0,0 +1,163 @@
+"""
+Профилирование живого процесса по запросу, без передеплоя.
+
+collapsed — статистический профайлер: раз в interval процессорного времени
+(SIGPROF) снимаются стеки потока loop и остальных потоков. Код сервиса не
+инструментируется, накладные расходы — только сам снимок стека. Стек потока
+loop начинается с имени текущей задачи asyncio. Результат в формате
+collapsed stacks: flamegraph.pl, speedscope, inferno.
+
+pstats — детерминированный cProfile потока loop; точные счетчики вызовов,
+но заметно замедляет обработку, пока включен.
+"""
+import asyncio
+import cProfile
+import marshal
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+
+# Цель профилирования: в профиль попадают только стеки, проходящие через модуль
+TARGETS = {
+    "consumer": "messaging/consumer.py",
+    "publisher": "messaging/publisher.py",
+    "proxy": "services/proxy_client.py",
+}
+
+class ProfilerBusy(Exception):
+    pass
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    path = code.co_filename.replace("\\", "/")
+    if "/app/" in path:
+        path = "app/" + path.rsplit("/app/", 1)[1]
+    else:
+        path = path.rsplit("/", 1)[-1]
+    return f"{code.co_name} ({path}:{code.co_firstlineno})"
+
+def _record(stacks: Counter, frame, root: str, focus: str | None) -> None:
+    files = []
+    labels = []
+    while frame is not None:
+        files.append(frame.f_code.co_filename)
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    if focus and not any(path.replace("\\", "/").endswith(focus) for path in files):
+        return
+    stacks[";".join((root, *reversed(labels)))] += 1
+
+def _loop_root(loop: asyncio.AbstractEventLoop) -> str:
+    task = asyncio.current_task(loop)
+    return f"loop;task {task.get_name()}" if task else "loop;callbacks"
+
+class SamplingProfiler:
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self._busy = False
+
+    def _sample_other_threads(self, stacks: Counter, skip: set[int], focus: str | None) -> None:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id not in skip:
+                _record(stacks, frame, f"thread {names.get(thread_id, thread_id)}", focus)
+
+    def _sample_threads_until(self, stop: threading.Event, skip: set[int], focus: str | None) -> Counter:
+        stacks: Counter = Counter()
+        skip = skip | {threading.get_ident()}
+        while not stop.wait(self.interval):
+            self._sample_other_threads(stacks, skip, focus)
+        return stacks
+
+    async def _sample_with_timer(self, seconds: float, focus: str | None) -> Counter:
+        """
+        SIGPROF по процессорному времени: обработчик выполняется в главном
+        потоке (в нем и работает loop uvicorn) ровно в точке, где тот тратит
+        CPU, а простой в select не попадает в профиль.
+
+        Обработчик только записывает прерванный стек: threading.enumerate()
+        берет нереентерабельную блокировку, и сигнал посреди Thread.start()
+        (например, когда asyncio.to_thread расширяет пул) повесил бы поток
+        loop. Остальные потоки снимает отдельный поток по обычному таймеру.
+        """
+        stacks: Counter = Counter()
+        loop = asyncio.get_running_loop()
+        loop_thread_id = threading.get_ident()
+        stop = threading.Event()
+        threads = asyncio.ensure_future(
+            asyncio.to_thread(self._sample_threads_until, stop, {loop_thread_id}, focus)
+        )
+
+        def on_tick(signum, frame) -> None:
+            _record(stacks, frame, _loop_root(loop), focus)
+
+        previous = signal.signal(signal.SIGPROF, on_tick)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            signal.setitimer(signal.ITIMER_PROF, 0)
+            signal.signal(signal.SIGPROF, previous)
+            stop.set()
+        stacks.update(await threads)
+        return stacks
+
+    def _sample_with_thread(
+        self,
+        seconds: float,
+        loop: asyncio.AbstractEventLoop,
+        loop_thread_id: int,
+        focus: str | None,
+    ) -> Counter:
+        """
+        Запасной вариант вне главного потока: сэмплер в отдельном потоке.
+        Он получает GIL в основном, когда loop его отпускает (в select),
+        поэтому короткие вычисления между ожиданиями недооценивает.
+        """
+        stacks: Counter = Counter()
+        skip = {threading.get_ident(), loop_thread_id}
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            time.sleep(self.interval)
+            frame = sys._current_frames().get(loop_thread_id)
+            if frame is not None:
+                _record(stacks, frame, _loop_root(loop), focus)
+            self._sample_other_threads(stacks, skip, focus)
+        return stacks
+
+    async def collapsed(self, seconds: float, target: str | None = None) -> str:
+        """Профиль всех потоков за seconds секунд в формате collapsed stacks."""
+        if self._busy:
+            raise ProfilerBusy()
+        self._busy = True
+        focus = TARGETS[target] if target else None
+        try:
+            if hasattr(signal, "setitimer") and threading.current_thread() is threading.main_thread():
+                stacks = await self._sample_with_timer(seconds, focus)
+            else:
+                stacks = await asyncio.to_thread(
+                    self._sample_with_thread,
+                    seconds, asyncio.get_running_loop(), threading.get_ident(), focus,
+                )
+        finally:
+            self._busy = False
+        return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+    async def pstats(self, seconds: float) -> bytes:
+        """Дамп cProfile потока loop; открывается pstats.Stats или snakeviz."""
+        if self._busy:
+            raise ProfilerBusy()
+        self._busy = True
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                profile.disable()
+        finally:
+            self._busy = False
+        profile.create_stats()
+        return marshal.dumps(profile.stats)
\ No newline at end of file
@@ -0,0 +1,186 @@
+"""
+Трассировка саги: контекст W3C traceparent и спаны в формате OTLP/JSON.
+
+Шлюз начинает трассу (или продолжает пришедшую от клиента) и передает
+контекст сервисам в заголовке traceparent. Спаны пишутся пачками в локальный файл
+(по строке ExportTraceServiceRequest на сброс), который читает коллектор
+OpenTelemetry (receiver otlpjsonfile) или tools/saga_trace_report.py.
+"""
+import asyncio
+import json
+import logging
+import os
+import secrets
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator
+
+from app.core.config import settings
+
+log = logging.getLogger(__name__)
+
+TRACEPARENT_HEADER = "traceparent"
+
+# Значения SpanKind из OTLP
+KIND_INTERNAL, KIND_SERVER, KIND_CLIENT, KIND_PRODUCER, KIND_CONSUMER = 1, 2, 3, 4, 5
+
+@dataclass(frozen=True, slots=True)
+class SpanContext:
+    trace_id: str
+    span_id: str
+    sampled: bool = True
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def child(self) -> "SpanContext":
+        return SpanContext(self.trace_id, secrets.token_hex(8), self.sampled)
+
+current_span: ContextVar[SpanContext | None] = ContextVar("current_span", default=None)
+
+def new_trace(sampled: bool = True) -> SpanContext:
+    return SpanContext(secrets.token_hex(16), secrets.token_hex(8), sampled)
+
+def parse_traceparent(value: str | None) -> SpanContext | None:
+    if not value:
+        return None
+    parts = value.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        int(parts[1], 16)
+        int(parts[2], 16)
+        flags = int(parts[3], 16)
+    except ValueError:
+        return None
+    return SpanContext(parts[1], parts[2], bool(flags & 1))
+
+def _attribute(key: str, value: object) -> dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+class SpanExporter:
+    """
+    Копит завершенные спаны в памяти и раз в interval дописывает их в файл
+    из пула потоков, чтобы запись не блокировала event loop.
+    """
+
+    def __init__(self, service_name: str, path: str, enabled: bool, interval: float = 1.0):
+        self.service_name = service_name
+        self.enabled = enabled
+        self.interval = interval
+        self.file = Path(path) / f"{service_name}-{os.getpid()}.otlp.jsonl"
+        self._buffer: list[dict] = []
+        self._stop_event = asyncio.Event()
+
+    def export(self, span: dict) -> None:
+        if self.enabled:
+            self._buffer.append(span)
+
+    def _write(self, spans: list[dict]) -> None:
+        request = {
+            "resourceSpans": [{
+                "resource": {"attributes": [_attribute("service.name", self.service_name)]},
+                "scopeSpans": [{"scope": {"name": "saga"}, "spans": spans}],
+            }]
+        }
+        self.file.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.file, "a") as f:
+            f.write(json.dumps(request, separators=(",", ":")) + "\n")
+
+    async def flush(self) -> None:
+        if not self._buffer:
+            return
+        spans, self._buffer = self._buffer, []
+        try:
+            await asyncio.to_thread(self._write, spans)
+        except OSError as e:
+            log.warning(f"Failed to export {len(spans)} spans: {e}")
+
+    async def run(self) -> None:
+        if not self.enabled:
+            return
+        while not self._stop_event.is_set():
+            try:
+                await asyncio.wait_for(self._stop_event.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+    async def stop(self) -> None:
+        self._stop_event.set()
+        await self.flush()
+
+exporter = SpanExporter("api_gateway", settings.TRACES_PATH, settings.TRACING_ENABLED)
+
+def record_span(
+    name: str,
+    parent: SpanContext | None,
+    start_ns: int,
+    end_ns: int,
+    *,
+    kind: int = KIND_INTERNAL,
+    attributes: dict | None = None,
+    context: SpanContext | None = None,
+    error: bool = False,
+) -> SpanContext:
+    """
+    Записывает спан с известными границами, например ожидание в очереди.
+    Корневой спан (parent=None) требует явного context.
+    """
+    context = context or parent.child()
+    if context.sampled:
+        span = {
+            "traceId": context.trace_id,
+            "spanId": context.span_id,
+            "parentSpanId": parent.span_id if parent else "",
+            "name": name,
+            "kind": kind,
+            "startTimeUnixNano": str(start_ns),
+            "endTimeUnixNano": str(max(start_ns, end_ns)),
+            "attributes": [_attribute(k, v) for k, v in (attributes or {}).items()],
+        }
+        if error:
+            span["status"] = {"code": 2}
+        exporter.export(span)
+    return context
+
+@contextmanager
+def start_span(
+    name: str,
+    parent: SpanContext | None = None,
+    *,
+    kind: int = KIND_INTERNAL,
+    attributes: dict | None = None,
+    context: SpanContext | None = None,
+) -> Iterator[SpanContext | None]:
+    """
+    Спан вокруг блока кода, текущий на время блока. Без родителя (явного
+    или текущего) и без context трассы нет, и блок выполняется без спана;
+    context без родителя делает спан корнем трассы.
+    """
+    parent = parent or current_span.get()
+    if parent is None and context is None:
+        yield None
+        return
+    context = context or parent.child()
+    token = current_span.set(context)
+    started = time.time_ns()
+    error = False
+    try:
+        yield context
+    except BaseException:
+        error = True
+        raise
+    finally:
+        current_span.reset(token)
+        record_span(
+            name, parent, started, time.time_ns(),
+            kind=kind, attributes=attributes, context=context, error=error,
+        )
\ No newline at end of file
@@ -1,8 +1,18 @@
+import asyncio
 import logging
-from contextlib import asynccontextmanager
-from fastapi import FastAPI
+from contextlib import AsyncExitStack, asynccontextmanager
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse
 
+from app.api.admin import router as admin_router
+from app.api.middleware import CompressionMiddleware, TracingMiddleware
 from app.api.v1.router import api_router
+from app.core.config import settings
+from app.core.loop_monitor import loop_monitor
+from app.core.metrics import CONTENT_TYPE, registry
+from app.core.tracing import exporter
+from app.services.composition import in_process_services
+from app.services.concurrency_limiter import UpstreamOverloaded
 from app.services.proxy_client import proxy_client
 
 log = logging.getLogger(__name__)
@@ -10,10 +20,21 @@ log = logging.getLogger(__name__)
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     log.info("API Gateway starting up...")
-    await proxy_client.start()
-    yield
-    log.info("API Gateway shutting down...")
-    await proxy_client.stop()
+    async with AsyncExitStack() as stack:
+        service_apps = None
+        if settings.DEPLOYMENT_MODE == "inprocess":
+            in_process_services.load()
+            await stack.enter_async_context(in_process_services.running())
+            service_apps = in_process_services.apps
+        await proxy_client.start(apps=service_apps)
+        exporter_task = asyncio.create_task(exporter.run())
+        monitor_task = asyncio.create_task(loop_monitor.run())
+        yield
+        log.info("API Gateway shutting down...")
+        await proxy_client.stop()
+        await exporter.stop()
+        await loop_monitor.stop()
+        await asyncio.gather(exporter_task, monitor_task, return_exceptions=True)
 
 app = FastAPI(
     title="API Gateway",
@@ -22,8 +43,48 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+if settings.COMPRESSION_ENABLED:
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=settings.COMPRESSION_MINIMUM_SIZE,
+        levels={
+            "gzip": settings.GZIP_LEVEL,
+            "br": settings.BROTLI_QUALITY,
+            "zstd": settings.ZSTD_LEVEL,
+        },
+        preferred=settings.COMPRESSION_ENCODINGS,
+    )
+if settings.TRACING_ENABLED:
+    app.add_middleware(TracingMiddleware, sample_ratio=settings.TRACE_SAMPLE_RATIO)
 app.include_router(api_router)
+if settings.PROFILER_ENABLED:
+    app.include_router(admin_router)
+
+@app.exception_handler(UpstreamOverloaded)
+async def upstream_overloaded_handler(request: Request, exc: UpstreamOverloaded):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Service temporarily overloaded, retry later"},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
 
 @app.get("/health")
 def health_check():
-    return {"status": "ok"}
\ No newline at end of file
+    return {"status": "ok"}
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return Response(await registry.collect(), media_type=CONTENT_TYPE)
+
+@app.get("/limits")
+def concurrency_limits():
+    """
+    Текущие адаптивные лимиты и счетчики отказов по каждому upstream.
+    Те же данные есть в /metrics (gateway_limiter_*).
+    """
+    return [limiter.snapshot() for limiter in proxy_client.limiters.values()]
+
+@app.get("/loop")
+def event_loop_state():
+    """Квантили задержки event loop и стеки последних долгих блокировок."""
+    return loop_monitor.snapshot()
\ No newline at end of file
@@ -0,0 +1,114 @@
+"""
+Транспорт httpx для сервисов, смонтированных в процесс шлюза.
+
+httpx.ASGITransport собирает все куски тела ответа и возвращает ответ только
+после завершения приложения: SSE и long-poll без сети ничего не отдают до
+закрытия потока, а лимитер и хеджирование видят время всего тела вместо
+времени до заголовков. Здесь приложение выполняется в отдельной задаче, а
+сообщения ASGI передаются читателю через очередь: ответ возвращается по
+http.response.start, тело читается по мере отправки кусков.
+"""
+import asyncio
+import contextlib
+
+import httpx
+from starlette.types import ASGIApp, Message
+
+_DONE = object()
+
+class _ASGIResponseStream(httpx.AsyncByteStream):
+    def __init__(self, messages: asyncio.Queue, app_task: asyncio.Task, disconnected: asyncio.Event):
+        self._messages = messages
+        self._app_task = app_task
+        self._disconnected = disconnected
+        self._complete = False
+
+    async def __aiter__(self):
+        while not self._complete:
+            message = await _next_message(self._messages, self._app_task)
+            if message["type"] != "http.response.body":
+                continue
+            self._complete = not message.get("more_body", False)
+            if message.get("body"):
+                yield message["body"]
+
+    async def aclose(self) -> None:
+        self._disconnected.set()
+        if self._complete or self._app_task.done():
+            # После последнего куска приложение еще может выполнять фоновые
+            # задачи ответа — их не прерываем
+            return
+        # Клиент ушел посреди потока (например, закрыл SSE)
+        self._app_task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self._app_task
+
+async def _next_message(messages: asyncio.Queue, app_task: asyncio.Task) -> Message:
+    message = await messages.get()
+    messages.task_done()
+    if message is _DONE:
+        if not app_task.cancelled() and app_task.exception() is not None:
+            raise app_task.exception()
+        raise httpx.RemoteProtocolError("ASGI application finished without completing the response")
+    return message
+
+class StreamingASGITransport(httpx.AsyncBaseTransport):
+    def __init__(self, app: ASGIApp, client: tuple[str, int] = ("127.0.0.1", 123)):
+        self.app = app
+        self.client = client
+        # Ссылки на задачи приложений, пока те дорабатывают после ответа
+        self._tasks: set[asyncio.Task] = set()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": request.method,
+            "headers": [(key.lower(), value) for key, value in request.headers.raw],
+            "scheme": request.url.scheme,
+            "path": request.url.path,
+            "raw_path": request.url.raw_path.split(b"?")[0],
+            "query_string": request.url.query,
+            "server": (request.url.host, request.url.port),
+            "client": self.client,
+            "root_path": "",
+        }
+        request_body = request.stream.__aiter__()
+        body_sent = False
+        disconnected = asyncio.Event()
+        messages: asyncio.Queue = asyncio.Queue()
+
+        async def receive() -> Message:
+            nonlocal body_sent
+            if body_sent:
+                await disconnected.wait()
+                return {"type": "http.disconnect"}
+            try:
+                chunk = await request_body.__anext__()
+            except StopAsyncIteration:
+                body_sent = True
+                return {"type": "http.request", "body": b"", "more_body": False}
+            return {"type": "http.request", "body": chunk, "more_body": True}
+
+        async def send(message: Message) -> None:
+            await messages.put(message)
+            # Приложение ждет, пока читатель заберет сообщение: тело не
+            # накапливается в очереди быстрее, чем его отдают клиенту
+            await messages.join()
+
+        app_task = asyncio.create_task(self.app(scope, receive, send))
+        self._tasks.add(app_task)
+        app_task.add_done_callback(self._tasks.discard)
+        app_task.add_done_callback(lambda _: messages.put_nowait(_DONE))
+
+        try:
+            start = await _next_message(messages, app_task)
+        except BaseException:
+            app_task.cancel()
+            raise
+        return httpx.Response(
+            start["status"],
+            headers=start.get("headers", []),
+            stream=_ASGIResponseStream(messages, app_task, disconnected),
+        )
\ No newline at end of file
@@ -0,0 +1,89 @@
+import importlib
+import logging
+import os
+import sys
+from contextlib import AsyncExitStack, asynccontextmanager, contextmanager
+from pathlib import Path
+from types import ModuleType
+from typing import AsyncIterator, Iterator
+
+from fastapi import FastAPI
+
+from app.core.config import settings
+
+log = logging.getLogger(__name__)
+
+def _is_app_module(name: str) -> bool:
+    return name == "app" or name.startswith("app.")
+
+@contextmanager
+def _service_env(prefix: str) -> Iterator[None]:
+    """
+    На время импорта сервиса переменные вида <prefix>DB__USER видны ему
+    как DB__USER: у orders и payments одинаковые имена настроек.
+    """
+    overrides = {
+        key[len(prefix):]: value for key, value in os.environ.items()
+        if key.startswith(prefix)
+    }
+    previous = {key: os.environ.get(key) for key in overrides}
+    os.environ.update(overrides)
+    try:
+        yield
+    finally:
+        for key, value in previous.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+def load_service_module(root: str, env_prefix: str, module: str = "app.main") -> ModuleType:
+    """
+    Импортирует модуль сервиса из каталога root. Все сервисы называют свой
+    пакет app, поэтому модули шлюза на время импорта убираются из
+    sys.modules, а после — возвращаются на место. Загруженные модули
+    сервиса продолжают ссылаться друг на друга через свои глобальные имена.
+    """
+    root = str(Path(root).resolve())
+    saved = {name: mod for name, mod in sys.modules.items() if _is_app_module(name)}
+    for name in saved:
+        del sys.modules[name]
+    sys.path.insert(0, root)
+    try:
+        with _service_env(env_prefix):
+            return importlib.import_module(module)
+    finally:
+        sys.path.remove(root)
+        for name in [name for name in sys.modules if _is_app_module(name)]:
+            del sys.modules[name]
+        sys.modules.update(saved)
+
+class InProcessServices:
+    """Сервисы orders и payments, смонтированные в процесс шлюза."""
+
+    def __init__(self):
+        self.apps: dict[str, FastAPI] = {}
+
+    def load(self) -> None:
+        orders = load_service_module(settings.ORDERS_SERVICE_PATH, "ORDERS__")
+        payments = load_service_module(settings.PAYMENTS_SERVICE_PATH, "PAYMENTS__")
+        self.apps = {
+            settings.ORDERS_SERVICE_URL: orders.app,
+            settings.PAYMENTS_SERVICE_URL: payments.app,
+        }
+        # С MESSAGE_BUS=memory у каждого сервиса своя шина в памяти: сага
+        # работает, только если обе смотрят в один брокер
+        if hasattr(orders.message_bus, "share_broker") and hasattr(payments.message_bus, "share_broker"):
+            payments.message_bus.share_broker(orders.message_bus)
+            log.info("Orders and payments share the in-memory message broker.")
+        log.info("Loaded orders and payments services in-process.")
+
+    @asynccontextmanager
+    async def running(self) -> AsyncIterator[None]:
+        """Запускает lifespan каждого сервиса: БД, publisher и consumer."""
+        async with AsyncExitStack() as stack:
+            for service_app in self.apps.values():
+                await stack.enter_async_context(service_app.router.lifespan_context(service_app))
+            yield
+
+in_process_services = InProcessServices()
\ No newline at end of file
@@ -0,0 +1,131 @@
+import asyncio
+import math
+from collections import deque
+
+class UpstreamOverloaded(Exception):
+    def __init__(self, upstream: str, retry_after: int):
+        super().__init__(f"Upstream {upstream} is overloaded")
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Адаптивный лимит параллельных запросов к одному upstream (gradient-алгоритм).
+
+    Лимит растет, пока задержка близка к долгосрочному среднему, и
+    уменьшается, когда текущая задержка заметно выше него. Запросы сверх
+    лимита ждут в короткой очереди; если место не освободилось до дедлайна
+    или очередь заполнена, запрос сразу отклоняется.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        initial_limit: int,
+        min_limit: int,
+        max_limit: int,
+        max_queue: int,
+        queue_timeout: float,
+        retry_after: int,
+        tolerance: float = 1.5,
+        smoothing: float = 0.2,
+        long_window: int = 600,
+        backoff_ratio: float = 0.9,
+    ):
+        self.name = name
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.tolerance = tolerance
+        self.smoothing = smoothing
+        self.long_window = long_window
+        self.backoff_ratio = backoff_ratio
+
+        self.inflight = 0
+        self.rejected = 0
+        self.expired = 0
+        self._long_rtt = 0.0
+        self._waiters: deque[asyncio.Future] = deque()
+
+    async def acquire(self) -> None:
+        if self.inflight < int(self.limit) and not self._waiters:
+            self.inflight += 1
+            return
+
+        if len(self._waiters) >= self.max_queue:
+            self.rejected += 1
+            raise UpstreamOverloaded(self.name, self.retry_after)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            async with asyncio.timeout(self.queue_timeout):
+                await waiter
+        except TimeoutError:
+            self._abandon(waiter)
+            self.expired += 1
+            raise UpstreamOverloaded(self.name, self.retry_after)
+        except asyncio.CancelledError:
+            self._abandon(waiter)
+            raise
+
+    def release(self, rtt: float | None = None, *, dropped: bool = False) -> None:
+        self.inflight -= 1
+        if dropped:
+            self.limit = max(self.min_limit, self.limit * self.backoff_ratio)
+        elif rtt is not None:
+            self._on_sample(rtt)
+        self._wake_waiters()
+
+    def snapshot(self) -> dict:
+        return {
+            "upstream": self.name,
+            "limit": int(self.limit),
+            "inflight": self.inflight,
+            "queued": len(self._waiters),
+            "rejected": self.rejected,
+            "expired": self.expired,
+        }
+
+    def _abandon(self, waiter: asyncio.Future) -> None:
+        # Слот мог быть выдан ровно в момент таймаута/отмены — возвращаем его
+        if waiter.done() and not waiter.cancelled():
+            self.release()
+        else:
+            waiter.cancel()
+            try:
+                self._waiters.remove(waiter)
+            except ValueError:
+                pass
+
+    def _wake_waiters(self) -> None:
+        while self._waiters and self.inflight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if waiter.done():
+                continue
+            self.inflight += 1
+            waiter.set_result(None)
+
+    def _on_sample(self, rtt: float) -> None:
+        if rtt <= 0:
+            return
+        if self._long_rtt == 0.0:
+            self._long_rtt = rtt
+        else:
+            self._long_rtt += (rtt - self._long_rtt) / self.long_window
+        # Если задержка надолго упала, быстрее подтягиваем среднее вниз
+        if self._long_rtt / rtt > 2:
+            self._long_rtt *= 0.95
+
+        # Не наращиваем лимит, пока он и так не используется
+        if self.inflight < self.limit / 2:
+            return
+
+        gradient = max(0.5, min(1.0, self.tolerance * self._long_rtt / rtt))
+        new_limit = self.limit * gradient + math.sqrt(self.limit)
+        new_limit = self.limit * (1 - self.smoothing) + new_limit * self.smoothing
+        self.limit = max(self.min_limit, min(self.max_limit, new_limit))
\ No newline at end of file
@@ -0,0 +1,53 @@
+from collections import deque
+
+class LatencyTracker:
+    """
+    Скользящее окно задержек одного маршрута. p95 пересчитывается раз в
+    recompute_every замеров, чтобы не сортировать окно на каждый запрос.
+    """
+
+    def __init__(self, window: int = 512, recompute_every: int = 32, min_samples: int = 20):
+        self._samples: deque[float] = deque(maxlen=window)
+        self._recompute_every = recompute_every
+        self._min_samples = min_samples
+        self._since_recompute = 0
+        self.p95: float | None = None
+
+    def observe(self, seconds: float) -> None:
+        self._samples.append(seconds)
+        self._since_recompute += 1
+        if self._since_recompute >= self._recompute_every and len(self._samples) >= self._min_samples:
+            ordered = sorted(self._samples)
+            self.p95 = ordered[int(len(ordered) * 0.95) - 1]
+            self._since_recompute = 0
+
+    def hedge_delay(self, min_delay: float, max_delay: float) -> float:
+        if self.p95 is None:
+            return max_delay
+        return max(min_delay, min(max_delay, self.p95))
+
+class RetryBudget:
+    """
+    Token bucket для повторов и хеджей: каждый обычный запрос добавляет
+    ratio токена, каждая дополнительная попытка тратит целый токен.
+    Так доля дополнительных попыток не превышает ratio от трафика, и
+    во время аварии они не умножают нагрузку на upstream.
+    """
+
+    def __init__(self, ratio: float, max_tokens: float):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+        self.spent = 0
+        self.denied = 0
+
+    def deposit(self) -> None:
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            self.spent += 1
+            return True
+        self.denied += 1
+        return False
\ No newline at end of file
@@ -1,46 +1,286 @@
+import asyncio
+import itertools
+import time
+from typing import AsyncIterator, Callable
+
 import httpx
 from fastapi import Request
 from starlette.responses import StreamingResponse
 from starlette.background import BackgroundTask
+from starlette.types import ASGIApp
+
+from app.core.config import settings
+from app.core.metrics import registry
+from app.core.tracing import TRACEPARENT_HEADER, current_span
+from app.services.asgi_transport import StreamingASGITransport
+from app.services.concurrency_limiter import AdaptiveConcurrencyLimiter, UpstreamOverloaded
+from app.services.hedging import LatencyTracker, RetryBudget
+
+DEADLINE_HEADER = "x-request-deadline"
+SAFE_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+RETRYABLE_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError)
+
+UPSTREAM_LATENCY = registry.histogram(
+    "gateway_upstream_request_duration_seconds",
+    "Время до заголовков ответа upstream (с хеджированием — до первого ответа)",
+    ["upstream", "route", "status"],
+)
+UPSTREAM_HEDGES = registry.counter(
+    "gateway_upstream_hedges_total",
+    "Дополнительные попытки хеджирования по исходу бюджета (sent/denied)",
+    ["upstream", "outcome"],
+)
+LIMITER_LIMIT = registry.gauge("gateway_limiter_limit", "Текущий адаптивный лимит конкурентности", ["upstream"])
+LIMITER_INFLIGHT = registry.gauge("gateway_limiter_inflight", "Запросы в полете под лимитом", ["upstream"])
+LIMITER_QUEUED = registry.gauge("gateway_limiter_queued", "Запросы в очереди лимитера", ["upstream"])
+LIMITER_REJECTED = registry.counter(
+    "gateway_limiter_rejected_total", "Отказы лимитера: очередь полна (rejected) или истекло ожидание (expired)",
+    ["upstream", "reason"],
+)
 
 class ProxyClient:
     def __init__(self):
         self.client: httpx.AsyncClient | None = None
+        # Клиенты поверх StreamingASGITransport для сервисов, смонтированных в процесс
+        self.clients: dict[str, httpx.AsyncClient] = {}
+        self.limiters: dict[str, AdaptiveConcurrencyLimiter] = {}
+        self.latencies: dict[tuple[str, str], LatencyTracker] = {}
+        self.budgets: dict[str, RetryBudget] = {}
+        self.replicas: dict[str, list[str]] = {
+            settings.ORDERS_SERVICE_URL: [settings.ORDERS_SERVICE_URL, *settings.ORDERS_SERVICE_REPLICAS],
+            settings.PAYMENTS_SERVICE_URL: [settings.PAYMENTS_SERVICE_URL, *settings.PAYMENTS_SERVICE_REPLICAS],
+        }
+        self._replica_cycles: dict[str, itertools.cycle] = {}
+        self._discarded: set[asyncio.Task] = set()
 
-    async def start(self):
-        timeout = httpx.Timeout(10.0, connect=5.0)
+    async def start(self, apps: dict[str, ASGIApp] | None = None):
+        timeout = httpx.Timeout(
+            settings.UPSTREAM_TIMEOUT, connect=settings.UPSTREAM_CONNECT_TIMEOUT
+        )
         self.client = httpx.AsyncClient(timeout=timeout)
+        for base_url, service_app in (apps or {}).items():
+            self.clients[base_url] = httpx.AsyncClient(
+                transport=StreamingASGITransport(service_app), timeout=timeout
+            )
 
     async def stop(self):
+        for client in self.clients.values():
+            await client.aclose()
+        self.clients.clear()
         if self.client:
             await self.client.aclose()
 
+    def _get_limiter(self, base_url: str) -> AdaptiveConcurrencyLimiter:
+        limiter = self.limiters.get(base_url)
+        if limiter is None:
+            limiter = AdaptiveConcurrencyLimiter(
+                base_url,
+                initial_limit=settings.LIMITER_INITIAL_LIMIT,
+                min_limit=settings.LIMITER_MIN_LIMIT,
+                max_limit=settings.LIMITER_MAX_LIMIT,
+                max_queue=settings.LIMITER_MAX_QUEUE,
+                queue_timeout=settings.LIMITER_QUEUE_TIMEOUT,
+                retry_after=settings.LIMITER_RETRY_AFTER,
+            )
+            self.limiters[base_url] = limiter
+        return limiter
+
+    def _get_budget(self, base_url: str) -> RetryBudget:
+        budget = self.budgets.get(base_url)
+        if budget is None:
+            budget = RetryBudget(settings.RETRY_BUDGET_RATIO, settings.RETRY_BUDGET_MAX_TOKENS)
+            self.budgets[base_url] = budget
+        return budget
+
+    def _get_latency(self, base_url: str, route: str) -> LatencyTracker:
+        key = (base_url, route)
+        tracker = self.latencies.get(key)
+        if tracker is None:
+            tracker = LatencyTracker()
+            self.latencies[key] = tracker
+        return tracker
+
+    def _next_replica(self, base_url: str) -> str:
+        """Реплика для дополнительной попытки: по кругу, начиная со второй."""
+        replicas = self.replicas.get(base_url, [base_url])
+        if len(replicas) == 1:
+            return base_url
+        cycle = self._replica_cycles.get(base_url)
+        if cycle is None:
+            cycle = itertools.cycle(replicas[1:] + replicas[:1])
+            self._replica_cycles[base_url] = cycle
+        return next(cycle)
+
+    @staticmethod
+    async def _iter_body(request: Request) -> AsyncIterator[bytes]:
+        """
+        Отдает тело запроса кусками не больше BODY_CHUNK_SIZE по мере
+        поступления из ASGI, не собирая его целиком в памяти.
+        """
+        chunk_size = settings.BODY_CHUNK_SIZE
+        async for chunk in request.stream():
+            for start in range(0, len(chunk), chunk_size):
+                yield chunk[start:start + chunk_size]
+
+    async def _send(
+        self, base_url: str, rp_req: httpx.Request, *, limit: bool = True
+    ) -> httpx.Response:
+        """
+        Отправляет запрос под адаптивным лимитом upstream. Слот занят до
+        получения заголовков ответа, по этому же времени считается задержка.
+        """
+        client = self.clients.get(base_url, self.client)
+        if not (limit and settings.LIMITER_ENABLED):
+            return await client.send(rp_req, stream=True)
+
+        limiter = self._get_limiter(base_url)
+        await limiter.acquire()
+        started = time.perf_counter()
+        try:
+            rp_resp = await client.send(rp_req, stream=True)
+        except (httpx.TimeoutException, httpx.NetworkError):
+            limiter.release(dropped=True)
+            raise
+        except BaseException:
+            limiter.release()
+            raise
+        limiter.release(time.perf_counter() - started)
+        return rp_resp
+
+    def _discard(self, task: asyncio.Task) -> None:
+        """Закрывает ответ проигравшей попытки, если он все-таки пришел."""
+        if task.cancelled() or task.exception() is not None:
+            return
+        closing = asyncio.create_task(task.result().aclose())
+        self._discarded.add(closing)
+        closing.add_done_callback(self._discarded.discard)
+
+    async def _send_hedged(
+        self,
+        base_url: str,
+        route: str,
+        build: Callable[[str], httpx.Request],
+    ) -> httpx.Response:
+        """
+        Безопасный запрос с хеджированием: если первая попытка не вернула
+        заголовки за p95 маршрута, вторая уходит на другую реплику, и
+        используется тот ответ, что пришел первым. Ошибка соединения
+        вызывает немедленный повтор. Обе дополнительные попытки оплачиваются
+        из бюджета upstream.
+        """
+        budget = self._get_budget(base_url)
+        tracker = self._get_latency(base_url, route)
+        budget.deposit()
+
+        started = time.perf_counter()
+        pending = {asyncio.create_task(self._send(base_url, build(base_url)))}
+        extra_sent = False
+        last_exc: BaseException | None = None
+        try:
+            while pending:
+                timeout = None if extra_sent else tracker.hedge_delay(
+                    settings.HEDGE_MIN_DELAY, settings.HEDGE_MAX_DELAY
+                )
+                done, pending = await asyncio.wait(
+                    pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                winner: httpx.Response | None = None
+                for task in done:
+                    if task.exception() is not None:
+                        last_exc = task.exception()
+                    elif winner is None:
+                        winner = task.result()
+                    else:
+                        self._discard(task)
+                if winner is not None:
+                    tracker.observe(time.perf_counter() - started)
+                    return winner
+
+                if extra_sent:
+                    continue
+                slow = not done
+                retryable = not pending and isinstance(last_exc, RETRYABLE_ERRORS)
+                if not (slow or retryable):
+                    continue
+                if not budget.try_spend():
+                    UPSTREAM_HEDGES.labels(base_url, "denied").inc()
+                    continue
+                UPSTREAM_HEDGES.labels(base_url, "sent").inc()
+                extra_sent = True
+                pending.add(asyncio.create_task(
+                    self._send(base_url, build(self._next_replica(base_url)))
+                ))
+            raise last_exc
+        finally:
+            for task in pending:
+                task.cancel()
+                task.add_done_callback(self._discard)
+
     async def forward_request(
         self,
         base_url: str,
         request: Request,
+        *,
+        hedge: bool = False,
+        timeout: float | None = settings.UPSTREAM_TIMEOUT,
+        limit: bool = True,
     ) -> StreamingResponse:
+        """
+        Проксирует запрос в upstream. timeout — сколько шлюз готов ждать
+        ответ (он же уходит в сервис как дедлайн), None — без ограничения,
+        для потоков SSE. Долгие ожидания (long-poll, SSE) стоит выводить из-под
+        адаптивного лимита через limit=False: они не отражают задержку сервиса.
+        """
         if not self.client:
             raise RuntimeError("ProxyClient not started")
-        
-        target_url = httpx.URL(
-            url=f"{base_url}{request.url.path}",
-            query=request.url.query.encode("utf-8")
-        )
-        
+
         headers = {
             key: value for key, value in request.headers.items()
             if key.lower() not in ("host", "user-agent", "accept-encoding")
         }
-        
-        rp_req = self.client.build_request(
-            method=request.method,
-            url=target_url,
-            headers=headers,
-            content=await request.body(),
-        )
-        
-        rp_resp = await self.client.send(rp_req, stream=True)
+        if timeout is not None:
+            # Абсолютный дедлайн в мс от эпохи: после него ответ шлюзу уже не нужен
+            headers[DEADLINE_HEADER] = str(int((time.time() + timeout) * 1000))
+        span = current_span.get()
+        if span is not None:
+            # Спан сервиса станет потомком спана шлюза, а не клиента
+            headers[TRACEPARENT_HEADER] = span.traceparent()
+        request_timeout = httpx.Timeout(timeout, connect=settings.UPSTREAM_CONNECT_TIMEOUT)
+
+        has_body = "content-length" in request.headers or "transfer-encoding" in request.headers
+        if not has_body:
+            content = None
+        elif settings.STREAM_REQUEST_BODIES:
+            content = self._iter_body(request)
+        else:
+            content = await request.body()
+
+        def build(url: str) -> httpx.Request:
+            target_url = httpx.URL(
+                url=f"{url}{request.url.path}",
+                query=request.url.query.encode("utf-8")
+            )
+            return self.client.build_request(
+                method=request.method,
+                url=target_url,
+                headers=headers,
+                content=content,
+                timeout=request_timeout,
+            )
+
+        # Шаблон маршрута, а не путь: метки не должны плодиться по order_id
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        started = time.perf_counter()
+        try:
+            if hedge and settings.HEDGING_ENABLED and not has_body and request.method in SAFE_METHODS:
+                rp_resp = await self._send_hedged(base_url, route, build)
+            else:
+                rp_resp = await self._send(base_url, build(base_url), limit=limit)
+        except Exception as e:
+            status = "overloaded" if isinstance(e, UpstreamOverloaded) else "error"
+            UPSTREAM_LATENCY.labels(base_url, route, status).observe(time.perf_counter() - started)
+            raise
+        UPSTREAM_LATENCY.labels(base_url, route, rp_resp.status_code).observe(time.perf_counter() - started)
 
         return StreamingResponse(
             rp_resp.aiter_raw(),
@@ -49,4 +289,14 @@ class ProxyClient:
             background=BackgroundTask(rp_resp.aclose),
         )
 
-proxy_client = ProxyClient()
\ No newline at end of file
+def _collect_limiter_metrics() -> None:
+    for limiter in proxy_client.limiters.values():
+        snapshot = limiter.snapshot()
+        LIMITER_LIMIT.labels(limiter.name).set(snapshot["limit"])
+        LIMITER_INFLIGHT.labels(limiter.name).set(snapshot["inflight"])
+        LIMITER_QUEUED.labels(limiter.name).set(snapshot["queued"])
+        LIMITER_REJECTED.labels(limiter.name, "rejected").set_total(snapshot["rejected"])
+        LIMITER_REJECTED.labels(limiter.name, "expired").set_total(snapshot["expired"])
+
+proxy_client = ProxyClient()
+registry.add_collector(_collect_limiter_metrics)
\ No newline at end of file
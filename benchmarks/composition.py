@@ -0,0 +1,93 @@
+"""
+Сравнение режимов развертывания шлюза: http (сервисы в отдельных процессах)
+и inprocess (orders и payments смонтированы в процесс шлюза через ASGI).
+
+Шлюз поднимается в процессе бенчмарка и нагружается через ASGITransport,
+поэтому измеряется путь шлюз -> сервис -> ответ. Для режима http сервисы
+должны быть уже запущены, а их CPU учитывается через --service-pids:
+
+    ORDERS_SERVICE_URL=http://localhost:8001 PAYMENTS_SERVICE_URL=http://localhost:8002 \\
+        python benchmarks/composition.py --mode http --service-pids 1234 5678
+
+Для inprocess нужны настройки БД и RabbitMQ сервисов с префиксами ORDERS__/PAYMENTS__:
+
+    ORDERS__DB__HOST=localhost ... python benchmarks/composition.py --mode inprocess
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+def _process_cpu_seconds(pid: int) -> float:
+    # utime и stime — 14-е и 15-е поля /proc/<pid>/stat
+    fields = Path(f"/proc/{pid}/stat").read_text().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+def _cpu_seconds(service_pids: list[int]) -> float:
+    return time.process_time() + sum(_process_cpu_seconds(pid) for pid in service_pids)
+
+def _percentile(ordered: list[float], p: float) -> float:
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+async def run(args: argparse.Namespace) -> dict:
+    os.environ["DEPLOYMENT_MODE"] = args.mode
+    os.environ.setdefault("ORDERS_SERVICE_PATH", str(ROOT / "orders_service"))
+    os.environ.setdefault("PAYMENTS_SERVICE_PATH", str(ROOT / "payments_service"))
+    sys.path.insert(0, str(ROOT / "api_gateway"))
+
+    import httpx
+    from app.main import app
+
+    latencies: list[float] = []
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://gateway") as client:
+            async def one(record: bool) -> None:
+                async with semaphore:
+                    started = time.perf_counter()
+                    response = await client.get(args.path)
+                    response.raise_for_status()
+                    if record:
+                        latencies.append(time.perf_counter() - started)
+
+            await asyncio.gather(*(one(False) for _ in range(args.warmup)))
+
+            cpu_started = _cpu_seconds(args.service_pids)
+            wall_started = time.perf_counter()
+            await asyncio.gather(*(one(True) for _ in range(args.requests)))
+            wall = time.perf_counter() - wall_started
+            cpu = _cpu_seconds(args.service_pids) - cpu_started
+
+    ordered = sorted(latencies)
+    return {
+        "mode": args.mode,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "throughput_rps": round(args.requests / wall, 1),
+        "latency_p50_ms": round(_percentile(ordered, 0.50) * 1000, 3),
+        "latency_p99_ms": round(_percentile(ordered, 0.99) * 1000, 3),
+        "latency_mean_ms": round(statistics.fmean(ordered) * 1000, 3),
+        "cpu_ms_per_request": round(cpu / args.requests * 1000, 3),
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["http", "inprocess"], required=True)
+    parser.add_argument("--path", default="/v1/orders/?user_id=1")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--service-pids", type=int, nargs="*", default=[])
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
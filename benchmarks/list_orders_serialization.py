@@ -0,0 +1,107 @@
+"""
+Микробенчмарк пути ответа GET /v1/orders на списке из 10k заказов, без БД.
+
+    legacy — как было: ORM-сущность -> DomainOrder.model_validate ->
+             валидация по response_model -> jsonable-дамп -> json.dumps
+    lean   — сейчас: строка Core-запроса -> DomainOrder.model_construct ->
+             model_dump нужных полей -> orjson (FastJSONResponse)
+
+    python benchmarks/list_orders_serialization.py --rows 10000 --repeat 20
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from decimal import Decimal
+from pathlib import Path
+from types import SimpleNamespace
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Настройки сервиса читаются при импорте моделей; БД и брокер не нужны
+for name, value in {
+    "DB__USER": "bench", "DB__PASSWORD": "bench", "DB__HOST": "localhost",
+    "DB__PORT": "5432", "DB__NAME": "bench",
+    "RABBITMQ__USER": "bench", "RABBITMQ__PASSWORD": "bench",
+    "RABBITMQ__HOST": "localhost", "RABBITMQ__PORT": "5672",
+}.items():
+    os.environ.setdefault(name, value)
+sys.path.insert(0, str(ROOT / "orders_service"))
+
+from pydantic import TypeAdapter  # noqa: E402
+
+from app.api.responses import FastJSONResponse  # noqa: E402
+from app.api.v1.schemas import OrderResponse  # noqa: E402
+from app.domain.models import Order  # noqa: E402
+from app.infrastructure.database.models import OrderStatus  # noqa: E402
+
+RESPONSE_FIELDS = set(OrderResponse.model_fields)
+
+class _Row:
+    """Имитация sqlalchemy Row: отображение колонок в _mapping."""
+    __slots__ = ("_mapping",)
+
+    def __init__(self, mapping: dict):
+        self._mapping = mapping
+
+def make_rows(count: int) -> list[dict]:
+    statuses = list(OrderStatus)
+    return [
+        {
+            "id": i,
+            "user_id": 42,
+            "amount": Decimal(f"{i % 1000}.{i % 100:02d}"),
+            "description": f"Order #{i} for benchmark",
+            "status": statuses[i % len(statuses)],
+            "version": 1 + i % 2,
+        }
+        for i in range(1, count + 1)
+    ]
+
+def legacy_path(entities: list[SimpleNamespace], adapter: TypeAdapter) -> bytes:
+    orders = [Order.model_validate(entity) for entity in entities]
+    validated = adapter.validate_python(orders, from_attributes=True)
+    return json.dumps(adapter.dump_python(validated, mode="json")).encode("utf-8")
+
+def lean_path(rows: list[_Row]) -> bytes:
+    orders = [Order.model_construct(**row._mapping) for row in rows]
+    return FastJSONResponse([o.model_dump(include=RESPONSE_FIELDS) for o in orders]).body
+
+def measure(fn, repeat: int) -> list[float]:
+    fn()  # прогрев
+    timings = []
+    for _ in range(repeat):
+        started = time.process_time()
+        fn()
+        timings.append(time.process_time() - started)
+    return timings
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    data = make_rows(args.rows)
+    entities = [SimpleNamespace(**row) for row in data]
+    rows = [_Row(row) for row in data]
+    adapter = TypeAdapter(list[OrderResponse])
+
+    legacy_body = legacy_path(entities, adapter)
+    lean_body = lean_path(rows)
+    assert json.loads(legacy_body) == json.loads(lean_body), "Ответы путей различаются"
+
+    legacy = statistics.median(measure(lambda: legacy_path(entities, adapter), args.repeat))
+    lean = statistics.median(measure(lambda: lean_path(rows), args.repeat))
+    print(json.dumps({
+        "rows": args.rows,
+        "legacy_cpu_ms": round(legacy * 1000, 2),
+        "lean_cpu_ms": round(lean * 1000, 2),
+        "speedup": round(legacy / lean, 2),
+        "body_bytes": len(lean_body),
+    }))
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
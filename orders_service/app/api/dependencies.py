@@ -1,10 +1,27 @@
 from typing import Annotated
 from fastapi import Depends
 
+from app.application.admission import OrderAdmissionController, admission_controller
+from app.application.idempotency import idempotency_cache
+from app.application.notifications import OrderStatusNotifier, order_status_notifier
 from app.application.services import OrderService
+from app.infrastructure.archive.store import order_archive
 from app.infrastructure.database.session import AsyncSessionLocal
 
 def get_order_service() -> OrderService:
-    return OrderService(session_factory=AsyncSessionLocal)
+    return OrderService(
+        session_factory=AsyncSessionLocal,
+        notifier=order_status_notifier,
+        archive=order_archive,
+        idempotency=idempotency_cache,
+    )
 
-OrderServiceDep = Annotated[OrderService, Depends(get_order_service)]
\ No newline at end of file
+def get_order_status_notifier() -> OrderStatusNotifier:
+    return order_status_notifier
+
+def get_admission_controller() -> OrderAdmissionController:
+    return admission_controller
+
+OrderServiceDep = Annotated[OrderService, Depends(get_order_service)]
+OrderStatusNotifierDep = Annotated[OrderStatusNotifier, Depends(get_order_status_notifier)]
+OrderAdmissionDep = Annotated[OrderAdmissionController, Depends(get_admission_controller)]
\ No newline at end of file
@@ -0,0 +1,17 @@
+from decimal import Decimal
+from typing import Any
+
+import orjson
+from fastapi.responses import JSONResponse
+
+def _default(value: Any) -> Any:
+    # Decimal сериализуется строкой, как это делает pydantic
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse на orjson: в разы быстрее stdlib json на больших списках."""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=_default)
\ No newline at end of file
@@ -1,49 +1,217 @@
-from fastapi import APIRouter, HTTPException, status, Query
-from app.api.dependencies import OrderServiceDep
-from app.api.v1.schemas import OrderCreateRequest, OrderResponse
+import time
+from datetime import datetime
+from typing import AsyncIterator
+
+from fastapi import APIRouter, Header, HTTPException, Response, status, Query
+from starlette.responses import StreamingResponse
+
+from app.api.dependencies import OrderAdmissionDep, OrderServiceDep, OrderStatusNotifierDep
+from app.api.etag import etag_matches, make_etag, not_modified
+from app.api.responses import FastJSONResponse
+from app.api.v1.schemas import OrderCreateRequest, OrderResponse, UserOrderStatsResponse
+from app.core.config import settings
+from app.infrastructure.database.models import OrderStatus
 
 router = APIRouter()
 
-@router.post("/", response_model=OrderResponse, status_code=status.HTTP_201_CREATED)
+WAIT_PATTERN = r"^\d+(\.\d+)?s?$"
+ORDER_RESPONSE_FIELDS = set(OrderResponse.model_fields)
+
+def _parse_wait(wait: str | None) -> float:
+    if not wait:
+        return 0.0
+    return min(float(wait.rstrip("s")), settings.notifications.MAX_WAIT_SECONDS)
+
+def _sse_event(event: str, data: OrderResponse) -> bytes:
+    return f"event: {event}\ndata: {data.model_dump_json()}\n\n".encode()
+
+@router.post(
+    "/",
+    response_model=OrderResponse,
+    status_code=status.HTTP_201_CREATED,
+    responses={
+        422: {"description": "Idempotency-Key уже использован с другим запросом"},
+        429: {"description": "Платежи не успевают, повторите после Retry-After"},
+    },
+)
 async def create_order(
-    request: OrderCreateRequest, service: OrderServiceDep
+    request: OrderCreateRequest,
+    service: OrderServiceDep,
+    admission: OrderAdmissionDep,
+    idempotency_key: str | None = Header(None, max_length=255),
 ):
     """
     Создает новый заказ.
+    С заголовком Idempotency-Key повторный запрос вернет тот же заказ.
     """
+    # Повтор по Idempotency-Key не отклоняется: заказ уже создан и повтор должен его получить
+    await admission.admit(
+        is_repeated=(lambda: service.is_repeated_order(request.user_id, idempotency_key))
+        if idempotency_key else None
+    )
     order = await service.create_order(
         user_id=request.user_id,
         amount=request.amount,
-        description=request.description
+        description=request.description,
+        idempotency_key=idempotency_key,
     )
     return order
 
-@router.get("/", response_model=list[OrderResponse])
+def _order_etag(order_id: int, version: int) -> str:
+    return make_etag("o", order_id, version)
+
+def _orders_list_etag(
+    user_id: int, since: datetime | None, count: int, max_id: int, version_sum: int
+) -> str:
+    return make_etag("l", user_id, since.isoformat() if since else "", count, max_id, version_sum)
+
+@router.get(
+    "/",
+    response_model=list[OrderResponse],
+    responses={304: {"description": "Список не изменился"}},
+)
 async def list_orders(
     *,
     user_id: int = Query(..., gt=0),
+    since: datetime | None = Query(None),
+    if_none_match: str | None = Header(None),
     service: OrderServiceDep
 ):
     """
     Возвращает список заказов для указанного пользователя.
+    since ограничивает историю заказами, созданными не раньше указанного
+    момента; при range-партиционировании старые партиции не читаются.
+    """
+    if if_none_match:
+        etag = _orders_list_etag(user_id, since, *await service.get_orders_list_version(user_id, since))
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+
+    orders = await service.list_orders_by_user(user_id, since)
+    etag = _orders_list_etag(
+        user_id,
+        since,
+        len(orders),
+        max((o.id for o in orders), default=0),
+        sum(o.version for o in orders),
+    )
+    # Заказы из репозитория уже валидны: отдаем их мимо повторной
+    # валидации по response_model, которая на длинной истории дороже запроса
+    return FastJSONResponse(
+        [o.model_dump(include=ORDER_RESPONSE_FIELDS) for o in orders],
+        headers={"ETag": etag},
+    )
+
+@router.get("/stats", response_model=UserOrderStatsResponse)
+async def get_user_stats(
+    *,
+    user_id: int = Query(..., gt=0),
+    service: OrderServiceDep
+):
+    """
+    Возвращает агрегаты по заказам пользователя: число заказов в каждом
+    статусе и сумму оплаченных. Читается одна строка, независимо от истории.
     """
-    orders = await service.list_orders_by_user(user_id)
-    return orders
+    return await service.get_user_stats(user_id)
 
-@router.get("/{order_id}", response_model=OrderResponse)
+@router.get(
+    "/{order_id}",
+    response_model=OrderResponse,
+    responses={304: {"description": "Заказ не изменился"}},
+)
 async def get_order(
     order_id: int,
+    response: Response,
     *,
     user_id: int = Query(..., gt=0),
-    service: OrderServiceDep
+    wait: str | None = Query(None, pattern=WAIT_PATTERN),
+    if_none_match: str | None = Header(None),
+    service: OrderServiceDep,
+    notifier: OrderStatusNotifierDep,
 ):
     """
     Возвращает информацию о конкретном заказе.
+    С параметром wait (например, ?wait=30s) работает как long-poll: если заказ
+    еще в статусе NEW, ответ придет после смены статуса или по истечении wait.
+    """
+    timeout = _parse_wait(wait)
+    if if_none_match and not timeout:
+        version = await service.get_order_version(order_id, user_id)
+        if version is not None:
+            etag = _order_etag(order_id, version)
+            if etag_matches(if_none_match, etag):
+                return not_modified(etag)
+
+    subscription = notifier.subscribe(order_id) if timeout > 0 else None
+    try:
+        order = await service.get_order_by_id(order_id, user_id)
+        if order and subscription and order.status == OrderStatus.NEW:
+            if await subscription.wait(timeout) is not None:
+                order = await service.get_order_by_id(order_id, user_id)
+    finally:
+        if subscription:
+            subscription.close()
+
+    if not order:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Order not found"
+        )
+    etag = _order_etag(order.id, order.version)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+    return order
+
+@router.get("/{order_id}/events", response_class=StreamingResponse)
+async def order_events(
+    order_id: int,
+    *,
+    user_id: int = Query(..., gt=0),
+    service: OrderServiceDep,
+    notifier: OrderStatusNotifierDep,
+):
+    """
+    Server-Sent Events со статусом заказа: сразу отправляет текущее состояние,
+    затем — итоговый статус после оплаты, и закрывает поток.
     """
-    order = await service.get_order_by_id(order_id, user_id)
+    # Подписываемся до чтения заказа, чтобы не пропустить смену статуса между ними
+    subscription = notifier.subscribe(order_id)
+    try:
+        order = await service.get_order_by_id(order_id, user_id)
+    except BaseException:
+        subscription.close()
+        raise
     if not order:
+        subscription.close()
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Order not found"
         )
-    return order
\ No newline at end of file
+
+    async def stream() -> AsyncIterator[bytes]:
+        try:
+            current = OrderResponse.model_validate(order)
+            yield _sse_event("status", current)
+            deadline = time.monotonic() + settings.notifications.SSE_MAX_STREAM_SECONDS
+            while current.status == OrderStatus.NEW:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    return
+                heartbeat = min(settings.notifications.SSE_HEARTBEAT_SECONDS, left)
+                if await subscription.wait(heartbeat) is None:
+                    yield b": keepalive\n\n"
+                    continue
+                updated = await service.get_order_by_id(order_id, user_id)
+                if updated is None:
+                    return
+                current = OrderResponse.model_validate(updated)
+                yield _sse_event("status", current)
+        finally:
+            subscription.close()
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
\ No newline at end of file
@@ -21,5 +21,15 @@ class OrderResponse(BaseModel):
     description: str
     status: OrderStatus
 
+    class Config:
+        from_attributes = True
+
+class UserOrderStatsResponse(BaseModel):
+    user_id: int
+    new_count: int
+    finished_count: int
+    cancelled_count: int
+    total_spent: DecimalType
+
     class Config:
         from_attributes = True
\ No newline at end of file
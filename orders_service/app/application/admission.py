@@ -0,0 +1,157 @@
+import asyncio
+import logging
+import math
+import random
+import time
+from typing import Awaitable, Callable
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.core.config import AdmissionSettings, settings
+from app.core.metrics import registry
+from app.infrastructure.database.repository import SQLAlchemyOutboxRepository
+from app.infrastructure.database.session import AsyncSessionLocal
+from app.infrastructure.messaging.bus import MessageBus, message_bus
+
+log = logging.getLogger(__name__)
+
+ADMISSION_PRESSURE = registry.gauge(
+    "orders_admission_pressure", "Доля отклоняемых новых заказов (0..1) по последнему замеру"
+)
+ADMISSION_QUEUE_DEPTH = registry.gauge(
+    "orders_admission_payment_queue_depth", "Глубина очереди запросов на оплату по последнему замеру"
+)
+ADMISSION_REJECTED = registry.counter(
+    "orders_admission_rejected_total", "Заказы, отклоненные контролем допуска"
+)
+
+class AdmissionRejected(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__("Order creation is throttled while payments catch up")
+        self.retry_after = retry_after
+
+def _pressure(value: int, soft: int, hard: int) -> float:
+    if value <= soft:
+        return 0.0
+    if value >= hard:
+        return 1.0
+    return (value - soft) / (hard - soft)
+
+class OrderAdmissionController:
+    """
+    Ограничивает создание заказов, когда payments не успевает их оплачивать.
+
+    Фоновая задача раз в SAMPLE_INTERVAL_SECONDS замеряет неопубликованный
+    outbox и глубину очереди payment_requests_queue. Выше soft-порога часть
+    новых заказов отклоняется с вероятностью, растущей до 1 к hard-порогу,
+    поэтому очередь перед оплатой, а с ней и время до оплаты, ограничены.
+    Сигнал без свежего замера не учитывается, без свежих замеров обоих
+    контроллер заказы не ограничивает.
+    """
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker[AsyncSession],
+        bus: MessageBus,
+        settings: AdmissionSettings,
+    ):
+        self.session_factory = session_factory
+        self.bus = bus
+        self.settings = settings
+        self.outbox_backlog = 0
+        self.queue_depth = 0
+        self.pressure = 0.0
+        self.rejected = 0
+        # Свой момент замера у каждого сигнала: сигнал, который давно не
+        # удавалось замерить, не держит давление на последнем значении
+        self._outbox_sampled_at: float | None = None
+        self._queue_sampled_at: float | None = None
+        self._stop_event = asyncio.Event()
+
+    async def sample(self) -> None:
+        try:
+            async with self.session_factory() as session:
+                async with session.begin():
+                    self.outbox_backlog = await SQLAlchemyOutboxRepository(session).count_unpublished(
+                        self.settings.OUTBOX_HARD_LIMIT
+                    )
+            self._outbox_sampled_at = time.monotonic()
+        except Exception as e:
+            log.warning(f"Failed to read outbox backlog: {e}")
+        try:
+            self.queue_depth = await self.bus.queue_depth(self.settings.QUEUE_NAME)
+            self._queue_sampled_at = time.monotonic()
+        except Exception as e:
+            # Брокер недоступен: outbox растет и сам поднимет давление
+            log.warning(f"Failed to read payment queue depth: {e}")
+
+        self.pressure = self.current_pressure()
+        ADMISSION_PRESSURE.set(self.pressure)
+        ADMISSION_QUEUE_DEPTH.set(self.queue_depth)
+
+    def _is_fresh(self, sampled_at: float | None) -> bool:
+        return sampled_at is not None and time.monotonic() - sampled_at <= self.settings.MAX_SAMPLE_AGE_SECONDS
+
+    def current_pressure(self) -> float:
+        """Давление по сигналам, замеренным не раньше MAX_SAMPLE_AGE_SECONDS назад."""
+        pressure = 0.0
+        if self._is_fresh(self._outbox_sampled_at):
+            pressure = _pressure(
+                self.outbox_backlog, self.settings.OUTBOX_SOFT_LIMIT, self.settings.OUTBOX_HARD_LIMIT
+            )
+        if self._is_fresh(self._queue_sampled_at):
+            pressure = max(pressure, _pressure(
+                self.queue_depth, self.settings.QUEUE_SOFT_LIMIT, self.settings.QUEUE_HARD_LIMIT
+            ))
+        return pressure
+
+    async def admit(self, is_repeated: Callable[[], Awaitable[bool]] | None = None) -> None:
+        """
+        Пропускает новый заказ или бросает AdmissionRejected. is_repeated
+        проверяется только для отклоняемого запроса: повтор уже созданного
+        заказа не добавляет работы payments и проходит всегда.
+        """
+        if not self.settings.ENABLED:
+            return
+        pressure = self.current_pressure()
+        if pressure <= 0:
+            return
+        if pressure < 1.0 and random.random() >= pressure:
+            return
+        if is_repeated is not None and await is_repeated():
+            return
+        self.rejected += 1
+        ADMISSION_REJECTED.inc()
+        raise AdmissionRejected(math.ceil(self.settings.RETRY_AFTER_SECONDS * (1 + pressure)))
+
+    def snapshot(self) -> dict:
+        return {
+            "outbox_backlog": self.outbox_backlog,
+            "queue_depth": self.queue_depth,
+            "pressure": round(self.pressure, 3),
+            "rejected": self.rejected,
+        }
+
+    async def run(self) -> None:
+        if not self.settings.ENABLED:
+            return
+        log.info("Admission controller started.")
+        while not self._stop_event.is_set():
+            try:
+                await self.sample()
+            except Exception as e:
+                log.error(f"Admission sampling failed: {e}", exc_info=True)
+            try:
+                await asyncio.wait_for(self._stop_event.wait(), timeout=self.settings.SAMPLE_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+        log.info("Admission controller stopped.")
+
+    async def stop(self) -> None:
+        self._stop_event.set()
+
+admission_controller = OrderAdmissionController(
+    AsyncSessionLocal,
+    message_bus,
+    settings.admission,
+)
\ No newline at end of file
@@ -0,0 +1,42 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+
+from app.application.services import OrderService
+from app.core.config import ArchiveSettings
+
+log = logging.getLogger(__name__)
+
+class OrderArchiver:
+    """
+    Фоновая задача: пачками переносит завершенные заказы старше MIN_AGE_DAYS
+    из orders в холодный архив, пока есть что переносить, затем засыпает.
+    """
+
+    def __init__(self, service: OrderService, settings: ArchiveSettings):
+        self.service = service
+        self.settings = settings
+        self._stop_event = asyncio.Event()
+
+    async def _archive_pending(self) -> None:
+        created_before = datetime.now() - timedelta(days=self.settings.MIN_AGE_DAYS)
+        while not self._stop_event.is_set():
+            moved = await self.service.archive_settled_orders(created_before, self.settings.BATCH_SIZE)
+            if moved < self.settings.BATCH_SIZE:
+                return
+
+    async def run(self) -> None:
+        log.info("Order archiver started.")
+        while not self._stop_event.is_set():
+            try:
+                await self._archive_pending()
+            except Exception as e:
+                log.error(f"Order archiving cycle failed: {e}", exc_info=True)
+            try:
+                await asyncio.wait_for(self._stop_event.wait(), timeout=self.settings.INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+        log.info("Order archiver stopped.")
+
+    async def stop(self) -> None:
+        self._stop_event.set()
\ No newline at end of file
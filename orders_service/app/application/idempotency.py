@@ -0,0 +1,132 @@
+import asyncio
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from decimal import Decimal
+from typing import Awaitable, Callable
+
+from app.core.config import settings
+
+log = logging.getLogger(__name__)
+
+class IdempotencyKeyReused(Exception):
+    pass
+
+def _canonical(part: object) -> str:
+    # 10 и 10.00 — одна и та же сумма, повтор с любой из записей тот же запрос
+    if isinstance(part, Decimal):
+        return str(part.normalize())
+    return str(part)
+
+def request_fingerprint(*parts: object) -> str:
+    return hashlib.sha256("\x1f".join(_canonical(part) for part in parts).encode()).hexdigest()
+
+class IdempotencyCache:
+    """
+    Процессный слой идемпотентности поверх таблицы idempotency_keys.
+
+    Сохраненные ответы держатся в LRU до истечения TTL, поэтому повтор
+    запроса стоит одного обращения к словарю. Одновременные дубликаты
+    ждут уже выполняющийся запрос с тем же ключом, а не запускают свой.
+    Между экземплярами сервиса дубликаты разводит таблица в БД.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[str, tuple[float, str, dict]] = OrderedDict()
+        self._inflight: dict[str, tuple[str, asyncio.Future]] = {}
+
+    def _get(self, key: str) -> tuple[str, dict] | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, fingerprint, response = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return fingerprint, response
+
+    def _put(self, key: str, fingerprint: str, response: dict) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, fingerprint, response)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def contains(self, key: str) -> bool:
+        """Ключ уже выполнен или выполняется в этом процессе."""
+        return key in self._inflight or self._get(key) is not None
+
+    @staticmethod
+    def _check(key: str, fingerprint: str, stored_fingerprint: str) -> None:
+        if fingerprint != stored_fingerprint:
+            raise IdempotencyKeyReused(
+                f"Idempotency-Key '{key.rsplit(':', 1)[-1]}' was already used with a different request"
+            )
+
+    async def run_once(
+        self, key: str, fingerprint: str, execute: Callable[[], Awaitable[tuple[str, dict]]]
+    ) -> dict:
+        """
+        Возвращает ответ для ключа, выполняя execute не больше одного раза
+        на процесс. execute возвращает (fingerprint, ответ) — новый или
+        сохраненный ранее в БД.
+        """
+        while True:
+            cached = self._get(key)
+            if cached is not None:
+                self._check(key, fingerprint, cached[0])
+                return cached[1]
+
+            inflight = self._inflight.get(key)
+            if inflight is None:
+                break
+            self._check(key, fingerprint, inflight[0])
+            response = await asyncio.shield(inflight[1])
+            if response is not None:
+                return response
+            # Исходный запрос упал — пробуем выполнить сами
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = (fingerprint, future)
+        try:
+            stored_fingerprint, response = await execute()
+            self._put(key, stored_fingerprint, response)
+            self._check(key, fingerprint, stored_fingerprint)
+            future.set_result(response)
+            return response
+        finally:
+            if not future.done():
+                future.set_result(None)
+            del self._inflight[key]
+
+class IdempotencyKeyPurger:
+    """Периодически удаляет из БД истекшие ключи идемпотентности."""
+
+    def __init__(self, purge: Callable[[int], Awaitable[int]], interval_seconds: float, batch_size: int):
+        self.purge = purge
+        self.interval_seconds = interval_seconds
+        self.batch_size = batch_size
+        self._stop_event = asyncio.Event()
+
+    async def run(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                while (
+                    not self._stop_event.is_set()
+                    and await self.purge(self.batch_size) >= self.batch_size
+                ):
+                    pass
+            except Exception as e:
+                log.error(f"Failed to purge idempotency keys: {e}", exc_info=True)
+            try:
+                await asyncio.wait_for(self._stop_event.wait(), timeout=self.interval_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    async def stop(self) -> None:
+        self._stop_event.set()
+
+idempotency_cache = IdempotencyCache(settings.idempotency.CACHE_SIZE, settings.idempotency.TTL_SECONDS)
\ No newline at end of file
@@ -0,0 +1,79 @@
+import asyncio
+from collections import defaultdict
+
+from app.core.config import settings
+from app.core.metrics import registry
+from app.infrastructure.database.models import OrderStatus
+
+class TooManySubscribers(Exception):
+    pass
+
+class OrderSubscription:
+    def __init__(self, notifier: "OrderStatusNotifier", order_id: int, future: asyncio.Future):
+        self._notifier = notifier
+        self.order_id = order_id
+        self._future = future
+        self._closed = False
+
+    async def wait(self, timeout: float) -> OrderStatus | None:
+        """Ждет смены статуса заказа; None — если за timeout ничего не пришло."""
+        done, _ = await asyncio.wait({self._future}, timeout=timeout)
+        return self._future.result() if done else None
+
+    def close(self) -> None:
+        if not self._closed:
+            self._closed = True
+            self._notifier._unsubscribe(self.order_id, self._future)
+
+class OrderStatusNotifier:
+    """
+    In-process fan-out обновлений статуса заказа, питаемый consumer'ом
+    payment.processed. Все ожидающие одного заказа делят одну future,
+    а общее число подписчиков на процесс ограничено.
+
+    Уведомление получает только экземпляр сервиса, обработавший событие;
+    подписчики остальных экземпляров перечитывают заказ по таймауту.
+    """
+
+    def __init__(self, max_subscribers: int):
+        self.max_subscribers = max_subscribers
+        self._futures: dict[int, asyncio.Future] = {}
+        self._counts: dict[int, int] = defaultdict(int)
+        self._total = 0
+
+    @property
+    def subscribers(self) -> int:
+        return self._total
+
+    def subscribe(self, order_id: int) -> OrderSubscription:
+        if self._total >= self.max_subscribers:
+            raise TooManySubscribers("Too many clients are waiting for order updates")
+        future = self._futures.get(order_id)
+        if future is None or future.done():
+            future = asyncio.get_running_loop().create_future()
+            self._futures[order_id] = future
+        self._counts[order_id] += 1
+        self._total += 1
+        return OrderSubscription(self, order_id, future)
+
+    def publish(self, order_id: int, status: OrderStatus) -> None:
+        future = self._futures.pop(order_id, None)
+        if future is not None and not future.done():
+            future.set_result(status)
+
+    def _unsubscribe(self, order_id: int, future: asyncio.Future) -> None:
+        self._total -= 1
+        self._counts[order_id] -= 1
+        if self._counts[order_id] > 0:
+            return
+        del self._counts[order_id]
+        if self._futures.get(order_id) is future:
+            del self._futures[order_id]
+            future.cancel()
+
+order_status_notifier = OrderStatusNotifier(settings.notifications.MAX_SUBSCRIBERS)
+
+_subscribers_gauge = registry.gauge(
+    "orders_status_subscribers", "Клиенты, ожидающие смены статуса заказа (SSE и long-poll)"
+)
+registry.add_collector(lambda: _subscribers_gauge.set(order_status_notifier.subscribers))
\ No newline at end of file
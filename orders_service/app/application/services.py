@@ -1,66 +1,201 @@
+import asyncio
 import logging
 import uuid
+from datetime import datetime
 from decimal import Decimal
+from sqlalchemy import func, select
 from sqlalchemy.ext.asyncio import async_sessionmaker, AsyncSession
 
-from app.domain.models import Order, OrderStatusUpdate
+from app.application.idempotency import IdempotencyCache, request_fingerprint
+from app.application.notifications import OrderStatusNotifier
+from app.core.metrics import registry
+from app.core.tracing import outbox_trace
+from app.domain.models import Order, OrderStatusUpdate, UserOrderStats
+from app.infrastructure.archive.store import OrderArchive
 from app.infrastructure.database.models import OrderStatus
 from app.infrastructure.database.repository import (
+    SQLAlchemyIdempotencyRepository,
     SQLAlchemyOrderRepository,
+    SQLAlchemyOrderStatsRepository,
     SQLAlchemyOutboxRepository,
 )
 
 log = logging.getLogger(__name__)
+ARCHIVE_LOCK_ID = 0x6F726172
+
+STATUS_UPDATE_DUPLICATES = registry.counter(
+    "inbox_duplicates_total",
+    "Повторные или запоздавшие обновления статуса, не изменившие заказ",
+)
 
 class OrderService:
-    def __init__(self, session_factory: async_sessionmaker[AsyncSession]):
+    def __init__(
+        self,
+        session_factory: async_sessionmaker[AsyncSession],
+        notifier: OrderStatusNotifier | None = None,
+        archive: OrderArchive | None = None,
+        idempotency: IdempotencyCache | None = None,
+    ):
         self.session_factory = session_factory
+        self.notifier = notifier
+        self.archive = archive
+        self.idempotency = idempotency
 
     async def create_order(
-        self, user_id: int, amount: Decimal, description: str
+        self, user_id: int, amount: Decimal, description: str, idempotency_key: str | None = None
     ) -> Order:
+        """
+        Создает заказ. С idempotency_key повтор запроса возвращает уже
+        созданный заказ, не запуская заново оплату.
+        """
+        if idempotency_key is None or self.idempotency is None:
+            async with self.session_factory() as session:
+                async with session.begin():
+                    return await self._create_order(session, user_id, amount, description)
+
+        key = self._order_key(user_id, idempotency_key)
+        fingerprint = request_fingerprint(user_id, amount, description)
+
+        async def execute() -> tuple[str, dict]:
+            async with self.session_factory() as session:
+                idempotency_repo = SQLAlchemyIdempotencyRepository(session)
+                async with session.begin():
+                    # Ключ занимается первым, поэтому дубликат с другого
+                    # экземпляра ждет коммита и получает готовый ответ
+                    stored = await idempotency_repo.claim(key, fingerprint, self.idempotency.ttl_seconds)
+                    if stored is not None:
+                        return stored
+                    order = await self._create_order(session, user_id, amount, description)
+                    response = order.model_dump(mode="json")
+                    await idempotency_repo.save_response(key, response)
+            return fingerprint, response
+
+        return Order.model_validate(await self.idempotency.run_once(key, fingerprint, execute))
+
+    @staticmethod
+    def _order_key(user_id: int, idempotency_key: str) -> str:
+        return f"order.create:{user_id}:{idempotency_key}"
+
+    async def is_repeated_order(self, user_id: int, idempotency_key: str) -> bool:
+        """Заказ с этим Idempotency-Key уже создан или создается."""
+        if self.idempotency is None:
+            return False
+        key = self._order_key(user_id, idempotency_key)
+        if self.idempotency.contains(key):
+            return True
         async with self.session_factory() as session:
-            order_repo = SQLAlchemyOrderRepository(session)
-            outbox_repo = SQLAlchemyOutboxRepository(session)
-            
             async with session.begin():
-                order = await order_repo.create(user_id, amount, description)
-                
-                message_id = uuid.uuid4()
-                payload = {
-                    "order_id": order.id,
-                    "user_id": user_id,
-                    "amount": str(amount),
-                }
-                await outbox_repo.add(
-                    message_id=message_id,
-                    topic="order.created",
-                    payload=payload
-                )
+                return await SQLAlchemyIdempotencyRepository(session).exists(key)
+
+    async def _create_order(
+        self, session: AsyncSession, user_id: int, amount: Decimal, description: str
+    ) -> Order:
+        order_repo = SQLAlchemyOrderRepository(session)
+        outbox_repo = SQLAlchemyOutboxRepository(session)
+        stats_repo = SQLAlchemyOrderStatsRepository(session)
+
+        order = await order_repo.create(user_id, amount, description)
+        await stats_repo.record_created(user_id)
+        
+        message_id = uuid.uuid4()
+        payload = {
+            "order_id": order.id,
+            "user_id": user_id,
+            "amount": str(amount),
+        }
+        trace = outbox_trace()
+        if trace:
+            payload["trace"] = trace
+        await outbox_repo.add(
+            message_id=message_id,
+            topic="order.created",
+            payload=payload
+        )
         return order
 
     async def update_order_status(self, update_data: OrderStatusUpdate) -> None:
         async with self.session_factory() as session:
             order_repo = SQLAlchemyOrderRepository(session)
+            stats_repo = SQLAlchemyOrderStatsRepository(session)
             async with session.begin():
                 new_status = (
                     OrderStatus.FINISHED if update_data.status == "SUCCESS"
                     else OrderStatus.CANCELLED
                 )
-                updated = await order_repo.update_status(update_data.order_id, new_status)
+                updated = await order_repo.update_status(
+                    update_data.order_id, new_status, user_id=update_data.user_id
+                )
                 if updated:
+                    await stats_repo.record_settled(updated.user_id, updated.amount, new_status)
                     log.info(f"Order {update_data.order_id} status updated to {new_status.name}")
                 else:
-                    log.warning(f"Order {update_data.order_id} not found for status update.")
+                    STATUS_UPDATE_DUPLICATES.inc()
+                    log.warning(
+                        f"Order {update_data.order_id} not found or already settled, "
+                        "status update skipped."
+                    )
+        if updated and self.notifier:
+            self.notifier.publish(update_data.order_id, new_status)
 
     async def get_order_by_id(self, order_id: int, user_id: int) -> Order | None:
         async with self.session_factory() as session:
-            repo = SQLAlchemyOrderRepository(session)
+            repo = SQLAlchemyOrderRepository(session, self.archive)
             async with session.begin():
                 return await repo.get_by_id(order_id, user_id)
 
-    async def list_orders_by_user(self, user_id: int) -> list[Order]:
+    async def list_orders_by_user(self, user_id: int, since: datetime | None = None) -> list[Order]:
+        async with self.session_factory() as session:
+            repo = SQLAlchemyOrderRepository(session, self.archive)
+            async with session.begin():
+                return await repo.list_by_user_id(user_id, since)
+
+    async def get_order_version(self, order_id: int, user_id: int) -> int | None:
+        async with self.session_factory() as session:
+            repo = SQLAlchemyOrderRepository(session, self.archive)
+            async with session.begin():
+                return await repo.get_version(order_id, user_id)
+
+    async def get_orders_list_version(self, user_id: int, since: datetime | None = None) -> tuple[int, int, int]:
+        async with self.session_factory() as session:
+            repo = SQLAlchemyOrderRepository(session, self.archive)
+            async with session.begin():
+                return await repo.get_list_version(user_id, since)
+
+    async def get_user_stats(self, user_id: int) -> UserOrderStats:
+        async with self.session_factory() as session:
+            repo = SQLAlchemyOrderStatsRepository(session)
+            async with session.begin():
+                return await repo.get(user_id)
+
+    async def ensure_user_stats(self) -> None:
+        async with self.session_factory() as session:
+            repo = SQLAlchemyOrderStatsRepository(session)
+            async with session.begin():
+                await repo.rebuild_if_empty()
+
+    async def archive_settled_orders(self, created_before: datetime, limit: int) -> int:
+        """
+        Переносит пачку завершенных заказов старше created_before в архив.
+        Сегмент пишется до удаления строк, поэтому сбой может оставить копию
+        заказа в обоих местах, но не потерять его. Возвращает число заказов.
+        """
         async with self.session_factory() as session:
             repo = SQLAlchemyOrderRepository(session)
             async with session.begin():
-                return await repo.list_by_user_id(user_id)
\ No newline at end of file
+                # Архивирует один экземпляр сервиса за раз
+                locked = await session.scalar(select(func.pg_try_advisory_xact_lock(ARCHIVE_LOCK_ID)))
+                if not locked:
+                    return 0
+                rows = await repo.list_archivable(created_before, limit)
+                if not rows:
+                    return 0
+                segment = await asyncio.to_thread(self.archive.write_segment, rows)
+                await repo.delete_archived([r["id"] for r in rows], created_before)
+        log.info(f"Archived {len(rows)} orders into segment {segment}")
+        return len(rows)
+
+    async def purge_idempotency_keys(self, limit: int) -> int:
+        async with self.session_factory() as session:
+            repo = SQLAlchemyIdempotencyRepository(session)
+            async with session.begin():
+                return await repo.purge_expired(limit)
\ No newline at end of file
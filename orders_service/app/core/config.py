@@ -1,3 +1,6 @@
+from typing import Literal
+
+from pydantic import BaseModel
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class DatabaseSettings(BaseSettings):
@@ -21,6 +24,95 @@ class RabbitMQSettings(BaseSettings):
     def url(self) -> str:
         return f"amqp://{self.USER}:{self.PASSWORD}@{self.HOST}:{self.PORT}/"
 
+class NotificationSettings(BaseModel):
+    # Общий лимит ожидающих клиентов (SSE и long-poll) на процесс
+    MAX_SUBSCRIBERS: int = 10000
+    MAX_WAIT_SECONDS: float = 60.0
+    SSE_HEARTBEAT_SECONDS: float = 15.0
+    SSE_MAX_STREAM_SECONDS: float = 300.0
+
+class PartitioningSettings(BaseModel):
+    # none — обычная таблица, range — помесячно по created_at, hash — по user_id.
+    # Режим выбирается до создания таблицы: сменить его можно только миграцией.
+    MODE: Literal["none", "range", "hash"] = "none"
+    HASH_PARTITIONS: int = 16
+    # На сколько месяцев вперед заранее создавать range-партиции
+    MONTHS_AHEAD: int = 3
+    CHECK_INTERVAL_SECONDS: float = 6 * 3600
+
+class ArchiveSettings(BaseModel):
+    ENABLED: bool = False
+    # Каталог сегментов; у нескольких экземпляров сервиса он должен быть общим
+    PATH: str = "/var/lib/orders_archive"
+    # Завершенные заказы старше этого срока переезжают из orders в архив
+    MIN_AGE_DAYS: int = 90
+    BATCH_SIZE: int = 10000
+    BLOCK_ROWS: int = 256
+    INTERVAL_SECONDS: float = 3600
+
+class AdmissionSettings(BaseModel):
+    ENABLED: bool = True
+    SAMPLE_INTERVAL_SECONDS: float = 1.0
+    # Между soft и hard доля отклоняемых заказов растет линейно от 0 до 1
+    OUTBOX_SOFT_LIMIT: int = 1000
+    OUTBOX_HARD_LIMIT: int = 10000
+    QUEUE_NAME: str = "payment_requests_queue"
+    QUEUE_SOFT_LIMIT: int = 2000
+    QUEUE_HARD_LIMIT: int = 20000
+    RETRY_AFTER_SECONDS: int = 5
+    # Если замеров нет дольше этого срока, заказы принимаются без ограничений
+    MAX_SAMPLE_AGE_SECONDS: float = 10.0
+
+class IdempotencySettings(BaseModel):
+    # Сколько хранится ответ на запрос с Idempotency-Key
+    TTL_SECONDS: float = 24 * 3600
+    CACHE_SIZE: int = 10000
+    PURGE_INTERVAL_SECONDS: float = 600
+    PURGE_BATCH_SIZE: int = 5000
+
+class TracingSettings(BaseModel):
+    # Контекст трассы передается дальше всегда, ENABLED включает запись спанов
+    ENABLED: bool = False
+    PATH: str = "/var/log/traces"
+
+class LoopMonitorSettings(BaseModel):
+    ENABLED: bool = True
+    INTERVAL_SECONDS: float = 0.1
+    # Блокировка loop дольше порога попадает в лог со стеком
+    SLOW_CALLBACK_SECONDS: float = 0.25
+
+class ProfilerSettings(BaseModel):
+    # POST /admin/profile: выключен по умолчанию и требует X-Admin-Token
+    ENABLED: bool = False
+    TOKEN: str = ""
+    MAX_SECONDS: float = 60.0
+    SAMPLE_INTERVAL_SECONDS: float = 0.005
+
+class SQLSettings(BaseModel):
+    SLOW_QUERY_SECONDS: float = 0.2
+    # По умолчанию в лог медленных запросов попадают только типы параметров
+    LOG_BIND_VALUES: bool = False
+    # Запрос или сообщение, сделавшие больше запросов к БД, попадают в лог
+    STATEMENTS_WARN_THRESHOLD: int = 30
+
+class ConsumerRetrySettings(BaseModel):
+    # Попытки после первой при временной ошибке БД; задержка n-й — BASE * MULTIPLIER**(n-1)
+    MAX_ATTEMPTS: int = 3
+    BASE_DELAY_SECONDS: float = 1.0
+    MULTIPLIER: float = 5.0
+
+    @property
+    def delays(self) -> tuple[float, ...]:
+        return tuple(self.BASE_DELAY_SECONDS * self.MULTIPLIER ** n for n in range(self.MAX_ATTEMPTS))
+
+class StartupSettings(BaseModel):
+    # Соединений пула (на шард), прогреваемых до готовности; 0 — без прогрева
+    WARMUP_CONNECTIONS: int = 5
+    # Упавший шаг прогрева (БД, брокер, consumer) повторяется до успеха,
+    # пауза между попытками растет вдвое до RETRY_MAX_DELAY_SECONDS
+    RETRY_BASE_DELAY_SECONDS: float = 1.0
+    RETRY_MAX_DELAY_SECONDS: float = 30.0
+
 class Settings(BaseSettings):
     model_config = SettingsConfigDict(
         env_file=".env",
@@ -30,5 +122,18 @@ class Settings(BaseSettings):
     
     db: DatabaseSettings
     rabbitmq: RabbitMQSettings
+    # memory — брокер в памяти процесса (бенчмарки, сервисы в одном процессе)
+    message_bus: Literal["rabbitmq", "memory"] = "rabbitmq"
+    notifications: NotificationSettings = NotificationSettings()
+    partitioning: PartitioningSettings = PartitioningSettings()
+    archive: ArchiveSettings = ArchiveSettings()
+    admission: AdmissionSettings = AdmissionSettings()
+    idempotency: IdempotencySettings = IdempotencySettings()
+    tracing: TracingSettings = TracingSettings()
+    loop_monitor: LoopMonitorSettings = LoopMonitorSettings()
+    profiler: ProfilerSettings = ProfilerSettings()
+    sql: SQLSettings = SQLSettings()
+    startup: StartupSettings = StartupSettings()
+    consumer_retry: ConsumerRetrySettings = ConsumerRetrySettings()
 
 settings = Settings()
\ No newline at end of file
@@ -0,0 +1,25 @@
+import time
+from contextvars import ContextVar
+
+DEADLINE_HEADER = "x-request-deadline"
+
+# Абсолютный дедлайн текущего запроса (секунды от эпохи), None — без ограничения
+request_deadline: ContextVar[float | None] = ContextVar("request_deadline", default=None)
+
+class DeadlineExceeded(Exception):
+    pass
+
+def parse_deadline(value: str | None) -> float | None:
+    """Значение заголовка — миллисекунды от эпохи, как его выставляет шлюз."""
+    if not value:
+        return None
+    try:
+        return int(value) / 1000
+    except ValueError:
+        return None
+
+def remaining_time() -> float | None:
+    deadline = request_deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.time()
\ No newline at end of file
@@ -11,8 +11,20 @@ class Order(BaseModel):
     amount: Decimal
     description: str
     status: OrderStatus
+    version: int = 1
+
+class UserOrderStats(BaseModel):
+    model_config = ConfigDict(from_attributes=True, extra='ignore')
+
+    user_id: int
+    new_count: int = 0
+    finished_count: int = 0
+    cancelled_count: int = 0
+    total_spent: Decimal = Decimal("0.00")
 
 class OrderStatusUpdate(BaseModel):
     order_id: int
+    # Нет в сообщениях от старых версий payments_service
+    user_id: int | None = None
     status: str
     idempotency_key: uuid.UUID
\ No newline at end of file
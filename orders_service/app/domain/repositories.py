@@ -1,7 +1,8 @@
 import uuid
 from abc import ABC, abstractmethod
+from datetime import datetime
 from decimal import Decimal
-from app.domain.models import Order
+from app.domain.models import Order, UserOrderStats
 from app.infrastructure.database.models import OrderStatus
 
 # "Интерфейсы" репозиториев
@@ -15,14 +16,66 @@ class OrderRepository(ABC):
         ...
 
     @abstractmethod
-    async def list_by_user_id(self, user_id: int) -> list[Order]:
+    async def get_version(self, order_id: int, user_id: int) -> int | None:
         ...
 
     @abstractmethod
-    async def update_status(self, order_id: int, status: OrderStatus) -> bool:
+    async def get_list_version(self, user_id: int, since: datetime | None = None) -> tuple[int, int, int]:
+        ...
+
+    @abstractmethod
+    async def list_by_user_id(self, user_id: int, since: datetime | None = None) -> list[Order]:
+        ...
+
+    @abstractmethod
+    async def list_archivable(self, created_before: datetime, limit: int) -> list[dict]:
+        ...
+
+    @abstractmethod
+    async def delete_archived(self, order_ids: list[int], created_before: datetime) -> None:
+        ...
+
+    @abstractmethod
+    async def update_status(
+        self, order_id: int, status: OrderStatus, user_id: int | None = None
+    ) -> Order | None:
+        ...
+
+class OrderStatsRepository(ABC):
+    @abstractmethod
+    async def record_created(self, user_id: int) -> None:
+        ...
+
+    @abstractmethod
+    async def record_settled(self, user_id: int, amount: Decimal, status: OrderStatus) -> None:
+        ...
+
+    @abstractmethod
+    async def get(self, user_id: int) -> UserOrderStats:
         ...
 
 class OutboxRepository(ABC):
     @abstractmethod
     async def add(self, message_id: uuid.UUID, topic: str, payload: dict) -> None:
+        ...
+
+    @abstractmethod
+    async def count_unpublished(self, limit: int) -> int:
+        ...
+
+class IdempotencyRepository(ABC):
+    @abstractmethod
+    async def claim(self, key: str, fingerprint: str, ttl_seconds: float) -> tuple[str, dict] | None:
+        ...
+
+    @abstractmethod
+    async def exists(self, key: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def save_response(self, key: str, response: dict) -> None:
+        ...
+
+    @abstractmethod
+    async def purge_expired(self, limit: int) -> int:
         ...
\ No newline at end of file
@@ -0,0 +1,201 @@
+import bisect
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+
+from app.core.config import settings
+
+log = logging.getLogger(__name__)
+
+DATA_SUFFIX = ".ndjson.gz"
+INDEX_SUFFIX = ".idx.json"
+
+Key = tuple[int, int]
+
+@dataclass
+class _Segment:
+    name: str
+    data_path: Path
+    # Разреженный индекс: первый и последний ключ (user_id, id) каждого блока
+    first_keys: list[Key]
+    last_keys: list[Key]
+    offsets: list[int]
+    lengths: list[int]
+
+class OrderArchive:
+    """
+    Холодный архив завершенных заказов в локальных файлах.
+
+    Сегмент — NDJSON, отсортированный по (user_id, id) и разбитый на блоки
+    по block_rows строк; каждый блок — отдельный gzip-member, поэтому его
+    можно прочитать по смещению, не распаковывая файл целиком. Рядом лежит
+    разреженный индекс с границами блоков, он целиком держится в памяти.
+    Файл индекса пишется последним: сегмент без индекса считается недописанным.
+
+    Методы синхронные — из async-кода их вызывают через asyncio.to_thread.
+    """
+
+    def __init__(self, path: str, block_rows: int = 256, cache_blocks: int = 64, cache_users: int = 1024):
+        self.path = Path(path)
+        self.block_rows = block_rows
+        self.cache_blocks = cache_blocks
+        self.cache_users = cache_users
+        self._segments: list[_Segment] = []
+        self._cache: OrderedDict[tuple[str, int], list[dict]] = OrderedDict()
+        # Версии архивных заказов пользователя для ETag списка; действительны,
+        # пока набор сегментов (_generation) не изменился
+        self._versions: OrderedDict[tuple[int, datetime | None], tuple[int, dict[int, int]]] = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._loaded_mtime: int | None = None
+
+    def load(self) -> None:
+        self.path.mkdir(parents=True, exist_ok=True)
+        mtime = self.path.stat().st_mtime_ns
+        segments = []
+        for index_path in sorted(self.path.glob(f"*{INDEX_SUFFIX}")):
+            name = index_path.name.removesuffix(INDEX_SUFFIX)
+            segments.append(self._read_index(name, json.loads(index_path.read_text())))
+        with self._lock:
+            self._segments = segments
+            self._loaded_mtime = mtime
+            self._generation += 1
+        log.info(f"Order archive loaded: {len(segments)} segments in {self.path}")
+
+    def _read_index(self, name: str, blocks: list[list[int]]) -> _Segment:
+        return _Segment(
+            name=name,
+            data_path=self.path / f"{name}{DATA_SUFFIX}",
+            first_keys=[(b[0], b[1]) for b in blocks],
+            last_keys=[(b[2], b[3]) for b in blocks],
+            offsets=[b[4] for b in blocks],
+            lengths=[b[5] for b in blocks],
+        )
+
+    def write_segment(self, rows: list[dict]) -> str:
+        """Пишет новый сегмент и делает его видимым для чтения. Возвращает имя."""
+        rows = sorted(rows, key=lambda r: (r["user_id"], r["id"]))
+        name = f"orders-{time.time_ns()}"
+        data_path = self.path / f"{name}{DATA_SUFFIX}"
+        index_path = self.path / f"{name}{INDEX_SUFFIX}"
+
+        blocks = []
+        with open(data_path, "wb") as f:
+            for start in range(0, len(rows), self.block_rows):
+                block = rows[start:start + self.block_rows]
+                payload = "".join(json.dumps(r, separators=(",", ":")) + "\n" for r in block)
+                compressed = gzip.compress(payload.encode("utf-8"), compresslevel=6)
+                blocks.append([
+                    block[0]["user_id"], block[0]["id"],
+                    block[-1]["user_id"], block[-1]["id"],
+                    f.tell(), len(compressed),
+                ])
+                f.write(compressed)
+            f.flush()
+            os.fsync(f.fileno())
+
+        tmp_index = index_path.with_suffix(".tmp")
+        with open(tmp_index, "w") as f:
+            json.dump(blocks, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_index, index_path)
+
+        segment = self._read_index(name, blocks)
+        with self._lock:
+            self._segments.append(segment)
+            self._generation += 1
+        return name
+
+    def _read_block(self, segment: _Segment, block: int) -> list[dict]:
+        cache_key = (segment.name, block)
+        with self._lock:
+            rows = self._cache.get(cache_key)
+            if rows is not None:
+                self._cache.move_to_end(cache_key)
+                return rows
+        with open(segment.data_path, "rb") as f:
+            f.seek(segment.offsets[block])
+            raw = f.read(segment.lengths[block])
+        rows = [json.loads(line) for line in gzip.decompress(raw).splitlines()]
+        with self._lock:
+            self._cache[cache_key] = rows
+            if len(self._cache) > self.cache_blocks:
+                self._cache.popitem(last=False)
+        return rows
+
+    def _current_segments(self) -> list[_Segment]:
+        # Сегменты, записанные другими экземплярами, меняют mtime каталога
+        if self.path.stat().st_mtime_ns != self._loaded_mtime:
+            self.load()
+        with self._lock:
+            return list(self._segments)
+
+    def get(self, order_id: int, user_id: int) -> dict | None:
+        key = (user_id, order_id)
+        segments = self._current_segments()
+        for segment in reversed(segments):
+            block = bisect.bisect_right(segment.first_keys, key) - 1
+            if block < 0 or segment.last_keys[block] < key:
+                continue
+            for row in self._read_block(segment, block):
+                if row["id"] == order_id and row["user_id"] == user_id:
+                    return row
+        return None
+
+    def list_by_user(self, user_id: int, since: datetime | None = None) -> list[dict]:
+        segments = self._current_segments()
+        found: dict[int, dict] = {}
+        for segment in segments:
+            # Блоки пользователя идут подряд: от последнего блока, начинающегося
+            # раньше (user_id, 0), до первого, начинающегося после пользователя
+            start = max(0, bisect.bisect_left(segment.first_keys, (user_id, 0)) - 1)
+            end = bisect.bisect_right(segment.first_keys, (user_id, 2 ** 63))
+            for block in range(start, end):
+                if segment.last_keys[block][0] < user_id:
+                    continue
+                for row in self._read_block(segment, block):
+                    if row["user_id"] == user_id:
+                        found[row["id"]] = row
+        rows = found.values()
+        if since is not None:
+            if since.tzinfo is not None:
+                # created_at хранится без пояса, как timestamp в PostgreSQL
+                since = since.astimezone(timezone.utc).replace(tzinfo=None)
+            rows = [r for r in rows if datetime.fromisoformat(r["created_at"]) >= since]
+        return list(rows)
+
+    def list_versions(self, user_id: int, since: datetime | None = None) -> dict[int, int]:
+        """
+        id -> version архивных заказов пользователя. Архив меняется только
+        новыми сегментами, поэтому результат кешируется до их появления и
+        условный GET списка не распаковывает блоки на каждый запрос.
+        """
+        self._current_segments()
+        key = (user_id, since)
+        with self._lock:
+            generation = self._generation
+            cached = self._versions.get(key)
+            if cached is not None and cached[0] == generation:
+                self._versions.move_to_end(key)
+                return cached[1]
+        versions = {row["id"]: row["version"] for row in self.list_by_user(user_id, since)}
+        with self._lock:
+            if generation == self._generation:
+                self._versions[key] = (generation, versions)
+                self._versions.move_to_end(key)
+                if len(self._versions) > self.cache_users:
+                    self._versions.popitem(last=False)
+        return versions
+
+order_archive = (
+    OrderArchive(settings.archive.PATH, block_rows=settings.archive.BLOCK_ROWS)
+    if settings.archive.ENABLED else None
+)
\ No newline at end of file
@@ -3,9 +3,10 @@ import enum
 from datetime import datetime
 from decimal import Decimal
 
-from sqlalchemy import func, text, Numeric, Enum as DBEnum, Index
+from sqlalchemy import func, text, Numeric, String, Enum as DBEnum, Index
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 from sqlalchemy.dialects.postgresql import JSONB, UUID
+from app.core.config import settings
 
 class OrderStatus(str, enum.Enum):
     NEW = "NEW"
@@ -15,10 +16,20 @@ class OrderStatus(str, enum.Enum):
 class Base(DeclarativeBase):
     pass
 
+PARTITION_MODE = settings.partitioning.MODE
+
+# Ключ партиционирования в PostgreSQL обязан входить в первичный ключ
+PARTITION_BY = {
+    "none": None,
+    "range": "RANGE (created_at)",
+    "hash": "HASH (user_id)",
+}[PARTITION_MODE]
+
 class Order(Base):
     __tablename__ = "orders"
-    id: Mapped[int] = mapped_column(primary_key=True)
-    user_id: Mapped[int] = mapped_column(index=True)
+    __table_args__ = {"postgresql_partition_by": PARTITION_BY} if PARTITION_BY else {}
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    user_id: Mapped[int] = mapped_column(index=True, primary_key=PARTITION_MODE == "hash")
     amount: Mapped[Decimal] = mapped_column(Numeric(18, 2))
     description: Mapped[str]
     status: Mapped[OrderStatus] = mapped_column(
@@ -26,7 +37,24 @@ class Order(Base):
         default=OrderStatus.NEW,
         index=True
     )
-    created_at: Mapped[datetime] = mapped_column(server_default=func.now())
+    created_at: Mapped[datetime] = mapped_column(
+        server_default=func.now(), primary_key=PARTITION_MODE == "range"
+    )
+    # Версия строки для ETag: увеличивается при каждом изменении заказа
+    version: Mapped[int] = mapped_column(default=1, server_default=text("1"))
+    updated_at: Mapped[datetime] = mapped_column(server_default=func.now(), onupdate=func.now())
+
+class UserOrderStats(Base):
+    """Агрегаты по заказам пользователя, обновляются в транзакциях заказов."""
+    __tablename__ = "user_order_stats"
+    user_id: Mapped[int] = mapped_column(primary_key=True)
+    new_count: Mapped[int] = mapped_column(default=0, server_default=text("0"))
+    finished_count: Mapped[int] = mapped_column(default=0, server_default=text("0"))
+    cancelled_count: Mapped[int] = mapped_column(default=0, server_default=text("0"))
+    total_spent: Mapped[Decimal] = mapped_column(
+        Numeric(18, 2), default=Decimal("0.00"), server_default=text("0.00")
+    )
+    updated_at: Mapped[datetime] = mapped_column(server_default=func.now(), onupdate=func.now())
 
 class OutboxMessage(Base):
     __tablename__ = "outbox_messages"
@@ -45,4 +73,12 @@ class OutboxMessage(Base):
             'created_at',
             postgresql_where=is_published.is_(False)
         ),
-    )
\ No newline at end of file
+    )
+
+class IdempotencyKey(Base):
+    """Ответы на запросы с заголовком Idempotency-Key, хранятся до expires_at."""
+    __tablename__ = "idempotency_keys"
+    key: Mapped[str] = mapped_column(String(300), primary_key=True)
+    fingerprint: Mapped[str] = mapped_column(String(64))
+    response: Mapped[dict] = mapped_column(JSONB)
+    expires_at: Mapped[datetime] = mapped_column(index=True)
\ No newline at end of file
@@ -0,0 +1,78 @@
+import asyncio
+import logging
+from datetime import date
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.core.config import PartitioningSettings
+from app.infrastructure.database.models import Order
+
+log = logging.getLogger(__name__)
+
+def _add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+class OrderPartitionManager:
+    """
+    Заранее создает партиции таблицы orders. Для range — помесячные партиции
+    на MONTHS_AHEAD месяцев вперед и DEFAULT-партицию на случай, если фоновая
+    задача отстала; для hash — фиксированный набор партиций по модулю.
+    """
+
+    def __init__(self, engine: AsyncEngine, settings: PartitioningSettings):
+        self.engine = engine
+        self.settings = settings
+        self.table = Order.__tablename__
+        self._stop_event = asyncio.Event()
+
+    def _partition_ddl(self) -> list[str]:
+        if self.settings.MODE == "hash":
+            modulus = self.settings.HASH_PARTITIONS
+            return [
+                f"CREATE TABLE IF NOT EXISTS {self.table}_h{remainder} PARTITION OF {self.table} "
+                f"FOR VALUES WITH (MODULUS {modulus}, REMAINDER {remainder})"
+                for remainder in range(modulus)
+            ]
+
+        current = date.today().replace(day=1)
+        statements = []
+        for offset in range(self.settings.MONTHS_AHEAD + 1):
+            start = _add_months(current, offset)
+            end = _add_months(start, 1)
+            statements.append(
+                f"CREATE TABLE IF NOT EXISTS {self.table}_y{start.year}m{start.month:02d} "
+                f"PARTITION OF {self.table} FOR VALUES FROM ('{start}') TO ('{end}')"
+            )
+        statements.append(
+            f"CREATE TABLE IF NOT EXISTS {self.table}_default PARTITION OF {self.table} DEFAULT"
+        )
+        return statements
+
+    async def ensure_partitions(self) -> None:
+        if self.settings.MODE == "none":
+            return
+        async with self.engine.begin() as conn:
+            # Не даем двум экземплярам сервиса одновременно создавать партиции
+            await conn.execute(text("SELECT pg_advisory_xact_lock(hashtext(:name))"), {"name": self.table})
+            for statement in self._partition_ddl():
+                await conn.execute(text(statement))
+        log.info(f"Partitions of '{self.table}' ensured (mode={self.settings.MODE})")
+
+    async def run(self) -> None:
+        if self.settings.MODE != "range":
+            return
+        log.info("Partition manager started.")
+        while not self._stop_event.is_set():
+            try:
+                await asyncio.wait_for(self._stop_event.wait(), timeout=self.settings.CHECK_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                try:
+                    await self.ensure_partitions()
+                except Exception as e:
+                    log.error(f"Failed to create order partitions: {e}", exc_info=True)
+        log.info("Partition manager stopped.")
+
+    async def stop(self) -> None:
+        self._stop_event.set()
\ No newline at end of file
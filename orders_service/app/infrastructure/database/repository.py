@@ -1,14 +1,45 @@
+import asyncio
 import uuid
+from datetime import datetime, timedelta, timezone
 from decimal import Decimal
-from sqlalchemy import select, update
+from sqlalchemy import delete, exists, func, select, text, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.domain.models import Order as DomainOrder
-from app.domain.repositories import OrderRepository, OutboxRepository
-from app.infrastructure.database.models import Order, OrderStatus, OutboxMessage
+from app.domain.models import Order as DomainOrder, UserOrderStats as DomainUserOrderStats
+from app.domain.repositories import (
+    IdempotencyRepository,
+    OrderRepository,
+    OrderStatsRepository,
+    OutboxRepository,
+)
+from app.infrastructure.archive.store import OrderArchive
+from app.infrastructure.database.models import (
+    IdempotencyKey,
+    Order,
+    OrderStatus,
+    OutboxMessage,
+    UserOrderStats,
+)
+
+# Колонки доменного заказа: чтение идет Core-запросом без ORM-сущностей,
+# а строки из БД уже корректны и не требуют повторной валидации
+ORDER_COLUMNS = (
+    Order.id, Order.user_id, Order.amount,
+    Order.description, Order.status, Order.version,
+)
+
+def _to_domain(row) -> DomainOrder:
+    return DomainOrder.model_construct(**row._mapping)
 
 class SQLAlchemyOrderRepository(OrderRepository):
-    def __init__(self, session: AsyncSession):
+    """
+    Заказы из горячей таблицы orders. Если передан архив, промахи по
+    get_by_id и история пользователя дочитываются из холодного архива.
+    """
+
+    def __init__(self, session: AsyncSession, archive: OrderArchive | None = None):
         self.session = session
+        self.archive = archive
 
     async def create(self, user_id: int, amount: Decimal, description: str) -> DomainOrder:
         db_order = Order(
@@ -22,22 +53,193 @@ class SQLAlchemyOrderRepository(OrderRepository):
         await self.session.refresh(db_order)
         return DomainOrder.model_validate(db_order)
 
+    # Поиск по id не знает created_at: в режиме range get_by_id, get_version и
+    # update_status проверяют все помесячные партиции (по индексу в каждой),
+    # в режиме hash user_id оставляет одну
     async def get_by_id(self, order_id: int, user_id: int) -> DomainOrder | None:
-        stmt = select(Order).where(Order.id == order_id, Order.user_id == user_id)
-        result = await self.session.execute(stmt)
-        db_order = result.scalar_one_or_none()
-        return DomainOrder.model_validate(db_order) if db_order else None
+        stmt = select(*ORDER_COLUMNS).where(Order.id == order_id, Order.user_id == user_id)
+        row = (await self.session.execute(stmt)).first()
+        if row:
+            return _to_domain(row)
+        if self.archive:
+            archived = await asyncio.to_thread(self.archive.get, order_id, user_id)
+            return DomainOrder.model_validate(archived) if archived else None
+        return None
 
-    async def list_by_user_id(self, user_id: int) -> list[DomainOrder]:
-        stmt = select(Order).where(Order.user_id == user_id).order_by(Order.created_at.desc())
+    async def get_version(self, order_id: int, user_id: int) -> int | None:
+        stmt = select(Order.version).where(Order.id == order_id, Order.user_id == user_id)
+        version = await self.session.scalar(stmt)
+        if version is None and self.archive:
+            archived = await asyncio.to_thread(self.archive.get, order_id, user_id)
+            return archived["version"] if archived else None
+        return version
+
+    async def get_list_version(self, user_id: int, since: datetime | None = None) -> tuple[int, int, int]:
+        stmt = select(
+            func.count(Order.id),
+            func.coalesce(func.max(Order.id), 0),
+            func.coalesce(func.sum(Order.version), 0),
+            func.min(Order.id),
+        ).where(*self._user_history_filter(user_id, since))
+        count, max_id, version_sum, min_id = (await self.session.execute(stmt)).one()
+        if self.archive:
+            # Архивные заказы неизменны, но входят в список и его ETag
+            archived = await asyncio.to_thread(self.archive.list_versions, user_id, since)
+            if min_id is not None and any(order_id >= min_id for order_id in archived):
+                # Копии заказов, оставшихся в таблице, исключаются так же, как в
+                # списке. Обычно архивные id меньше любого горячего и запроса нет
+                hot = select(Order.id).where(*self._user_history_filter(user_id, since))
+                hot_ids = set((await self.session.scalars(hot)).all())
+                archived = {order_id: v for order_id, v in archived.items() if order_id not in hot_ids}
+            count += len(archived)
+            max_id = max([max_id, *archived])
+            version_sum += sum(archived.values())
+        return count, max_id, version_sum
+
+    async def _list_archived(self, user_id: int, since: datetime | None, exclude: set[int]) -> list[dict]:
+        archived = await asyncio.to_thread(self.archive.list_by_user, user_id, since)
+        # Заказ может оказаться и в архиве, и в таблице, если архиватор упал
+        # между записью сегмента и удалением строк; горячая копия главнее
+        return [o for o in archived if o["id"] not in exclude]
+
+    @staticmethod
+    def _user_history_filter(user_id: int, since: datetime | None) -> list:
+        # Условие на created_at отсекает старые range-партиции при планировании
+        conditions = [Order.user_id == user_id]
+        if since is not None:
+            if since.tzinfo is not None:
+                # created_at — timestamp без зоны в UTC, asyncpg не сравнит его с aware-датой
+                since = since.astimezone(timezone.utc).replace(tzinfo=None)
+            conditions.append(Order.created_at >= since)
+        return conditions
+
+    async def list_by_user_id(self, user_id: int, since: datetime | None = None) -> list[DomainOrder]:
+        stmt = (
+            select(*ORDER_COLUMNS)
+            .where(*self._user_history_filter(user_id, since))
+            .order_by(Order.created_at.desc())
+        )
         result = await self.session.execute(stmt)
-        orders = [DomainOrder.model_validate(o) for o in result.scalars().all()]
+        orders = [_to_domain(row) for row in result]
+        if not self.archive:
+            return orders
+
+        archived = await self._list_archived(user_id, since, exclude={o.id for o in orders})
+        # Архивные заказы старше любого горячего, поэтому идут в конце
+        archived.sort(key=lambda o: o["created_at"], reverse=True)
+        orders.extend(DomainOrder.model_validate(o) for o in archived)
         return orders
 
-    async def update_status(self, order_id: int, status: OrderStatus) -> bool:
-        stmt = update(Order).where(Order.id == order_id).values(status=status)
+    async def list_archivable(self, created_before: datetime, limit: int) -> list[dict]:
+        """
+        Завершенные заказы старше created_before в виде строк для архива.
+        Строки блокируются до конца транзакции, чтобы удалить ровно их.
+        """
+        stmt = (
+            select(Order)
+            .where(
+                Order.status.in_([OrderStatus.FINISHED, OrderStatus.CANCELLED]),
+                Order.created_at < created_before,
+            )
+            .order_by(Order.created_at)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
         result = await self.session.execute(stmt)
-        return result.rowcount > 0
+        return [
+            {
+                "id": o.id,
+                "user_id": o.user_id,
+                "amount": str(o.amount),
+                "description": o.description,
+                "status": o.status.value,
+                "created_at": o.created_at.isoformat(),
+                "version": o.version,
+                "updated_at": o.updated_at.isoformat(),
+            }
+            for o in result.scalars().all()
+        ]
+
+    async def delete_archived(self, order_ids: list[int], created_before: datetime) -> None:
+        # Условие на created_at оставляет удалению только старые range-партиции
+        stmt = delete(Order).where(Order.id.in_(order_ids), Order.created_at < created_before)
+        await self.session.execute(stmt)
+
+    async def update_status(
+        self, order_id: int, status: OrderStatus, user_id: int | None = None
+    ) -> DomainOrder | None:
+        """
+        Переводит заказ из NEW в итоговый статус. Повторная доставка того же
+        события ничего не меняет и возвращает None — это держит агрегаты точными.
+        user_id позволяет при hash-партиционировании обновлять одну партицию.
+        """
+        conditions = [Order.id == order_id, Order.status == OrderStatus.NEW]
+        if user_id is not None:
+            conditions.append(Order.user_id == user_id)
+        stmt = (
+            update(Order)
+            .where(*conditions)
+            .values(status=status, version=Order.version + 1)
+            .returning(*ORDER_COLUMNS)
+        )
+        row = (await self.session.execute(stmt)).first()
+        return _to_domain(row) if row else None
+
+class SQLAlchemyOrderStatsRepository(OrderStatsRepository):
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def record_created(self, user_id: int) -> None:
+        stmt = pg_insert(UserOrderStats).values(user_id=user_id, new_count=1)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[UserOrderStats.user_id],
+            set_={"new_count": UserOrderStats.new_count + 1, "updated_at": func.now()},
+        )
+        await self.session.execute(stmt)
+
+    async def record_settled(self, user_id: int, amount: Decimal, status: OrderStatus) -> None:
+        values = {"new_count": UserOrderStats.new_count - 1}
+        if status == OrderStatus.FINISHED:
+            values["finished_count"] = UserOrderStats.finished_count + 1
+            values["total_spent"] = UserOrderStats.total_spent + amount
+        else:
+            values["cancelled_count"] = UserOrderStats.cancelled_count + 1
+        stmt = update(UserOrderStats).where(UserOrderStats.user_id == user_id).values(**values)
+        await self.session.execute(stmt)
+
+    async def get(self, user_id: int) -> DomainUserOrderStats:
+        stmt = select(UserOrderStats).where(UserOrderStats.user_id == user_id)
+        stats = await self.session.scalar(stmt)
+        if stats is None:
+            return DomainUserOrderStats(user_id=user_id)
+        return DomainUserOrderStats.model_validate(stats)
+
+    async def rebuild_if_empty(self) -> None:
+        """
+        Заполняет агрегаты по уже существующим заказам, если таблица пуста
+        (первый запуск после появления read-модели). На непустой таблице
+        стоит одной проверки существования строки. На время заполнения
+        запись в orders блокируется: заказы, созданные параллельно другими
+        экземплярами, иначе могли бы посчитаться дважды или сделать таблицу
+        непустой до заполнения.
+        """
+        await self.session.execute(text(f"LOCK TABLE {Order.__tablename__} IN SHARE MODE"))
+        aggregates = (
+            select(
+                Order.user_id,
+                func.count().filter(Order.status == OrderStatus.NEW),
+                func.count().filter(Order.status == OrderStatus.FINISHED),
+                func.count().filter(Order.status == OrderStatus.CANCELLED),
+                func.coalesce(func.sum(Order.amount).filter(Order.status == OrderStatus.FINISHED), 0),
+            )
+            .where(~exists(select(UserOrderStats.user_id)))
+            .group_by(Order.user_id)
+        )
+        stmt = pg_insert(UserOrderStats).from_select(
+            ["user_id", "new_count", "finished_count", "cancelled_count", "total_spent"],
+            aggregates,
+        ).on_conflict_do_nothing(index_elements=[UserOrderStats.user_id])
+        await self.session.execute(stmt)
 
 class SQLAlchemyOutboxRepository(OutboxRepository):
     def __init__(self, session: AsyncSession):
@@ -45,4 +247,67 @@ class SQLAlchemyOutboxRepository(OutboxRepository):
 
     async def add(self, message_id: uuid.UUID, topic: str, payload: dict) -> None:
         db_outbox_msg = OutboxMessage(id=message_id, topic=topic, payload=payload)
-        self.session.add(db_outbox_msg)
\ No newline at end of file
+        self.session.add(db_outbox_msg)
+
+    async def count_unpublished(self, limit: int) -> int:
+        """Число неопубликованных сообщений, но не больше limit: счет по индексу ограничен."""
+        backlog = (
+            select(OutboxMessage.id)
+            .where(OutboxMessage.is_published.is_(False))
+            .limit(limit)
+            .subquery()
+        )
+        return await self.session.scalar(select(func.count()).select_from(backlog))
+
+class SQLAlchemyIdempotencyRepository(IdempotencyRepository):
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def claim(self, key: str, fingerprint: str, ttl_seconds: float) -> tuple[str, dict] | None:
+        """
+        Занимает ключ в текущей транзакции. Возвращает None, если ключ свободен
+        (или истек), иначе (fingerprint, ответ) запроса, занявшего его раньше.
+        Одновременная вставка того же ключа ждет коммита первой транзакции,
+        поэтому чужая строка всегда видна уже с ответом.
+        """
+        stmt = pg_insert(IdempotencyKey).values(
+            key=key,
+            fingerprint=fingerprint,
+            response={},
+            expires_at=func.now() + timedelta(seconds=ttl_seconds),
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[IdempotencyKey.key],
+            set_={
+                "fingerprint": stmt.excluded.fingerprint,
+                "response": stmt.excluded.response,
+                "expires_at": stmt.excluded.expires_at,
+            },
+            where=IdempotencyKey.expires_at < func.now(),
+        ).returning(IdempotencyKey.key)
+        if await self.session.scalar(stmt) is not None:
+            return None
+        stored = await self.session.execute(
+            select(IdempotencyKey.fingerprint, IdempotencyKey.response).where(IdempotencyKey.key == key)
+        )
+        fingerprint, response = stored.one()
+        return fingerprint, response
+
+    async def exists(self, key: str) -> bool:
+        stmt = select(exists().where(IdempotencyKey.key == key, IdempotencyKey.expires_at >= func.now()))
+        return await self.session.scalar(stmt)
+
+    async def save_response(self, key: str, response: dict) -> None:
+        await self.session.execute(
+            update(IdempotencyKey).where(IdempotencyKey.key == key).values(response=response)
+        )
+
+    async def purge_expired(self, limit: int) -> int:
+        expired = (
+            select(IdempotencyKey.key)
+            .where(IdempotencyKey.expires_at < func.now())
+            .limit(limit)
+            .scalar_subquery()
+        )
+        result = await self.session.execute(delete(IdempotencyKey).where(IdempotencyKey.key.in_(expired)))
+        return result.rowcount
\ No newline at end of file
@@ -1,15 +1,40 @@
 from typing import AsyncGenerator
+from sqlalchemy import event
+from sqlalchemy.orm import Session
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from app.core.config import settings
+from app.core.deadline import DeadlineExceeded, remaining_time
+from app.infrastructure.database.instrumentation import instrument_engines
+from app.infrastructure.database.pool import InstrumentedPool, register_pool_metrics
+
+class DeadlineAwareSession(Session):
+    pass
+
+@event.listens_for(DeadlineAwareSession, "after_begin")
+def _apply_request_deadline(session, transaction, connection):
+    """
+    Переносит дедлайн HTTP-запроса в statement_timeout транзакции,
+    чтобы брошенные шлюзом запросы не держали соединения пула.
+    """
+    left = remaining_time()
+    if left is None:
+        return
+    if left <= 0:
+        raise DeadlineExceeded("Request deadline exceeded before touching the database")
+    connection.exec_driver_sql(f"SET LOCAL statement_timeout = {max(1, int(left * 1000))}")
 
 async_engine = create_async_engine(
     settings.db.dsn,
     echo=False,
     pool_size=10,
-    max_overflow=20
+    max_overflow=20,
+    poolclass=InstrumentedPool,
 )
+register_pool_metrics([async_engine])
+instrument_engines([async_engine])
 AsyncSessionLocal = async_sessionmaker(
     bind=async_engine,
     class_=AsyncSession,
+    sync_session_class=DeadlineAwareSession,
     expire_on_commit=False,
 )
\ No newline at end of file
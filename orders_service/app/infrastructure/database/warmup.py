@@ -0,0 +1,63 @@
+"""
+Прогрев пула соединений до приема трафика.
+
+Несколько соединений открываются параллельно, и на каждом в транзакции,
+которая затем откатывается, выполняются запросы горячих путей. asyncpg
+кеширует подготовленные запросы на соединении, SQLAlchemy — скомпилированный
+SQL на движке, поэтому первые настоящие запросы не платят ни за подключение,
+ни за PREPARE. Откат не оставляет данных, но значения последовательностей
+(id заказов) расходуются — в нумерации появляются пропуски.
+"""
+import asyncio
+import logging
+import uuid
+from decimal import Decimal
+from typing import Awaitable, Callable
+
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from app.infrastructure.database.models import OrderStatus
+from app.infrastructure.database.repository import (
+    SQLAlchemyOrderRepository,
+    SQLAlchemyOrderStatsRepository,
+    SQLAlchemyOutboxRepository,
+)
+
+log = logging.getLogger(__name__)
+
+Exercise = Callable[[AsyncSession, int], Awaitable[None]]
+
+async def exercise_hot_statements(session: AsyncSession, user_id: int) -> None:
+    """Запросы создания, чтения и смены статуса заказа для несуществующего пользователя."""
+    orders = SQLAlchemyOrderRepository(session)
+    stats = SQLAlchemyOrderStatsRepository(session)
+    order = await orders.create(user_id, Decimal("0.01"), "warm-up")
+    await stats.record_created(user_id)
+    await SQLAlchemyOutboxRepository(session).add(uuid.uuid4(), "order.created", {})
+    await orders.get_by_id(order.id, user_id)
+    await orders.get_version(order.id, user_id)
+    await orders.list_by_user_id(user_id)
+    await orders.get_list_version(user_id)
+    await orders.update_status(order.id, OrderStatus.FINISHED, user_id=user_id)
+    await stats.record_settled(user_id, order.amount, OrderStatus.FINISHED)
+    await stats.get(user_id)
+    await session.flush()
+
+async def warm_up_pool(engine: AsyncEngine, connections: int, exercise: Exercise) -> None:
+    # Больше pool_size держать бессмысленно: overflow-соединения закрываются при возврате
+    connections = min(connections, engine.pool.size())
+
+    async def warm(index: int) -> None:
+        async with engine.connect() as conn:
+            transaction = await conn.begin()
+            try:
+                session = AsyncSession(bind=conn, expire_on_commit=False)
+                # Отрицательный user_id не бывает у настоящих пользователей, свой
+                # на каждое соединение — чтобы прогревы не ждали блокировок друг друга
+                await exercise(session, -(index + 1))
+                await session.close()
+            finally:
+                await transaction.rollback()
+
+    await asyncio.gather(*(warm(index) for index in range(connections)))
+    log.info(f"Warmed up {connections} database connection(s).")
\ No newline at end of file
@@ -1,79 +1,143 @@
 import asyncio
 import json
+import time
 import uuid
 import logging
 from typing import Callable, Coroutine, Any
 
-import aio_pika
-from aio_pika.abc import (
-    AbstractIncomingMessage,
-    AbstractRobustConnection,
-    AbstractChannel,
-    AbstractQueue,
-)
+from sqlalchemy.exc import DBAPIError, OperationalError, TimeoutError as PoolTimeoutError
 
-from app.core.config import RabbitMQSettings
+from app.core.config import settings
+from app.core.metrics import registry
+from app.core.tracing import (
+    KIND_CONSUMER,
+    PUBLISHED_AT_HEADER,
+    TRACEPARENT_HEADER,
+    parse_traceparent,
+    record_span,
+    start_span,
+)
+from app.infrastructure.database.instrumentation import observe_operation, track_statements
+from app.infrastructure.messaging.bus import IncomingMessage, MessageBus, QueueSpec
 from app.domain.models import OrderStatusUpdate
 
 log = logging.getLogger(__name__)
 
-class RabbitMQConsumer:
+CONSUMER_PROCESSING_SECONDS = registry.histogram(
+    "consumer_processing_seconds", "Время обработки сообщения consumer'ом, включая ack/reject"
+)
+CONSUMER_MESSAGES = registry.counter(
+    "consumer_messages_total", "Обработанные сообщения по исходу (ack/retry/reject)", ["outcome"]
+)
+ACKED = CONSUMER_MESSAGES.labels("ack")
+RETRIED = CONSUMER_MESSAGES.labels("retry")
+REJECTED = CONSUMER_MESSAGES.labels("reject")
+# SQLSTATE ошибок, которые через несколько секунд могут пройти: класс 08 —
+# соединение, 40001/40P01 — сериализация и дедлок, 53300 — нет свободных
+# соединений, 57014 — отмена по statement_timeout, 57P01/57P03 — рестарт сервера
+TRANSIENT_SQLSTATE_CLASSES = ("08",)
+TRANSIENT_SQLSTATES = frozenset({"40001", "40P01", "53300", "57014", "57P01", "57P03"})
+
+def is_transient(error: BaseException) -> bool:
+    """
+    Недоступность БД, исчерпанный пул или конфликт транзакций. asyncpg почти
+    не дает OperationalError: отказ в соединении приходит как OSError, а
+    остальное — как DBAPIError, поэтому смотрим на SQLSTATE исходной ошибки.
+    """
+    if isinstance(error, (OperationalError, PoolTimeoutError, OSError, asyncio.TimeoutError)):
+        return True
+    if not isinstance(error, DBAPIError):
+        return False
+    if error.connection_invalidated:
+        return True
+    sqlstate = getattr(error.orig, "sqlstate", None) or getattr(error.orig, "pgcode", None)
+    if sqlstate is None:
+        return False
+    return sqlstate.startswith(TRANSIENT_SQLSTATE_CLASSES) or sqlstate in TRANSIENT_SQLSTATES
+
+QUEUE = QueueSpec(
+    "order_status_updates_queue",
+    ("payment.processed",),
+    retry_delays=settings.consumer_retry.delays,
+)
+PREFETCH_COUNT = 10
+
+class MessageConsumer:
     def __init__(
         self,
-        settings: RabbitMQSettings,
+        bus: MessageBus,
         on_message_callback: Callable[[OrderStatusUpdate], Coroutine[Any, Any, None]],
     ):
-        self.settings = settings
+        self.bus = bus
         self.on_message_callback = on_message_callback
-        self._connection: AbstractRobustConnection | None = None
-        self._channel: AbstractChannel | None = None
-        self._queue: AbstractQueue | None = None
-        self._consuming_task: asyncio.Task | None = None
+        self._consumer_tag: str | None = None
 
     async def start(self) -> None:
-        self._connection = await aio_pika.connect_robust(self.settings.url)
-        self._channel = await self._connection.channel()
-        await self._channel.set_qos(prefetch_count=10)
-
-        exchange = await self._channel.declare_exchange(
-            "store_exchange", aio_pika.ExchangeType.TOPIC, durable=True
-        )
-        
-        self._queue = await self._channel.declare_queue(
-            "order_status_updates_queue", durable=True
-        )
-        await self._queue.bind(exchange, routing_key="payment.processed")
-
+        await self.bus.declare_queue(QUEUE)
+        self._consumer_tag = await self.bus.consume(QUEUE.name, self._process_message, PREFETCH_COUNT)
         log.info("Consumer for order status updates started.")
-        self._consuming_task = asyncio.create_task(
-            self._queue.consume(self._process_message)
-        )
 
     async def stop(self) -> None:
-        log.info("Stopping RabbitMQ consumer...")
-        if self._consuming_task and not self._consuming_task.done():
-            self._consuming_task.cancel()
-            try:
-                await self._consuming_task
-            except asyncio.CancelledError:
-                log.info("Consuming task successfully cancelled.")
+        log.info("Stopping consumer...")
+        if self._consumer_tag is not None:
+            await self.bus.cancel(self._consumer_tag)
+            self._consumer_tag = None
+        log.info("Consumer stopped.")
 
-        if self._connection and not self._connection.is_closed:
-            await self._connection.close()
-            log.info("RabbitMQ connection closed.")
-        
-        log.info("RabbitMQ consumer stopped.")
+    async def _retry_or_reject(self, message: IncomingMessage, error: Exception) -> None:
+        """Временная ошибка: сообщение ждет в очереди повтора, слот prefetch освобождается сразу."""
+        try:
+            scheduled = await self.bus.retry_later(QUEUE, message)
+        except Exception:
+            log.exception("Failed to schedule a retry, returning the message to the queue.")
+            await message.reject(requeue=True)
+            return
+        if scheduled:
+            log.warning(f"Order status update failed ({error!r}), scheduled for a delayed retry.")
+            RETRIED.inc()
+        else:
+            log.error(f"Order status update failed after all retries ({error!r}). Rejecting.")
+            await message.reject(requeue=False)
+            REJECTED.inc()
 
-    async def _process_message(self, message: AbstractIncomingMessage) -> None:
+    @staticmethod
+    def _trace_parent(message: IncomingMessage):
+        """Контекст трассы из заголовков; время в очереди пишется отдельным спаном."""
+        headers = message.headers or {}
+        parent = parse_traceparent(headers.get(TRACEPARENT_HEADER))
+        published_ns = headers.get(PUBLISHED_AT_HEADER)
+        if parent is not None and isinstance(published_ns, int):
+            record_span(
+                f"queue.wait {message.routing_key}", parent, published_ns, time.time_ns()
+            )
+        return parent
+
+    async def _process_message(self, message: IncomingMessage) -> None:
+        started = time.perf_counter()
         try:
             body = json.loads(message.body.decode())
             update_data = OrderStatusUpdate(
                 order_id=body["order_id"],
+                user_id=body.get("user_id"),
                 status=body["status"],
                 idempotency_key=uuid.UUID(body["idempotency_key"])
             )
-            await self.on_message_callback(update_data)
+            span_attributes = {}
+            with track_statements() as stats, start_span(
+                "order.status_update", self._trace_parent(message),
+                kind=KIND_CONSUMER, attributes=span_attributes,
+            ):
+                await self.on_message_callback(update_data)
+                span_attributes["db.statements"] = stats.count
+            observe_operation(f"message {message.routing_key}", stats)
             await message.ack()
-        except Exception:
+            ACKED.inc()
+        except Exception as e:
+            if is_transient(e):
+                await self._retry_or_reject(message, e)
+                return
             log.exception("Failed to process order status update. Rejecting.")
-            await message.reject(requeue=False)
\ No newline at end of file
+            await message.reject(requeue=False)
+            REJECTED.inc()
+        finally:
+            CONSUMER_PROCESSING_SECONDS.observe(time.perf_counter() - started)
\ No newline at end of file
@@ -1,81 +1,189 @@
 import asyncio
 import logging
 from contextlib import asynccontextmanager
-from fastapi import FastAPI
-from sqlalchemy.exc import OperationalError
-from tenacity import (
-    retry,
-    stop_after_attempt,
-    wait_fixed,
-    retry_if_exception_type,
-    RetryCallState
-)
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
 
+from app.api.admin import router as admin_router
+from app.api.middleware import DeadlineMiddleware, StatementCountMiddleware, TracingMiddleware
+from app.api.responses import FastJSONResponse
 from app.api.v1.router import api_router
 from app.core.config import settings
+from app.core.deadline import DeadlineExceeded
+from app.core.loop_monitor import loop_monitor
+from app.core.metrics import CONTENT_TYPE, registry
+from app.core.readiness import readiness
+from app.core.tracing import exporter
 from app.domain.models import OrderStatusUpdate
 from app.infrastructure.database.models import Base
+from app.infrastructure.database.partitioning import OrderPartitionManager
+from app.infrastructure.database.repository import SQLAlchemyOrderStatsRepository
+from app.infrastructure.database.schema import ensure_schema
 from app.infrastructure.database.session import async_engine, AsyncSessionLocal
-from app.infrastructure.messaging.consumer import RabbitMQConsumer
-from app.infrastructure.messaging.publisher import OutboxPublisher
+from app.infrastructure.database.warmup import exercise_hot_statements, warm_up_pool
+from app.infrastructure.messaging.bus import message_bus
+from app.infrastructure.messaging.consumer import MessageConsumer
+from app.infrastructure.messaging.publisher import OutboxPublisher, register_outbox_metrics
+from app.application.notifications import TooManySubscribers, order_status_notifier
+from app.application.admission import AdmissionRejected, admission_controller
+from app.application.archiver import OrderArchiver
+from app.application.idempotency import IdempotencyKeyPurger, IdempotencyKeyReused
 from app.application.services import OrderService
+from app.infrastructure.archive.store import order_archive
 
 log = logging.getLogger(__name__)
 
 publisher: OutboxPublisher | None = None
-consumer: RabbitMQConsumer | None = None
-
-def _log_on_retry(retry_state: RetryCallState):
-    if retry_state.outcome and retry_state.outcome.failed:
-        log.error(
-            f"Retrying status update, attempt {retry_state.attempt_number} failed.",
-            exc_info=retry_state.outcome.exception()
-        )
+consumer: MessageConsumer | None = None
 
-@retry(
-    stop=stop_after_attempt(3),
-    wait=wait_fixed(1),
-    retry=retry_if_exception_type(OperationalError),
-    retry_error_callback=_log_on_retry
-)
 async def handle_status_update(update_data: OrderStatusUpdate):
-    service = OrderService(session_factory=AsyncSessionLocal)
+    service = OrderService(session_factory=AsyncSessionLocal, notifier=order_status_notifier)
     await service.update_order_status(update_data)
 
+async def backfill_user_stats(conn: AsyncConnection) -> None:
+    # Транзакция и advisory-блокировка шага схемы: экземпляры не заполняют
+    # агрегаты одновременно, а упавшее заполнение повторится при следующем запуске
+    async with AsyncSession(bind=conn, join_transaction_mode="create_savepoint") as session:
+        await SQLAlchemyOrderStatsRepository(session).rebuild_if_empty()
+        await session.commit()
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     global publisher, consumer
     log.info("Orders Service starting up...")
+    readiness.begin()
+
+    # Схема нужна до первого запроса; остальной прогрев идет уже после старта
+    await readiness.step("schema", ensure_schema(async_engine, Base.metadata, after_create=backfill_user_stats))
+    partition_manager = OrderPartitionManager(async_engine, settings.partitioning)
+    await partition_manager.ensure_partitions()
+
+    publisher = OutboxPublisher(AsyncSessionLocal, message_bus)
+    consumer = MessageConsumer(message_bus, handle_status_update)
     
-    async with async_engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
-    
-    publisher = OutboxPublisher(AsyncSessionLocal, settings.rabbitmq)
-    consumer = RabbitMQConsumer(settings.rabbitmq, handle_status_update)
-    
-    publisher_task = asyncio.create_task(publisher.run())
-    consumer_task = asyncio.create_task(consumer.start())
+    partition_task = asyncio.create_task(partition_manager.run())
+    archiver = None
+    admission_task = asyncio.create_task(admission_controller.run())
+    idempotency_purger = IdempotencyKeyPurger(
+        OrderService(session_factory=AsyncSessionLocal).purge_idempotency_keys,
+        settings.idempotency.PURGE_INTERVAL_SECONDS,
+        settings.idempotency.PURGE_BATCH_SIZE,
+    )
+    purger_task = asyncio.create_task(idempotency_purger.run())
+    exporter_task = asyncio.create_task(exporter.run())
+    monitor_task = asyncio.create_task(loop_monitor.run())
+    background_tasks = [partition_task, admission_task, purger_task, exporter_task, monitor_task]
+    if order_archive:
+        await asyncio.to_thread(order_archive.load)
+        archiver = OrderArchiver(
+            OrderService(session_factory=AsyncSessionLocal, archive=order_archive),
+            settings.archive,
+        )
+        background_tasks.append(asyncio.create_task(archiver.run()))
+
+    async def connect_broker() -> None:
+        # Шаги повторяются по отдельности: выполненный не запускается второй раз
+        await readiness.retry_step("broker", message_bus.connect)
+        # Publisher не ждет прогрева БД: сообщения outbox уходят сразу
+        background_tasks.append(asyncio.create_task(publisher.run()))
+        await readiness.retry_step("consumer", consumer.start)
+
+    async def warm_up() -> None:
+        """Прогрев пула и подключение к брокеру параллельно; после них /ready отвечает 200."""
+        await asyncio.gather(
+            readiness.retry_step(
+                "database",
+                lambda: warm_up_pool(async_engine, settings.startup.WARMUP_CONNECTIONS, exercise_hot_statements),
+            ),
+            connect_broker(),
+        )
+        readiness.mark_ready()
+
+    startup_task = asyncio.create_task(warm_up())
 
     yield
 
     log.info("Orders Service shutting down...")
+    startup_task.cancel()
+    await asyncio.gather(startup_task, return_exceptions=True)
     if publisher:
         await publisher.stop()
     if consumer:
         await consumer.stop()
+    await partition_manager.stop()
+    await admission_controller.stop()
+    await idempotency_purger.stop()
+    if archiver:
+        await archiver.stop()
+    await exporter.stop()
+    await loop_monitor.stop()
     
-    await asyncio.gather(publisher_task, consumer_task, return_exceptions=True)
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    await message_bus.close()
     log.info("Background tasks finished.")
 
 app = FastAPI(
     title="Orders Service",
     description="Сервис для управления заказами покупателей.",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse,
 )
 
+register_outbox_metrics([AsyncSessionLocal])
+
+app.add_middleware(DeadlineMiddleware)
+app.add_middleware(TracingMiddleware)
+app.add_middleware(StatementCountMiddleware)
 app.include_router(api_router)
+if settings.profiler.ENABLED:
+    app.include_router(admin_router)
+
+@app.exception_handler(DeadlineExceeded)
+async def deadline_exceeded_handler(request: Request, exc: DeadlineExceeded):
+    return JSONResponse(status_code=504, content={"detail": str(exc)})
+
+@app.exception_handler(TooManySubscribers)
+async def too_many_subscribers_handler(request: Request, exc: TooManySubscribers):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": "5"},
+    )
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+@app.exception_handler(IdempotencyKeyReused)
+async def idempotency_key_reused_handler(request: Request, exc: IdempotencyKeyReused):
+    return JSONResponse(status_code=422, content={"detail": str(exc)})
 
 @app.get("/health")
 def health_check():
-    return {"status": "ok"}
\ No newline at end of file
+    return {"status": "ok"}
+
+@app.get("/ready")
+def readiness_check():
+    """200 после прогрева пула БД и подключения к брокеру, до этого 503."""
+    if not readiness.ready:
+        return JSONResponse(status_code=503, content=readiness.snapshot())
+    return readiness.snapshot()
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return Response(await registry.collect(), media_type=CONTENT_TYPE)
+
+@app.get("/admission")
+def admission_state():
+    return admission_controller.snapshot()
+
+@app.get("/loop")
+def event_loop_state():
+    """Квантили задержки event loop и стеки последних долгих блокировок."""
+    return loop_monitor.snapshot()
\ No newline at end of file
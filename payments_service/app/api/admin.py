@@ -0,0 +1,53 @@
+import secrets
+from typing import Literal
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, status
+from fastapi.responses import PlainTextResponse, Response
+
+from app.core.config import settings
+from app.core.profiler import ProfilerBusy, SamplingProfiler
+
+profiler = SamplingProfiler(interval=settings.profiler.SAMPLE_INTERVAL_SECONDS)
+
+def require_admin_token(x_admin_token: str | None = Header(None)) -> None:
+    expected = settings.profiler.TOKEN
+    # Без настроенного токена эндпоинт закрыт для всех
+    if not expected or not secrets.compare_digest((x_admin_token or "").encode(), expected.encode()):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin token required")
+
+router = APIRouter(prefix="/admin", tags=["admin"], dependencies=[Depends(require_admin_token)])
+
+@router.post(
+    "/profile",
+    responses={
+        200: {"description": "collapsed stacks (text/plain) или дамп pstats"},
+        409: {"description": "Профилирование уже идет"},
+    },
+)
+async def profile(
+    seconds: float = Query(10.0, gt=0, le=settings.profiler.MAX_SECONDS),
+    format: Literal["collapsed", "pstats"] = "collapsed",
+    target: Literal["consumer", "publisher", "proxy"] | None = None,
+):
+    """
+    Профилирует процесс seconds секунд. target оставляет в профиле только
+    стеки нужного компонента (только для collapsed).
+    """
+    try:
+        if format == "pstats":
+            if target:
+                raise HTTPException(
+                    status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                    detail="target is supported only for the collapsed format",
+                )
+            return Response(
+                await profiler.pstats(seconds),
+                media_type="application/octet-stream",
+                headers={"Content-Disposition": 'attachment; filename="profile.pstats"'},
+            )
+        return PlainTextResponse(
+            await profiler.collapsed(seconds, target),
+            headers={"Content-Disposition": 'attachment; filename="profile.collapsed"'},
+        )
+    except ProfilerBusy:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Profiling is already in progress")
\ No newline at end of file
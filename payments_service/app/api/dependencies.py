@@ -1,14 +1,15 @@
 from typing import Annotated
 from fastapi import Depends
 
+from app.application.idempotency import idempotency_cache
 from app.application.services import PaymentService
-from app.infrastructure.database.session import AsyncSessionLocal
+from app.infrastructure.database.session import shard_router
 
 def get_payment_service() -> PaymentService:
     """
-    Создает экземпляр PaymentService, передавая ему фабрику сессий.
-    Сервис будет сам создавать сессии по мере необходимости.
+    Создает экземпляр PaymentService, передавая ему маршрутизатор шардов.
+    Сервис будет сам создавать сессии в шарде пользователя.
     """
-    return PaymentService(session_factory=AsyncSessionLocal)
+    return PaymentService(shards=shard_router, idempotency=idempotency_cache)
 
 PaymentServiceDep = Annotated[PaymentService, Depends(get_payment_service)]
\ No newline at end of file
@@ -0,0 +1,18 @@
+from fastapi import Response, status
+
+def make_etag(*parts: object) -> str:
+    return '"' + "-".join(str(part) for part in parts) + '"'
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Слабое сравнение из If-None-Match: шлюз ослабляет ETag при сжатии."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(
+        candidate.strip().removeprefix("W/") == etag
+        for candidate in if_none_match.split(",")
+    )
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
@@ -0,0 +1,145 @@
+import asyncio
+import json
+import time
+
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.deadline import DEADLINE_HEADER, parse_deadline, request_deadline
+from app.core.tracing import (
+    KIND_SERVER,
+    TRACEPARENT_HEADER,
+    current_span,
+    parse_traceparent,
+    record_span,
+)
+from app.infrastructure.database.instrumentation import (
+    current_statements,
+    observe_operation,
+    track_statements,
+)
+
+class DeadlineMiddleware:
+    """
+    Ограничивает обработку запроса дедлайном из заголовка шлюза.
+    Просроченный запрос отклоняется до обращения к БД, а обработка,
+    не успевшая к дедлайну, отменяется — ее ответ уже никто не прочитает.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        deadline = parse_deadline(Headers(scope=scope).get(DEADLINE_HEADER))
+        if deadline is None:
+            await self.app(scope, receive, send)
+            return
+
+        budget = deadline - time.time()
+        if budget <= 0:
+            await self._reject(send)
+            return
+
+        response_started = False
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        token = request_deadline.set(deadline)
+        try:
+            async with asyncio.timeout(budget):
+                await self.app(scope, receive, send_wrapper)
+        except TimeoutError:
+            if not response_started:
+                await self._reject(send)
+        finally:
+            request_deadline.reset(token)
+
+    @staticmethod
+    async def _reject(send: Send) -> None:
+        body = json.dumps({"detail": "Request deadline exceeded"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 504,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+class TracingMiddleware:
+    """
+    Продолжает трассу из заголовка traceparent: обработка запроса становится
+    серверным спаном, а записи outbox, сделанные внутри, — его потомками.
+    Запросы без заголовка не трассируются.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        parent = parse_traceparent(Headers(scope=scope).get(TRACEPARENT_HEADER))
+        if parent is None:
+            await self.app(scope, receive, send)
+            return
+
+        context = parent.child()
+        token = current_span.set(context)
+        status = 500
+        started = time.time_ns()
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_span.reset(token)
+            route = scope.get("route")
+            attributes = {"http.status_code": status}
+            stats = current_statements.get()
+            if stats is not None:
+                attributes["db.statements"] = stats.count
+            record_span(
+                f"HTTP {scope['method']} {route.path if route else scope['path']}",
+                parent, started, time.time_ns(),
+                kind=KIND_SERVER,
+                attributes=attributes,
+                context=context,
+                error=status >= 500,
+            )
+
+class StatementCountMiddleware:
+    """
+    Считает запросы к БД за HTTP-запрос: гистограмма по маршруту и лог,
+    если их больше порога. Счетчик виден спану запроса (db.statements).
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with track_statements() as stats:
+            await self.app(scope, receive, send)
+        route = scope.get("route")
+        if route is not None:
+            observe_operation(f"HTTP {scope['method']} {route.path}", stats)
\ No newline at end of file
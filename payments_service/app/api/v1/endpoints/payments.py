@@ -1,5 +1,6 @@
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, Header, HTTPException, Response, status
 from app.api.dependencies import PaymentServiceDep
+from app.api.etag import etag_matches, make_etag, not_modified
 from app.api.v1.schemas import AccountCreateRequest, DepositRequest, AccountResponse
 
 router = APIRouter()
@@ -13,22 +14,45 @@ async def create_account(
     except ValueError as e:
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
 
-@router.post("/accounts/deposit", response_model=AccountResponse)
+@router.post(
+    "/accounts/deposit",
+    response_model=AccountResponse,
+    responses={422: {"description": "Idempotency-Key уже использован с другим запросом"}},
+)
 async def deposit_to_account(
-    request: DepositRequest, service: PaymentServiceDep
+    request: DepositRequest,
+    service: PaymentServiceDep,
+    idempotency_key: str | None = Header(None, max_length=255),
 ):
     try:
         return await service.deposit_to_account(
-            user_id=request.user_id, amount=request.amount
+            user_id=request.user_id,
+            amount=request.amount,
+            idempotency_key=idempotency_key,
         )
     except ValueError as e:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
 
-@router.get("/accounts/{user_id}", response_model=AccountResponse)
+@router.get(
+    "/accounts/{user_id}",
+    response_model=AccountResponse,
+    responses={304: {"description": "Счет не изменился"}},
+)
 async def get_account_balance(
-    user_id: int, service: PaymentServiceDep
+    user_id: int,
+    response: Response,
+    service: PaymentServiceDep,
+    if_none_match: str | None = Header(None),
 ):
+    if if_none_match:
+        version = await service.get_account_version(user_id=user_id)
+        if version is not None:
+            etag = make_etag("a", user_id, version)
+            if etag_matches(if_none_match, etag):
+                return not_modified(etag)
     try:
-        return await service.get_account_balance(user_id=user_id)
+        account = await service.get_account_balance(user_id=user_id)
     except ValueError as e:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    response.headers["ETag"] = make_etag("a", user_id, account.version)
+    return account
\ No newline at end of file
@@ -1,22 +1,34 @@
 import logging
 from decimal import Decimal
-from sqlalchemy.ext.asyncio import async_sessionmaker, AsyncSession
 
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.application.idempotency import IdempotencyCache, request_fingerprint
+from app.core.metrics import registry
+from app.core.tracing import outbox_trace
 from app.domain.models import Account, PaymentRequest, PaymentResult
 from app.infrastructure.database.repository import (
     SQLAlchemyAccountRepository,
+    SQLAlchemyIdempotencyRepository,
     SQLAlchemyInboxRepository,
     SQLAlchemyOutboxRepository,
 )
+from app.infrastructure.database.sharding import ShardRouter
 
 log = logging.getLogger(__name__)
 
+INBOX_DUPLICATES = registry.counter(
+    "inbox_duplicates_total", "Повторно доставленные запросы на оплату, отброшенные inbox"
+)
+
 class PaymentService:
-    def __init__(self, session_factory: async_sessionmaker[AsyncSession]):
-        self.session_factory = session_factory
+    def __init__(self, shards: ShardRouter, idempotency: IdempotencyCache | None = None):
+        # Все данные пользователя лежат на одном шарде, им и выбирается сессия
+        self.shards = shards
+        self.idempotency = idempotency
 
     async def create_account(self, user_id: int) -> Account:
-        async with self.session_factory() as session:
+        async with self.shards.session_factory_for(user_id)() as session:
             repo = SQLAlchemyAccountRepository(session)
             async with session.begin():
                 if await repo.get_by_user_id(user_id):
@@ -24,17 +36,44 @@ class PaymentService:
                 account = await repo.create(user_id)
             return account
 
-    async def deposit_to_account(self, user_id: int, amount: Decimal) -> Account:
+    async def deposit_to_account(
+        self, user_id: int, amount: Decimal, idempotency_key: str | None = None
+    ) -> Account:
+        """
+        Пополняет счет. С idempotency_key повтор запроса возвращает результат
+        первого пополнения и не зачисляет сумму второй раз.
+        """
         if amount <= Decimal(0):
             raise ValueError("Deposit amount must be positive")
-        async with self.session_factory() as session:
-            repo = SQLAlchemyAccountRepository(session)
-            async with session.begin():
-                account = await repo.deposit(user_id, amount)
-            return account
+        session_factory = self.shards.session_factory_for(user_id)
+        if idempotency_key is None or self.idempotency is None:
+            async with session_factory() as session:
+                async with session.begin():
+                    return await self._deposit(session, user_id, amount)
+
+        key = f"account.deposit:{user_id}:{idempotency_key}"
+        fingerprint = request_fingerprint(user_id, amount)
+
+        async def execute() -> tuple[str, dict]:
+            # Ключ хранится на шарде пользователя, в одной транзакции с пополнением
+            async with session_factory() as session:
+                idempotency_repo = SQLAlchemyIdempotencyRepository(session)
+                async with session.begin():
+                    stored = await idempotency_repo.claim(key, fingerprint, self.idempotency.ttl_seconds)
+                    if stored is not None:
+                        return stored
+                    account = await self._deposit(session, user_id, amount)
+                    response = account.model_dump(mode="json")
+                    await idempotency_repo.save_response(key, response)
+            return fingerprint, response
+
+        return Account.model_validate(await self.idempotency.run_once(key, fingerprint, execute))
+
+    async def _deposit(self, session: AsyncSession, user_id: int, amount: Decimal) -> Account:
+        return await SQLAlchemyAccountRepository(session).deposit(user_id, amount)
 
     async def get_account_balance(self, user_id: int) -> Account:
-        async with self.session_factory() as session:
+        async with self.shards.session_factory_for(user_id)() as session:
             repo = SQLAlchemyAccountRepository(session)
             async with session.begin():
                 account = await repo.get_by_user_id(user_id)
@@ -42,12 +81,19 @@ class PaymentService:
                     raise ValueError("Account not found")
             return account
 
+    async def get_account_version(self, user_id: int) -> int | None:
+        async with self.shards.session_factory_for(user_id)() as session:
+            repo = SQLAlchemyAccountRepository(session)
+            async with session.begin():
+                return await repo.get_version(user_id)
+
     async def process_payment_request(self, payment_request: PaymentRequest) -> None:
         """
         Обрабатывает запрос на оплату в рамках одной транзакции.
         Создает новую сессию для каждой операции, обеспечивая изоляцию.
         """
-        async with self.session_factory() as session:
+        session_factory = self.shards.session_factory_for(payment_request.user_id)
+        async with session_factory() as session:
             account_repo = SQLAlchemyAccountRepository(session)
             inbox_repo = SQLAlchemyInboxRepository(session)
             outbox_repo = SQLAlchemyOutboxRepository(session)
@@ -59,6 +105,7 @@ class PaymentService:
                     payload=payment_request.model_dump(mode="json"),
                 )
                 if not was_inserted:
+                    INBOX_DUPLICATES.inc()
                     log.info(f"Duplicate payment request for message {payment_request.message_id}. Skipping.")
                     return
 
@@ -70,12 +117,25 @@ class PaymentService:
 
                 result_payload = PaymentResult(
                     order_id=payment_request.order_id,
+                    user_id=payment_request.user_id,
                     status=status,
                     reason=reason,
                 ).model_dump(mode="json")
                 result_payload['idempotency_key'] = str(payment_request.message_id)
+                trace = outbox_trace()
+                if trace:
+                    result_payload['trace'] = trace
 
                 await outbox_repo.add(
                     topic="payment.processed",
                     payload=result_payload,
-                )
\ No newline at end of file
+                )
+
+    async def purge_idempotency_keys(self, limit: int) -> int:
+        purged = 0
+        for session_factory in self.shards.session_factories:
+            async with session_factory() as session:
+                repo = SQLAlchemyIdempotencyRepository(session)
+                async with session.begin():
+                    purged += await repo.purge_expired(limit)
+        return purged
\ No newline at end of file
@@ -1,3 +1,6 @@
+from typing import Literal
+
+from pydantic import BaseModel
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class DatabaseSettings(BaseSettings):
@@ -24,6 +27,56 @@ class RabbitMQSettings(BaseSettings):
     def url(self) -> str:
         return f"amqp://{self.USER}:{self.PASSWORD}@{self.HOST}:{self.PORT}/"
 
+class IdempotencySettings(BaseModel):
+    # Сколько хранится ответ на запрос с Idempotency-Key
+    TTL_SECONDS: float = 24 * 3600
+    CACHE_SIZE: int = 10000
+    PURGE_INTERVAL_SECONDS: float = 600
+    PURGE_BATCH_SIZE: int = 5000
+
+class TracingSettings(BaseModel):
+    # Контекст трассы передается дальше всегда, ENABLED включает запись спанов
+    ENABLED: bool = False
+    PATH: str = "/var/log/traces"
+
+class LoopMonitorSettings(BaseModel):
+    ENABLED: bool = True
+    INTERVAL_SECONDS: float = 0.1
+    # Блокировка loop дольше порога попадает в лог со стеком
+    SLOW_CALLBACK_SECONDS: float = 0.25
+
+class ProfilerSettings(BaseModel):
+    # POST /admin/profile: выключен по умолчанию и требует X-Admin-Token
+    ENABLED: bool = False
+    TOKEN: str = ""
+    MAX_SECONDS: float = 60.0
+    SAMPLE_INTERVAL_SECONDS: float = 0.005
+
+class SQLSettings(BaseModel):
+    SLOW_QUERY_SECONDS: float = 0.2
+    # По умолчанию в лог медленных запросов попадают только типы параметров
+    LOG_BIND_VALUES: bool = False
+    # Запрос или сообщение, сделавшие больше запросов к БД, попадают в лог
+    STATEMENTS_WARN_THRESHOLD: int = 30
+
+class ConsumerRetrySettings(BaseModel):
+    # Попытки после первой при временной ошибке БД; задержка n-й — BASE * MULTIPLIER**(n-1)
+    MAX_ATTEMPTS: int = 3
+    BASE_DELAY_SECONDS: float = 1.0
+    MULTIPLIER: float = 5.0
+
+    @property
+    def delays(self) -> tuple[float, ...]:
+        return tuple(self.BASE_DELAY_SECONDS * self.MULTIPLIER ** n for n in range(self.MAX_ATTEMPTS))
+
+class StartupSettings(BaseModel):
+    # Соединений пула (на шард), прогреваемых до готовности; 0 — без прогрева
+    WARMUP_CONNECTIONS: int = 5
+    # Упавший шаг прогрева (БД, брокер, consumer) повторяется до успеха,
+    # пауза между попытками растет вдвое до RETRY_MAX_DELAY_SECONDS
+    RETRY_BASE_DELAY_SECONDS: float = 1.0
+    RETRY_MAX_DELAY_SECONDS: float = 30.0
+
 class Settings(BaseSettings):
     model_config = SettingsConfigDict(
         env_file=".env",
@@ -32,6 +85,21 @@ class Settings(BaseSettings):
     )
     
     db: DatabaseSettings
+    # Шарды счетов (JSON-список в DB_SHARDS); если пусто — единственный шард db
+    db_shards: list[DatabaseSettings] = []
     rabbitmq: RabbitMQSettings
+    # memory — брокер в памяти процесса (бенчмарки, сервисы в одном процессе)
+    message_bus: Literal["rabbitmq", "memory"] = "rabbitmq"
+    idempotency: IdempotencySettings = IdempotencySettings()
+    tracing: TracingSettings = TracingSettings()
+    loop_monitor: LoopMonitorSettings = LoopMonitorSettings()
+    profiler: ProfilerSettings = ProfilerSettings()
+    sql: SQLSettings = SQLSettings()
+    startup: StartupSettings = StartupSettings()
+    consumer_retry: ConsumerRetrySettings = ConsumerRetrySettings()
+
+    @property
+    def shard_dsns(self) -> list[str]:
+        return [shard.dsn for shard in self.db_shards] or [self.db.dsn]
 
 settings = Settings()
\ No newline at end of file
@@ -0,0 +1,128 @@
+"""
+Здоровье event loop: задержка планирования и зависшие колбэки.
+
+Задача-сэмплер спит interval и меряет, насколько позже она проснулась, —
+это и есть задержка, которую видят все корутины процесса. Сторожевой поток
+следит за меткой последнего пробуждения сэмплера: если loop не отвечает
+дольше slow_threshold, поток снимает стек потока loop через
+sys._current_frames() — в нем виден код, который блокирует loop прямо
+сейчас. Отладочный режим asyncio для этого не нужен, поэтому монитор
+можно держать включенным в проде.
+"""
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+
+from app.core.config import settings
+from app.core.metrics import registry
+
+log = logging.getLogger(__name__)
+
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+QUANTILES = (0.5, 0.9, 0.99, 1.0)
+
+LOOP_LAG = registry.histogram(
+    "event_loop_lag_seconds", "Задержка пробуждения сэмплера относительно расписания", buckets=LAG_BUCKETS
+)
+LOOP_LAG_QUANTILE = registry.gauge(
+    "event_loop_lag_quantile_seconds", "Квантили задержки event loop за последнее окно", ["quantile"]
+)
+LOOP_STALLS = registry.counter(
+    "event_loop_stalls_total", "Блокировки event loop дольше порога медленного колбэка"
+)
+
+class EventLoopMonitor:
+    def __init__(
+        self,
+        enabled: bool = True,
+        interval: float = 0.1,
+        slow_threshold: float = 0.25,
+        window: int = 600,
+        max_reports: int = 20,
+    ):
+        self.enabled = enabled
+        self.interval = interval
+        self.slow_threshold = slow_threshold
+        self._lags: deque[float] = deque(maxlen=window)
+        self.reports: deque[dict] = deque(maxlen=max_reports)
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id: int | None = None
+        self._loop_class = ""
+        self._stop_event = asyncio.Event()
+        self._watchdog_stop = threading.Event()
+
+    def _watchdog(self) -> None:
+        reported_beat = None
+        while not self._watchdog_stop.wait(self.interval):
+            beat = self._heartbeat
+            stalled = time.monotonic() - beat
+            # Один отчет на одну блокировку: стек снимается в ее начале
+            if stalled < self.slow_threshold or beat == reported_beat:
+                continue
+            reported_beat = beat
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame else ""
+            self.reports.append({
+                "detected_at": time.time(),
+                "stalled_seconds": round(stalled, 3),
+                "stack": stack,
+            })
+            log.warning(f"Event loop blocked for {stalled:.3f}s, loop thread stack:\n{stack}")
+
+    def quantiles(self) -> dict[float, float]:
+        ordered = sorted(self._lags)
+        if not ordered:
+            return {}
+        return {q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] for q in QUANTILES}
+
+    async def run(self) -> None:
+        if not self.enabled:
+            return
+        loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._loop_class = f"{type(loop).__module__}.{type(loop).__name__}"
+        self._heartbeat = time.monotonic()
+        watchdog = threading.Thread(target=self._watchdog, name="loop-watchdog", daemon=True)
+        watchdog.start()
+        log.info(f"Event loop monitor started on {self._loop_class}.")
+        while not self._stop_event.is_set():
+            expected = loop.time() + self.interval
+            try:
+                await asyncio.wait_for(self._stop_event.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._heartbeat = time.monotonic()
+            lag = max(0.0, loop.time() - expected)
+            LOOP_LAG.observe(lag)
+            self._lags.append(lag)
+            if lag >= self.slow_threshold:
+                LOOP_STALLS.inc()
+        self._watchdog_stop.set()
+        log.info("Event loop monitor stopped.")
+
+    async def stop(self) -> None:
+        self._stop_event.set()
+
+    def snapshot(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "loop": self._loop_class,
+            "lag_seconds": {str(q): round(lag, 4) for q, lag in self.quantiles().items()},
+            "stalls": list(self.reports),
+        }
+
+loop_monitor = EventLoopMonitor(
+    enabled=settings.loop_monitor.ENABLED,
+    interval=settings.loop_monitor.INTERVAL_SECONDS,
+    slow_threshold=settings.loop_monitor.SLOW_CALLBACK_SECONDS,
+)
+
+def _collect_loop_metrics() -> None:
+    for q, lag in loop_monitor.quantiles().items():
+        LOOP_LAG_QUANTILE.labels(q).set(lag)
+
+registry.add_collector(_collect_loop_metrics)
\ No newline at end of file
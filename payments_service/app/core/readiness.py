@@ -0,0 +1,83 @@
+"""
+Готовность процесса принимать трафик.
+
+/health отвечает, пока процесс жив, а /ready — только после прогрева пула
+соединений с БД и подключения к брокеру. Балансировщик и оркестратор
+направляют трафик по /ready. Упавший шаг прогрева повторяется с растущей
+паузой, пока не выполнится: процесс без consumer'а и publisher'а не остается
+навсегда неготовым, даже если его некому перезапустить.
+"""
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, TypeVar
+
+from app.core.config import settings
+from app.core.metrics import registry
+
+log = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+SERVICE_READY = registry.gauge("service_ready", "1 — процесс прогрет и принимает трафик")
+STARTUP_STEP_SECONDS = registry.gauge(
+    "startup_step_duration_seconds", "Длительность шагов запуска", ["step"]
+)
+TIME_TO_READY = registry.gauge("startup_time_to_ready_seconds", "Время от начала запуска до готовности")
+STARTUP_STEP_FAILURES = registry.counter(
+    "startup_step_failures_total", "Неудачные попытки шагов запуска", ["step"]
+)
+
+class Readiness:
+    def __init__(self):
+        self.ready = False
+        self.error: str | None = None
+        self.steps: dict[str, float] = {}
+        self.time_to_ready: float | None = None
+        self._started = time.monotonic()
+
+    def begin(self) -> None:
+        self._started = time.monotonic()
+
+    async def step(self, name: str, awaitable: Awaitable[T]) -> T:
+        """Выполняет шаг запуска и запоминает его длительность."""
+        started = time.monotonic()
+        try:
+            return await awaitable
+        finally:
+            elapsed = time.monotonic() - started
+            self.steps[name] = round(elapsed, 3)
+            STARTUP_STEP_SECONDS.labels(name).set(elapsed)
+
+    async def retry_step(self, name: str, action: Callable[[], Awaitable[T]]) -> T:
+        """Выполняет шаг запуска, повторяя его после ошибок с паузой, растущей вдвое."""
+        delay = settings.startup.RETRY_BASE_DELAY_SECONDS
+        attempt = 1
+        while True:
+            try:
+                return await self.step(name, action())
+            except Exception as e:
+                self.error = f"{name}: {type(e).__name__}: {e}"
+                STARTUP_STEP_FAILURES.labels(name).inc()
+                log.warning(f"Startup step {name} failed (attempt {attempt}), retrying in {delay:.1f}s: {e}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, settings.startup.RETRY_MAX_DELAY_SECONDS)
+            attempt += 1
+
+    def mark_ready(self) -> None:
+        self.ready = True
+        self.error = None
+        self.time_to_ready = time.monotonic() - self._started
+        SERVICE_READY.set(1)
+        TIME_TO_READY.set(self.time_to_ready)
+        log.info(f"Service is ready in {self.time_to_ready:.3f}s, steps: {self.steps}")
+
+    def snapshot(self) -> dict:
+        return {
+            "ready": self.ready,
+            "time_to_ready_seconds": round(self.time_to_ready, 3) if self.time_to_ready is not None else None,
+            "steps": self.steps,
+            "error": self.error,
+        }
+
+readiness = Readiness()
\ No newline at end of file
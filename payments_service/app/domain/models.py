@@ -8,6 +8,7 @@ class Account(BaseModel):
     id: int
     user_id: int
     balance: Decimal
+    version: int = 1
 
 class PaymentRequest(BaseModel):
     message_id: uuid.UUID
@@ -17,5 +18,6 @@ class PaymentRequest(BaseModel):
 
 class PaymentResult(BaseModel):
     order_id: int
+    user_id: int
     status: str
     reason: str | None = None
\ No newline at end of file
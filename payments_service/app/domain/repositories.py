@@ -10,6 +10,8 @@ class AccountRepository(ABC):
     @abstractmethod
     async def get_by_user_id(self, user_id: int) -> Account | None: ...
     @abstractmethod
+    async def get_version(self, user_id: int) -> int | None: ...
+    @abstractmethod
     async def deposit(self, user_id: int, amount: Decimal) -> Account: ...
     @abstractmethod
     async def withdraw(self, user_id: int, amount: Decimal) -> bool: ...
@@ -21,4 +23,17 @@ class InboxRepository(ABC):
 
 class OutboxRepository(ABC):
     @abstractmethod
-    async def add(self, topic: str, payload: dict) -> None: ...
\ No newline at end of file
+    async def add(self, topic: str, payload: dict) -> None: ...
+
+class IdempotencyRepository(ABC):
+    @abstractmethod
+    async def claim(self, key: str, fingerprint: str, ttl_seconds: float) -> tuple[str, dict] | None:
+        ...
+
+    @abstractmethod
+    async def save_response(self, key: str, response: dict) -> None:
+        ...
+
+    @abstractmethod
+    async def purge_expired(self, limit: int) -> int:
+        ...
\ No newline at end of file
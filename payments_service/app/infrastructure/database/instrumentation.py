@@ -0,0 +1,133 @@
+"""
+Инструментирование SQL через события SQLAlchemy.
+
+Каждое выполнение на курсоре — один round-trip в PostgreSQL. Для него
+замеряется время (гистограмма по нормализованному тексту запроса),
+медленные запросы пишутся в лог с замаскированными параметрами, а счетчик
+в ContextVar считает запросы текущего HTTP-запроса или сообщения.
+"""
+import logging
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Iterator
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.core.config import settings
+from app.core.metrics import registry
+
+log = logging.getLogger(__name__)
+
+STATEMENT_SECONDS = registry.histogram(
+    "db_statement_duration_seconds", "Время выполнения SQL-запроса по нормализованному тексту", ["statement"]
+)
+STATEMENT_ERRORS = registry.counter("db_statement_errors_total", "SQL-запросы, завершившиеся ошибкой")
+OPERATION_STATEMENTS = registry.histogram(
+    "db_statements_per_operation", "SQL-запросов на HTTP-запрос или обработку сообщения", ["operation"],
+    buckets=(1, 2, 3, 5, 8, 13, 21, 34, 55, 89),
+)
+MAX_LABEL_LENGTH = 200
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w$])-?\d+(?:\.\d+)?\b")
+_PARAM = re.compile(r"\$\d+|%\(\w+\)s")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_ROWS = re.compile(r"(\((?:\?, )*\?\))(?:, \((?:\?, )*\?\))+")
+_SPACES = re.compile(r"\s+")
+
+@lru_cache(maxsize=2048)
+def normalize_sql(statement: str) -> str:
+    """Текст запроса без литералов и с одинаковыми плейсхолдерами: одна серия на форму запроса."""
+    sql = _SPACES.sub(" ", statement).strip()
+    sql = _STRING.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = _PARAM.sub("?", sql)
+    sql = _ROWS.sub(r"\1, ...", sql)
+    sql = _IN_LIST.sub("(?...)", sql)
+    return sql[:MAX_LABEL_LENGTH]
+
+def redact(parameters) -> object:
+    """Значения параметров заменяются их типами, если LOG_BIND_VALUES не включен."""
+    if settings.sql.LOG_BIND_VALUES:
+        return parameters
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (dict, list, tuple)):
+            return f"<{len(parameters)} parameter sets>"
+        return [type(value).__name__ for value in parameters]
+    return type(parameters).__name__
+
+@dataclass
+class StatementStats:
+    count: int = 0
+    seconds: float = 0.0
+    # Тексты запросов копятся только для assert_max_statements
+    statements: list[str] | None = None
+
+    def record(self, statement: str, elapsed: float) -> None:
+        self.count += 1
+        self.seconds += elapsed
+        if self.statements is not None:
+            self.statements.append(normalize_sql(statement))
+
+current_statements: ContextVar[StatementStats | None] = ContextVar("current_statements", default=None)
+
+@contextmanager
+def track_statements(keep_statements: bool = False) -> Iterator[StatementStats]:
+    """Считает SQL-запросы блока: HTTP-запроса, обработки сообщения, операции в тесте."""
+    stats = StatementStats(statements=[] if keep_statements else None)
+    token = current_statements.set(stats)
+    try:
+        yield stats
+    finally:
+        current_statements.reset(token)
+
+def observe_operation(operation: str, stats: StatementStats) -> None:
+    """Фиксирует число round-trip операции; слишком много — повод для лога."""
+    if not stats.count:
+        return
+    OPERATION_STATEMENTS.labels(operation).observe(stats.count)
+    if stats.count > settings.sql.STATEMENTS_WARN_THRESHOLD:
+        log.warning(
+            f"{operation} executed {stats.count} SQL statements ({stats.seconds * 1000:.1f} ms in DB)"
+        )
+
+@contextmanager
+def assert_max_statements(limit: int) -> Iterator[StatementStats]:
+    """
+    Для тестов: падает, если операция внутри блока сделала больше limit
+    запросов к БД. Ловит лишние round-trip (refresh после flush, N+1).
+    """
+    with track_statements(keep_statements=True) as stats:
+        yield stats
+    if stats.count > limit:
+        listing = "\n".join(f"  {i}. {sql}" for i, sql in enumerate(stats.statements, 1))
+        raise AssertionError(f"Expected at most {limit} SQL statements, executed {stats.count}:\n{listing}")
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._query_started = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context._query_started
+    normalized = normalize_sql(statement)
+    STATEMENT_SECONDS.labels(normalized).observe(elapsed)
+    stats = current_statements.get()
+    if stats is not None:
+        stats.record(statement, elapsed)
+    if elapsed >= settings.sql.SLOW_QUERY_SECONDS:
+        log.warning(f"Slow query ({elapsed * 1000:.1f} ms): {normalized} params={redact(parameters)}")
+
+def _handle_error(exception_context):
+    STATEMENT_ERRORS.inc()
+
+def instrument_engines(engines: list[AsyncEngine]) -> None:
+    for engine in engines:
+        event.listen(engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(engine.sync_engine, "handle_error", _handle_error)
\ No newline at end of file
@@ -2,7 +2,7 @@ import uuid
 from datetime import datetime
 from decimal import Decimal
 
-from sqlalchemy import func, text, Numeric, Index
+from sqlalchemy import func, text, Numeric, String, Index
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 from sqlalchemy.dialects.postgresql import JSONB, UUID
 
@@ -17,6 +17,9 @@ class Account(Base):
         Numeric(18, 2), server_default=text("0.00"), nullable=False
     )
     created_at: Mapped[datetime] = mapped_column(server_default=func.now())
+    # Версия строки для ETag: увеличивается при каждом изменении баланса
+    version: Mapped[int] = mapped_column(default=1, server_default=text("1"))
+    updated_at: Mapped[datetime] = mapped_column(server_default=func.now(), onupdate=func.now())
 
 class InboxMessage(Base):
     __tablename__ = "inbox_messages"
@@ -45,4 +48,12 @@ class OutboxMessage(Base):
             'created_at',
             postgresql_where=is_published.is_(False)
         ),
-    )
\ No newline at end of file
+    )
+
+class IdempotencyKey(Base):
+    """Ответы на запросы с заголовком Idempotency-Key, хранятся до expires_at."""
+    __tablename__ = "idempotency_keys"
+    key: Mapped[str] = mapped_column(String(300), primary_key=True)
+    fingerprint: Mapped[str] = mapped_column(String(64))
+    response: Mapped[dict] = mapped_column(JSONB)
+    expires_at: Mapped[datetime] = mapped_column(index=True)
\ No newline at end of file
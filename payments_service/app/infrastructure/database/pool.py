@@ -0,0 +1,37 @@
+import time
+
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from app.core.metrics import registry
+
+POOL_WAIT = registry.histogram(
+    "db_pool_wait_seconds", "Время ожидания соединения из пула SQLAlchemy"
+)
+POOL_CHECKED_OUT = registry.gauge(
+    "db_pool_checked_out", "Соединения, выданные из пула", ["shard"]
+)
+POOL_OVERFLOW = registry.gauge(
+    "db_pool_overflow", "Соединения сверх pool_size (отрицательно — недобор до pool_size)", ["shard"]
+)
+POOL_SIZE = registry.gauge("db_pool_size", "Размер пула (pool_size)", ["shard"])
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """Пул, замеряющий время получения соединения, включая ожидание в очереди."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            POOL_WAIT.observe(time.perf_counter() - started)
+
+def register_pool_metrics(engines: list[AsyncEngine]) -> None:
+    def collect() -> None:
+        for shard, engine in enumerate(engines):
+            pool = engine.pool
+            POOL_CHECKED_OUT.labels(shard).set(pool.checkedout())
+            POOL_OVERFLOW.labels(shard).set(pool.overflow())
+            POOL_SIZE.labels(shard).set(pool.size())
+
+    registry.add_collector(collect)
\ No newline at end of file
@@ -1,11 +1,18 @@
 import uuid
+from datetime import timedelta
 from decimal import Decimal
-from sqlalchemy import select, update
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.domain.models import Account as DomainAccount
-from app.domain.repositories import AccountRepository, InboxRepository, OutboxRepository
-from app.infrastructure.database.models import Account, InboxMessage, OutboxMessage
+from app.domain.repositories import (
+    AccountRepository,
+    IdempotencyRepository,
+    InboxRepository,
+    OutboxRepository,
+)
+from app.infrastructure.database.models import Account, IdempotencyKey, InboxMessage, OutboxMessage
 
 class SQLAlchemyAccountRepository(AccountRepository):
     def __init__(self, session: AsyncSession):
@@ -24,6 +31,10 @@ class SQLAlchemyAccountRepository(AccountRepository):
         db_account = result.scalar_one_or_none()
         return DomainAccount.model_validate(db_account) if db_account else None
 
+    async def get_version(self, user_id: int) -> int | None:
+        stmt = select(Account.version).where(Account.user_id == user_id)
+        return await self.session.scalar(stmt)
+
     async def deposit(self, user_id: int, amount: Decimal) -> DomainAccount:
         stmt = select(Account).where(Account.user_id == user_id).with_for_update()
         account = await self.session.scalar(stmt)
@@ -31,6 +42,7 @@ class SQLAlchemyAccountRepository(AccountRepository):
             raise ValueError("Account not found")
 
         account.balance += amount
+        account.version += 1
         await self.session.flush()
         await self.session.refresh(account)
 
@@ -44,6 +56,7 @@ class SQLAlchemyAccountRepository(AccountRepository):
             return False
 
         account.balance -= amount
+        account.version += 1
         await self.session.flush()
         return True
 
@@ -67,4 +80,53 @@ class SQLAlchemyOutboxRepository(OutboxRepository):
 
     async def add(self, topic: str, payload: dict) -> None:
         db_outbox_msg = OutboxMessage(topic=topic, payload=payload)
-        self.session.add(db_outbox_msg)
\ No newline at end of file
+        self.session.add(db_outbox_msg)
+
+class SQLAlchemyIdempotencyRepository(IdempotencyRepository):
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def claim(self, key: str, fingerprint: str, ttl_seconds: float) -> tuple[str, dict] | None:
+        """
+        Занимает ключ в текущей транзакции. Возвращает None, если ключ свободен
+        (или истек), иначе (fingerprint, ответ) запроса, занявшего его раньше.
+        Одновременная вставка того же ключа ждет коммита первой транзакции,
+        поэтому чужая строка всегда видна уже с ответом.
+        """
+        stmt = pg_insert(IdempotencyKey).values(
+            key=key,
+            fingerprint=fingerprint,
+            response={},
+            expires_at=func.now() + timedelta(seconds=ttl_seconds),
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[IdempotencyKey.key],
+            set_={
+                "fingerprint": stmt.excluded.fingerprint,
+                "response": stmt.excluded.response,
+                "expires_at": stmt.excluded.expires_at,
+            },
+            where=IdempotencyKey.expires_at < func.now(),
+        ).returning(IdempotencyKey.key)
+        if await self.session.scalar(stmt) is not None:
+            return None
+        stored = await self.session.execute(
+            select(IdempotencyKey.fingerprint, IdempotencyKey.response).where(IdempotencyKey.key == key)
+        )
+        fingerprint, response = stored.one()
+        return fingerprint, response
+
+    async def save_response(self, key: str, response: dict) -> None:
+        await self.session.execute(
+            update(IdempotencyKey).where(IdempotencyKey.key == key).values(response=response)
+        )
+
+    async def purge_expired(self, limit: int) -> int:
+        expired = (
+            select(IdempotencyKey.key)
+            .where(IdempotencyKey.expires_at < func.now())
+            .limit(limit)
+            .scalar_subquery()
+        )
+        result = await self.session.execute(delete(IdempotencyKey).where(IdempotencyKey.key.in_(expired)))
+        return result.rowcount
\ No newline at end of file
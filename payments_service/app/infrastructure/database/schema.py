@@ -0,0 +1,79 @@
+"""
+Проверка схемы по отпечатку вместо create_all на каждом старте.
+
+Отпечаток — sha256 от DDL всех таблиц и индексов метаданных в диалекте
+PostgreSQL. Он хранится в таблице schema_version; если совпадает, запуск
+обходится одним SELECT без рефлексии каталога. Иначе под advisory-блокировкой
+выполняется create_all и записывается новый отпечаток. Шаг after_create
+(например, заполнение новой таблицы) выполняется в той же транзакции: если он
+упадет, отпечаток не запишется и следующий запуск повторит все заново.
+"""
+import hashlib
+import logging
+from typing import Awaitable, Callable
+
+from sqlalchemy import MetaData, text
+from sqlalchemy.exc import ProgrammingError
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+log = logging.getLogger(__name__)
+
+SCHEMA_TABLE = "schema_version"
+
+SchemaStep = Callable[[AsyncConnection], Awaitable[None]]
+
+def schema_fingerprint(metadata: MetaData, engine: AsyncEngine) -> str:
+    digest = hashlib.sha256()
+    for table in metadata.sorted_tables:
+        digest.update(str(CreateTable(table).compile(dialect=engine.dialect)).encode())
+        for index in sorted(table.indexes, key=lambda index: index.name or ""):
+            digest.update(str(CreateIndex(index).compile(dialect=engine.dialect)).encode())
+    return digest.hexdigest()
+
+async def _stored_fingerprint(engine: AsyncEngine) -> str | None:
+    async with engine.connect() as conn:
+        try:
+            return await conn.scalar(text(f"SELECT fingerprint FROM {SCHEMA_TABLE} WHERE id = 1"))
+        except ProgrammingError:
+            # Таблицы еще нет: первый запуск на пустой базе
+            return None
+
+async def ensure_schema(engine: AsyncEngine, metadata: MetaData, after_create: SchemaStep | None = None) -> bool:
+    """Приводит схему к метаданным, если отпечаток изменился. True — схема менялась."""
+    fingerprint = schema_fingerprint(metadata, engine)
+    if await _stored_fingerprint(engine) == fingerprint:
+        log.info(f"Schema is up to date (fingerprint {fingerprint[:12]}).")
+        return False
+
+    async with engine.begin() as conn:
+        # Экземпляры, стартующие одновременно, применяют схему по очереди
+        await conn.execute(text("SELECT pg_advisory_xact_lock(hashtext(:name))"), {"name": SCHEMA_TABLE})
+        await conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {SCHEMA_TABLE} ("
+            "id smallint PRIMARY KEY CHECK (id = 1), "
+            "fingerprint text NOT NULL, "
+            "updated_at timestamptz NOT NULL DEFAULT now())"
+        ))
+        stored = await conn.scalar(text(f"SELECT fingerprint FROM {SCHEMA_TABLE} WHERE id = 1"))
+        if stored == fingerprint:
+            return False
+        await conn.run_sync(metadata.create_all)
+        if after_create is not None:
+            await after_create(conn)
+        await conn.execute(
+            text(
+                f"INSERT INTO {SCHEMA_TABLE} (id, fingerprint) VALUES (1, :fingerprint) "
+                "ON CONFLICT (id) DO UPDATE SET fingerprint = EXCLUDED.fingerprint, updated_at = now()"
+            ),
+            {"fingerprint": fingerprint},
+        )
+    if stored is None:
+        log.info(f"Schema created (fingerprint {fingerprint[:12]}).")
+    else:
+        # create_all только добавляет недостающие таблицы и индексы
+        log.warning(
+            f"Schema fingerprint changed {stored[:12]} -> {fingerprint[:12]}: missing tables and indexes "
+            "were created, changes to existing tables need a migration."
+        )
+    return True
\ No newline at end of file
@@ -1,14 +1,31 @@
-from typing import AsyncGenerator
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy import event
+from sqlalchemy.orm import Session
 from app.core.config import settings
+from app.core.deadline import DeadlineExceeded, remaining_time
+from app.infrastructure.database.instrumentation import instrument_engines
+from app.infrastructure.database.pool import InstrumentedPool, register_pool_metrics
+from app.infrastructure.database.sharding import ShardRouter
 
-async_engine = create_async_engine(settings.db.dsn, echo=False)
-AsyncSessionLocal = async_sessionmaker(
-    bind=async_engine,
-    class_=AsyncSession,
-    expire_on_commit=False,
-)
+class DeadlineAwareSession(Session):
+    pass
+
+@event.listens_for(DeadlineAwareSession, "after_begin")
+def _apply_request_deadline(session, transaction, connection):
+    """
+    Переносит дедлайн HTTP-запроса в statement_timeout транзакции,
+    чтобы брошенные шлюзом запросы не держали соединения пула.
+    """
+    left = remaining_time()
+    if left is None:
+        return
+    if left <= 0:
+        raise DeadlineExceeded("Request deadline exceeded before touching the database")
+    connection.exec_driver_sql(f"SET LOCAL statement_timeout = {max(1, int(left * 1000))}")
 
-async def get_db_session() -> AsyncGenerator[AsyncSession, None]:
-    async with AsyncSessionLocal() as session:
-        yield session
\ No newline at end of file
+shard_router = ShardRouter(
+    settings.shard_dsns,
+    sync_session_class=DeadlineAwareSession,
+    poolclass=InstrumentedPool,
+)
+register_pool_metrics(shard_router.engines)
+instrument_engines(shard_router.engines)
\ No newline at end of file
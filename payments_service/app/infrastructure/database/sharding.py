@@ -0,0 +1,56 @@
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
+from sqlalchemy.orm import Session
+
+def jump_consistent_hash(key: int, buckets: int) -> int:
+    """
+    Jump consistent hash (Lamping, Veach): при добавлении шарда на новое
+    место переезжает только ~1/N пользователей, а не почти все, как при key % N.
+    """
+    key &= 0xFFFFFFFFFFFFFFFF
+    bucket, candidate = -1, 0
+    while candidate < buckets:
+        bucket = candidate
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        candidate = int((bucket + 1) * (float(1 << 31) / float((key >> 33) + 1)))
+    return bucket
+
+class ShardRouter:
+    """
+    Движки и фабрики сессий по шардам БД платежей. Счет, его inbox и outbox
+    живут на шарде пользователя, поэтому любая транзакция — в одном шарде.
+    """
+
+    def __init__(self, dsns: list[str], sync_session_class: type[Session] = Session, **engine_kwargs):
+        if not dsns:
+            raise ValueError("At least one database shard is required")
+        self.engines: list[AsyncEngine] = [
+            create_async_engine(dsn, echo=False, **engine_kwargs) for dsn in dsns
+        ]
+        self.session_factories: list[async_sessionmaker[AsyncSession]] = [
+            async_sessionmaker(
+                bind=engine,
+                class_=AsyncSession,
+                sync_session_class=sync_session_class,
+                expire_on_commit=False,
+            )
+            for engine in self.engines
+        ]
+
+    @property
+    def shard_count(self) -> int:
+        return len(self.engines)
+
+    def shard_for(self, user_id: int) -> int:
+        return jump_consistent_hash(user_id, self.shard_count)
+
+    def session_factory_for(self, user_id: int) -> async_sessionmaker[AsyncSession]:
+        return self.session_factories[self.shard_for(user_id)]
+
+    async def dispose(self) -> None:
+        for engine in self.engines:
+            await engine.dispose()
\ No newline at end of file
@@ -0,0 +1,58 @@
+"""
+Прогрев пулов соединений шардов до приема трафика.
+
+Несколько соединений каждого шарда открываются параллельно, и на каждом в
+транзакции, которая затем откатывается, выполняются запросы горячих путей.
+asyncpg кеширует подготовленные запросы на соединении, SQLAlchemy —
+скомпилированный SQL на движке, поэтому первые настоящие запросы не платят
+ни за подключение, ни за PREPARE. Откат не оставляет данных, но значения
+последовательностей (id счетов) расходуются.
+"""
+import asyncio
+import logging
+import uuid
+from decimal import Decimal
+from typing import Awaitable, Callable
+
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from app.infrastructure.database.repository import (
+    SQLAlchemyAccountRepository,
+    SQLAlchemyInboxRepository,
+    SQLAlchemyOutboxRepository,
+)
+
+log = logging.getLogger(__name__)
+
+Exercise = Callable[[AsyncSession, int], Awaitable[None]]
+
+async def exercise_hot_statements(session: AsyncSession, user_id: int) -> None:
+    """Запросы счета, пополнения и оплаты заказа для несуществующего пользователя."""
+    accounts = SQLAlchemyAccountRepository(session)
+    await accounts.create(user_id)
+    await accounts.get_by_user_id(user_id)
+    await accounts.get_version(user_id)
+    await accounts.deposit(user_id, Decimal("0.01"))
+    await SQLAlchemyInboxRepository(session).add(uuid.uuid4(), "order.created", {})
+    await accounts.withdraw(user_id, Decimal("0.01"))
+    await SQLAlchemyOutboxRepository(session).add("payment.processed", {})
+    await session.flush()
+
+async def warm_up_pool(engine: AsyncEngine, connections: int, exercise: Exercise) -> None:
+    # Больше pool_size держать бессмысленно: overflow-соединения закрываются при возврате
+    connections = min(connections, engine.pool.size())
+
+    async def warm(index: int) -> None:
+        async with engine.connect() as conn:
+            transaction = await conn.begin()
+            try:
+                session = AsyncSession(bind=conn, expire_on_commit=False)
+                # Отрицательный user_id не бывает у настоящих пользователей, свой
+                # на каждое соединение — чтобы прогревы не ждали блокировок друг друга
+                await exercise(session, -(index + 1))
+                await session.close()
+            finally:
+                await transaction.rollback()
+
+    await asyncio.gather(*(warm(index) for index in range(connections)))
+    log.info(f"Warmed up {connections} database connection(s).")
\ No newline at end of file
@@ -0,0 +1,467 @@
+"""
+Шина сообщений: интерфейс, через который publisher outbox и consumer'ы
+общаются с брокером, и две реализации.
+
+AioPikaMessageBus — RabbitMQ, как раньше: topic-обменник store_exchange,
+постоянные сообщения, publisher confirms, dead-letter через fanout-обменник.
+InMemoryMessageBus — брокер в памяти процесса с той же семантикой
+(маршрутизация по шаблонам topic, ack/reject, prefetch, dead-letter, TTL,
+повторная доставка с redelivered): для бенчмарков и для запуска сервисов
+в одном процессе без RabbitMQ.
+
+Отложенные повторы: у очереди с retry_delays на каждую задержку есть своя
+очередь ожидания без consumer'ов, с x-message-ttl и dead-letter через
+обменник по умолчанию обратно в исходную очередь. Сообщение, которое не
+удалось обработать из-за временной ошибки, перекладывается в очередь
+ожидания следующей попытки и сразу подтверждается — слот prefetch не
+занят на время задержки. Возврат идет через обменник по умолчанию, а не
+через store_exchange: повторная публикация по исходному ключу досталась бы
+и другим очередям, привязанным к тому же ключу.
+"""
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from collections import deque
+from dataclasses import dataclass, replace
+from functools import lru_cache
+from itertools import count
+from typing import Awaitable, Callable
+
+import aio_pika
+from aio_pika.abc import AbstractChannel, AbstractIncomingMessage, AbstractQueue, AbstractRobustConnection
+from tenacity import retry, stop_after_attempt, wait_fixed
+
+from app.core.config import settings
+
+log = logging.getLogger(__name__)
+
+EXCHANGE_NAME = "store_exchange"
+# Обменник по умолчанию: ключ маршрутизации — имя очереди
+DEFAULT_EXCHANGE = ""
+RETRY_ATTEMPT_HEADER = "x-retry-attempt"
+ORIGINAL_ROUTING_KEY_HEADER = "x-original-routing-key"
+
+@dataclass(frozen=True)
+class QueueSpec:
+    name: str
+    routing_keys: tuple[str, ...]
+    # Отклоненные без requeue сообщения уходят в fanout-обменник и его очередь
+    dead_letter_exchange: str | None = None
+    dead_letter_queue: str | None = None
+    # Ключ для dead-letter через обменник по умолчанию (имя очереди назначения)
+    dead_letter_routing_key: str | None = None
+    # Время жизни сообщения в очереди, после него — dead-letter
+    message_ttl: float | None = None
+    # Задержки отложенных повторов (сек), по одной очереди ожидания на каждую
+    retry_delays: tuple[float, ...] = ()
+
+    def retry_queue(self, attempt: int) -> "QueueSpec":
+        """Очередь ожидания перед попыткой attempt + 1; имя зависит от задержки, а не от номера."""
+        delay = self.retry_delays[attempt]
+        return QueueSpec(
+            f"{self.name}.retry.{int(delay * 1000)}ms",
+            (),
+            dead_letter_exchange=DEFAULT_EXCHANGE,
+            dead_letter_routing_key=self.name,
+            message_ttl=delay,
+        )
+
+class IncomingMessage(ABC):
+    body: bytes
+    headers: dict
+    # После отложенного повтора — исходный ключ, а не имя очереди
+    routing_key: str
+    redelivered: bool
+
+    @abstractmethod
+    async def ack(self) -> None: ...
+
+    @abstractmethod
+    async def reject(self, requeue: bool = False) -> None: ...
+
+MessageCallback = Callable[[IncomingMessage], Awaitable[None]]
+
+class MessageBus(ABC):
+    @abstractmethod
+    async def connect(self) -> None: ...
+
+    @abstractmethod
+    async def close(self) -> None: ...
+
+    @abstractmethod
+    async def declare_queue(self, spec: QueueSpec) -> None: ...
+
+    @abstractmethod
+    async def publish(self, routing_key: str, body: bytes, headers: dict) -> None:
+        """Возвращается, когда брокер принял сообщение (publisher confirm)."""
+
+    @abstractmethod
+    async def send_to_queue(self, queue: str, body: bytes, headers: dict) -> None:
+        """Публикация прямо в очередь через обменник по умолчанию, с confirm."""
+
+    @abstractmethod
+    async def consume(self, queue: str, callback: MessageCallback, prefetch: int) -> str:
+        """Начинает доставку сообщений очереди в callback, возвращает тег consumer'а."""
+
+    @abstractmethod
+    async def cancel(self, consumer_tag: str) -> None: ...
+
+    @abstractmethod
+    async def queue_depth(self, queue: str) -> int:
+        """Сообщения, ожидающие доставки; 0, если очереди еще нет."""
+
+    async def retry_later(self, spec: QueueSpec, message: IncomingMessage) -> bool:
+        """
+        Перекладывает сообщение в очередь ожидания следующей попытки и
+        подтверждает его. False — попытки исчерпаны, решение за consumer'ом.
+        Сбой между публикацией и ack дает дубликат, а не потерю.
+        """
+        attempt = int(message.headers.get(RETRY_ATTEMPT_HEADER, 0))
+        if attempt >= len(spec.retry_delays):
+            return False
+        headers = {**message.headers, RETRY_ATTEMPT_HEADER: attempt + 1}
+        headers.setdefault(ORIGINAL_ROUTING_KEY_HEADER, message.routing_key)
+        await self.send_to_queue(spec.retry_queue(attempt).name, message.body, headers)
+        await message.ack()
+        return True
+
+class _AioPikaIncomingMessage(IncomingMessage):
+    __slots__ = ("_message", "body", "headers", "routing_key", "redelivered")
+
+    def __init__(self, message: AbstractIncomingMessage):
+        self._message = message
+        self.body = message.body
+        self.headers = message.headers or {}
+        self.routing_key = self.headers.get(ORIGINAL_ROUTING_KEY_HEADER, message.routing_key)
+        self.redelivered = message.redelivered
+
+    async def ack(self) -> None:
+        await self._message.ack()
+
+    async def reject(self, requeue: bool = False) -> None:
+        await self._message.reject(requeue=requeue)
+
+class AioPikaMessageBus(MessageBus):
+    def __init__(self, url: str):
+        self.url = url
+        self._connection: AbstractRobustConnection | None = None
+        self._channel: AbstractChannel | None = None
+        self._probe_channel: AbstractChannel | None = None
+        self._exchange: aio_pika.abc.AbstractExchange | None = None
+        self._consumers: dict[str, tuple[AbstractQueue, AbstractChannel]] = {}
+
+    @retry(stop=stop_after_attempt(5), wait=wait_fixed(2))
+    async def _get_connection(self) -> AbstractRobustConnection:
+        return await aio_pika.connect_robust(self.url)
+
+    async def connect(self) -> None:
+        if self._connection is not None:
+            return
+        connection = await self._get_connection()
+        try:
+            channel = await connection.channel(publisher_confirms=True)
+            exchange = await channel.declare_exchange(
+                EXCHANGE_NAME, aio_pika.ExchangeType.TOPIC, durable=True
+            )
+        except BaseException:
+            # Повторный connect начнет с нового соединения, а не с полуготового
+            await connection.close()
+            raise
+        self._connection, self._channel, self._exchange = connection, channel, exchange
+        log.info("RabbitMQ message bus connected.")
+
+    async def close(self) -> None:
+        if self._connection and not self._connection.is_closed:
+            await self._connection.close()
+            log.info("RabbitMQ connection closed.")
+
+    async def declare_queue(self, spec: QueueSpec) -> None:
+        arguments = {}
+        if spec.dead_letter_exchange:
+            dlx_exchange = await self._channel.declare_exchange(
+                spec.dead_letter_exchange, aio_pika.ExchangeType.FANOUT, durable=True
+            )
+            if spec.dead_letter_queue:
+                dlq_queue = await self._channel.declare_queue(spec.dead_letter_queue, durable=True)
+                await dlq_queue.bind(dlx_exchange, "")
+        if spec.dead_letter_exchange is not None:
+            arguments["x-dead-letter-exchange"] = spec.dead_letter_exchange
+        if spec.dead_letter_routing_key:
+            arguments["x-dead-letter-routing-key"] = spec.dead_letter_routing_key
+        if spec.message_ttl is not None:
+            arguments["x-message-ttl"] = int(spec.message_ttl * 1000)
+        queue = await self._channel.declare_queue(spec.name, durable=True, arguments=arguments or None)
+        for routing_key in spec.routing_keys:
+            await queue.bind(self._exchange, routing_key=routing_key)
+        for attempt in range(len(spec.retry_delays)):
+            await self.declare_queue(spec.retry_queue(attempt))
+
+    async def publish(self, routing_key: str, body: bytes, headers: dict) -> None:
+        if self._exchange is None:
+            raise RuntimeError("Message bus is not connected.")
+        await self._exchange.publish(
+            aio_pika.Message(body=body, headers=headers, delivery_mode=aio_pika.DeliveryMode.PERSISTENT),
+            routing_key=routing_key,
+        )
+
+    async def send_to_queue(self, queue: str, body: bytes, headers: dict) -> None:
+        if self._channel is None:
+            raise RuntimeError("Message bus is not connected.")
+        await self._channel.default_exchange.publish(
+            aio_pika.Message(body=body, headers=headers, delivery_mode=aio_pika.DeliveryMode.PERSISTENT),
+            routing_key=queue,
+        )
+
+    async def consume(self, queue: str, callback: MessageCallback, prefetch: int) -> str:
+        # У consumer'а свой канал: его prefetch не должен ограничивать publisher
+        channel = await self._connection.channel()
+        await channel.set_qos(prefetch_count=prefetch)
+        amqp_queue = await channel.declare_queue(queue, passive=True)
+
+        async def on_message(message: AbstractIncomingMessage) -> None:
+            await callback(_AioPikaIncomingMessage(message))
+
+        consumer_tag = await amqp_queue.consume(on_message)
+        self._consumers[consumer_tag] = (amqp_queue, channel)
+        return consumer_tag
+
+    async def cancel(self, consumer_tag: str) -> None:
+        amqp_queue, channel = self._consumers.pop(consumer_tag)
+        if not channel.is_closed:
+            await amqp_queue.cancel(consumer_tag)
+            await channel.close()
+
+    async def queue_depth(self, queue: str) -> int:
+        # Пассивный declare: очередь не создается, брокер возвращает число сообщений
+        if self._probe_channel is None or self._probe_channel.is_closed:
+            self._probe_channel = await self._connection.channel()
+        try:
+            amqp_queue = await self._probe_channel.declare_queue(queue, passive=True)
+        except aio_pika.exceptions.ChannelClosed:
+            # Очереди еще нет — брокер закрывает канал
+            self._probe_channel = None
+            return 0
+        return amqp_queue.declaration_result.message_count
+
+@lru_cache(maxsize=4096)
+def topic_matches(pattern: str, routing_key: str) -> bool:
+    """Шаблон topic-обменника: * — ровно одно слово, # — ноль или больше."""
+    def match(words: tuple[str, ...], keys: tuple[str, ...]) -> bool:
+        if not words:
+            return not keys
+        if words[0] == "#":
+            return any(match(words[1:], keys[i:]) for i in range(len(keys) + 1))
+        if not keys:
+            return False
+        return words[0] in ("*", keys[0]) and match(words[1:], keys[1:])
+
+    return match(tuple(pattern.split(".")), tuple(routing_key.split(".")))
+
+@dataclass(frozen=True)
+class _Delivery:
+    body: bytes
+    headers: dict
+    routing_key: str
+    redelivered: bool = False
+
+class _MemoryConsumer:
+    def __init__(self, tag: str, queue: "_MemoryQueue", callback: MessageCallback, prefetch: int):
+        self.tag = tag
+        self.queue = queue
+        self.callback = callback
+        self.prefetch = prefetch
+        self.unacked: dict["_MemoryIncomingMessage", asyncio.Task] = {}
+
+class _MemoryIncomingMessage(IncomingMessage):
+    def __init__(self, consumer: _MemoryConsumer, delivery: _Delivery):
+        self._consumer = consumer
+        self._delivery = delivery
+        self.body = delivery.body
+        self.headers = dict(delivery.headers)
+        self.routing_key = self.headers.get(ORIGINAL_ROUTING_KEY_HEADER, delivery.routing_key)
+        self.redelivered = delivery.redelivered
+
+    def _settle(self) -> None:
+        if self._consumer.unacked.pop(self, None) is None:
+            raise RuntimeError("Message is already acknowledged or its consumer was cancelled.")
+
+    async def ack(self) -> None:
+        self._settle()
+        self._consumer.queue.dispatch()
+
+    async def reject(self, requeue: bool = False) -> None:
+        self._settle()
+        queue = self._consumer.queue
+        if requeue:
+            queue.requeue(self._delivery)
+        else:
+            queue.dead_letter(self._delivery, "rejected")
+        queue.dispatch()
+
+class _MemoryQueue:
+    def __init__(self, broker: "InMemoryBroker", spec: QueueSpec):
+        self.broker = broker
+        self.spec = spec
+        self.ready: deque[_Delivery] = deque()
+        self.consumers: list[_MemoryConsumer] = []
+        self._next_consumer = 0
+
+    def put(self, delivery: _Delivery) -> None:
+        self.ready.append(delivery)
+        if self.spec.message_ttl is not None:
+            asyncio.get_running_loop().call_later(self.spec.message_ttl, self._expire, delivery)
+        self.dispatch()
+
+    def _expire(self, delivery: _Delivery) -> None:
+        # Уже выданное consumer'у сообщение не истекает, как и в RabbitMQ
+        if self.ready and self.ready[0] is delivery:
+            self.ready.popleft()
+        elif delivery in self.ready:
+            self.ready.remove(delivery)
+        else:
+            return
+        self.dead_letter(delivery, "expired")
+
+    def requeue(self, delivery: _Delivery) -> None:
+        # Как в RabbitMQ: возвращенное сообщение встает в начало очереди
+        self.ready.appendleft(replace(delivery, redelivered=True))
+
+    def dead_letter(self, delivery: _Delivery, reason: str) -> None:
+        exchange = self.spec.dead_letter_exchange
+        if exchange is None:
+            return
+        headers = dict(delivery.headers)
+        headers.setdefault("x-first-death-queue", self.spec.name)
+        headers.setdefault("x-first-death-reason", reason)
+        delivery = replace(delivery, headers=headers, redelivered=False)
+        if exchange == DEFAULT_EXCHANGE:
+            self.broker.publish_to_queue(self.spec.dead_letter_routing_key or delivery.routing_key, delivery)
+        else:
+            self.broker.publish_fanout(exchange, delivery)
+
+    def dispatch(self) -> None:
+        """Раздает готовые сообщения consumer'ам по кругу в пределах их prefetch."""
+        while self.ready and self.consumers:
+            for _ in range(len(self.consumers)):
+                consumer = self.consumers[self._next_consumer % len(self.consumers)]
+                self._next_consumer += 1
+                if len(consumer.unacked) < consumer.prefetch:
+                    break
+            else:
+                return
+            message = _MemoryIncomingMessage(consumer, self.ready.popleft())
+            consumer.unacked[message] = asyncio.create_task(self._deliver(consumer, message))
+
+    async def _deliver(self, consumer: _MemoryConsumer, message: _MemoryIncomingMessage) -> None:
+        try:
+            await consumer.callback(message)
+        except Exception:
+            log.exception(f"Consumer {consumer.tag} failed on a message from '{self.spec.name}'.")
+            if message in consumer.unacked:
+                await message.reject(requeue=True)
+
+    def remove_consumer(self, consumer: _MemoryConsumer) -> None:
+        self.consumers.remove(consumer)
+        # Неподтвержденные сообщения отмененного consumer'а доставляются заново
+        for message, task in list(consumer.unacked.items()):
+            del consumer.unacked[message]
+            task.cancel()
+            self.requeue(message._delivery)
+        self.dispatch()
+
+class InMemoryBroker:
+    """Очереди и привязки, общие для всех InMemoryMessageBus одного процесса."""
+
+    def __init__(self):
+        self.queues: dict[str, _MemoryQueue] = {}
+        self.bindings: list[tuple[str, _MemoryQueue]] = []
+        self.fanout: dict[str, list[_MemoryQueue]] = {}
+
+    def declare(self, spec: QueueSpec) -> None:
+        queue = self.queues.get(spec.name)
+        if queue is None:
+            queue = self.queues[spec.name] = _MemoryQueue(self, spec)
+        for routing_key in spec.routing_keys:
+            if (routing_key, queue) not in self.bindings:
+                self.bindings.append((routing_key, queue))
+        if spec.dead_letter_exchange:
+            bound = self.fanout.setdefault(spec.dead_letter_exchange, [])
+            if spec.dead_letter_queue:
+                self.declare(QueueSpec(spec.dead_letter_queue, ()))
+                dlq = self.queues[spec.dead_letter_queue]
+                if dlq not in bound:
+                    bound.append(dlq)
+        for attempt in range(len(spec.retry_delays)):
+            self.declare(spec.retry_queue(attempt))
+
+    def publish(self, routing_key: str, body: bytes, headers: dict) -> None:
+        delivery = _Delivery(body, dict(headers), routing_key)
+        routed = set()
+        for pattern, queue in self.bindings:
+            if queue.spec.name not in routed and topic_matches(pattern, routing_key):
+                routed.add(queue.spec.name)
+                queue.put(delivery)
+
+    def publish_fanout(self, exchange: str, delivery: _Delivery) -> None:
+        for queue in self.fanout.get(exchange, ()):
+            queue.put(delivery)
+
+    def publish_to_queue(self, queue_name: str, delivery: _Delivery) -> None:
+        # Как обменник по умолчанию: в очередь с именем ключа, иначе сообщение теряется
+        queue = self.queues.get(queue_name)
+        if queue is not None:
+            queue.put(replace(delivery, routing_key=queue_name))
+
+class InMemoryMessageBus(MessageBus):
+    def __init__(self, broker: InMemoryBroker | None = None):
+        self.broker = broker or InMemoryBroker()
+        self._consumers: dict[str, _MemoryConsumer] = {}
+        self._tags = count(1)
+
+    def share_broker(self, other: "InMemoryMessageBus") -> None:
+        """Подключает шину к брокеру другой шины — так сервисы в одном процессе видят друг друга."""
+        self.broker = other.broker
+
+    async def connect(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        for consumer_tag in list(self._consumers):
+            await self.cancel(consumer_tag)
+
+    async def declare_queue(self, spec: QueueSpec) -> None:
+        self.broker.declare(spec)
+
+    async def publish(self, routing_key: str, body: bytes, headers: dict) -> None:
+        self.broker.publish(routing_key, body, headers)
+        # Уступаем loop, как при ожидании confirm от настоящего брокера
+        await asyncio.sleep(0)
+
+    async def send_to_queue(self, queue: str, body: bytes, headers: dict) -> None:
+        self.broker.publish_to_queue(queue, _Delivery(body, dict(headers), queue))
+        await asyncio.sleep(0)
+
+    async def consume(self, queue: str, callback: MessageCallback, prefetch: int) -> str:
+        memory_queue = self.broker.queues.get(queue)
+        if memory_queue is None:
+            raise LookupError(f"Queue '{queue}' is not declared")
+        consumer = _MemoryConsumer(f"memory-{id(self):x}-{next(self._tags)}", memory_queue, callback, prefetch)
+        self._consumers[consumer.tag] = consumer
+        memory_queue.consumers.append(consumer)
+        memory_queue.dispatch()
+        return consumer.tag
+
+    async def cancel(self, consumer_tag: str) -> None:
+        consumer = self._consumers.pop(consumer_tag)
+        consumer.queue.remove_consumer(consumer)
+
+    async def queue_depth(self, queue: str) -> int:
+        memory_queue = self.broker.queues.get(queue)
+        return len(memory_queue.ready) if memory_queue else 0
+
+def create_message_bus() -> MessageBus:
+    if settings.message_bus == "memory":
+        return InMemoryMessageBus()
+    return AioPikaMessageBus(settings.rabbitmq.url)
+
+message_bus = create_message_bus()
\ No newline at end of file
@@ -1,98 +1,127 @@
 import asyncio
 import json
+import time
 import uuid
 import logging
 from decimal import Decimal
 from typing import Callable, Coroutine, Any
 
-import aio_pika
-from aio_pika.abc import (
-    AbstractIncomingMessage,
-    AbstractRobustConnection,
-    AbstractChannel,
-    AbstractQueue,
+from sqlalchemy.exc import DBAPIError, OperationalError, TimeoutError as PoolTimeoutError
+
+from app.core.config import settings
+from app.core.metrics import registry
+from app.core.tracing import (
+    KIND_CONSUMER,
+    PUBLISHED_AT_HEADER,
+    TRACEPARENT_HEADER,
+    parse_traceparent,
+    record_span,
+    start_span,
 )
-
-from app.core.config import RabbitMQSettings
+from app.infrastructure.database.instrumentation import observe_operation, track_statements
+from app.infrastructure.messaging.bus import IncomingMessage, MessageBus, QueueSpec
 from app.domain.models import PaymentRequest
 
 log = logging.getLogger(__name__)
 
-class RabbitMQConsumer:
+CONSUMER_PROCESSING_SECONDS = registry.histogram(
+    "consumer_processing_seconds", "Время обработки сообщения consumer'ом, включая ack/reject"
+)
+CONSUMER_MESSAGES = registry.counter(
+    "consumer_messages_total", "Обработанные сообщения по исходу (ack/retry/reject)", ["outcome"]
+)
+ACKED = CONSUMER_MESSAGES.labels("ack")
+RETRIED = CONSUMER_MESSAGES.labels("retry")
+REJECTED = CONSUMER_MESSAGES.labels("reject")
+# SQLSTATE ошибок, которые через несколько секунд могут пройти: класс 08 —
+# соединение, 40001/40P01 — сериализация и дедлок, 53300 — нет свободных
+# соединений, 57014 — отмена по statement_timeout, 57P01/57P03 — рестарт сервера
+TRANSIENT_SQLSTATE_CLASSES = ("08",)
+TRANSIENT_SQLSTATES = frozenset({"40001", "40P01", "53300", "57014", "57P01", "57P03"})
+
+def is_transient(error: BaseException) -> bool:
+    """
+    Недоступность БД, исчерпанный пул или конфликт транзакций. asyncpg почти
+    не дает OperationalError: отказ в соединении приходит как OSError, а
+    остальное — как DBAPIError, поэтому смотрим на SQLSTATE исходной ошибки.
+    """
+    if isinstance(error, (OperationalError, PoolTimeoutError, OSError, asyncio.TimeoutError)):
+        return True
+    if not isinstance(error, DBAPIError):
+        return False
+    if error.connection_invalidated:
+        return True
+    sqlstate = getattr(error.orig, "sqlstate", None) or getattr(error.orig, "pgcode", None)
+    if sqlstate is None:
+        return False
+    return sqlstate.startswith(TRANSIENT_SQLSTATE_CLASSES) or sqlstate in TRANSIENT_SQLSTATES
+
+QUEUE = QueueSpec(
+    "payment_requests_queue",
+    ("order.created",),
+    dead_letter_exchange="dlx_exchange",
+    dead_letter_queue="payment_requests_dlq",
+    retry_delays=settings.consumer_retry.delays,
+)
+PREFETCH_COUNT = 10
+
+class MessageConsumer:
     def __init__(
         self,
-        settings: RabbitMQSettings,
+        bus: MessageBus,
         on_message_callback: Callable[[PaymentRequest], Coroutine[Any, Any, None]],
     ):
-        self.settings = settings
+        self.bus = bus
         self.on_message_callback = on_message_callback
-
-        self._connection: AbstractRobustConnection | None = None
-        self._channel: AbstractChannel | None = None
-        self._queue: AbstractQueue | None = None
-        self._consuming_task: asyncio.Task | None = None
+        self._consumer_tag: str | None = None
 
     async def start(self) -> None:
-        """
-        Устанавливает соединение, настраивает канал и очередь,
-        и запускает процесс потребления сообщений в фоновой задаче.
-        """
-        self._connection = await aio_pika.connect_robust(self.settings.url)
-        self._channel = await self._connection.channel()
-        await self._channel.set_qos(prefetch_count=10)
-
-        exchange = await self._channel.declare_exchange(
-            "store_exchange", aio_pika.ExchangeType.TOPIC, durable=True
-        )
-        
-        dlx_exchange = await self._channel.declare_exchange(
-            "dlx_exchange", aio_pika.ExchangeType.FANOUT, durable=True
-        )
-        dlq_queue = await self._channel.declare_queue(
-            "payment_requests_dlq", durable=True
-        )
-        await dlq_queue.bind(dlx_exchange, "")
-
-        self._queue = await self._channel.declare_queue(
-            "payment_requests_queue",
-            durable=True,
-            arguments={"x-dead-letter-exchange": "dlx_exchange"},
-        )
-        await self._queue.bind(exchange, routing_key="order.created")
-
+        await self.bus.declare_queue(QUEUE)
+        self._consumer_tag = await self.bus.consume(QUEUE.name, self._process_message, PREFETCH_COUNT)
         log.info("Consumer started. Waiting for messages.")
 
-        # Запускаем consume как управляемую фоновую задачу
-        self._consuming_task = asyncio.create_task(
-            self._queue.consume(self._process_message)
-        )
-
     async def stop(self) -> None:
-        """
-        Корректно останавливает потребителя: отменяет задачу потребления
-        и закрывает соединение с RabbitMQ.
-        """
-        log.info("Stopping RabbitMQ consumer...")
-        if self._consuming_task and not self._consuming_task.done():
-            # Отменяем задачу, которая слушает очередь
-            self._consuming_task.cancel()
-            try:
-                await self._consuming_task
-            except asyncio.CancelledError:
-                log.info("Consuming task successfully cancelled.")
-
-        if self._connection and not self._connection.is_closed:
-            await self._connection.close()
-            log.info("RabbitMQ connection closed.")
-        
-        log.info("RabbitMQ consumer stopped.")
+        log.info("Stopping consumer...")
+        if self._consumer_tag is not None:
+            await self.bus.cancel(self._consumer_tag)
+            self._consumer_tag = None
+        log.info("Consumer stopped.")
+
+    async def _retry_or_reject(self, message: IncomingMessage, error: Exception) -> None:
+        """Временная ошибка: сообщение ждет в очереди повтора, слот prefetch освобождается сразу."""
+        try:
+            scheduled = await self.bus.retry_later(QUEUE, message)
+        except Exception:
+            log.exception("Failed to schedule a retry, returning the message to the queue.")
+            await message.reject(requeue=True)
+            return
+        if scheduled:
+            log.warning(f"Payment processing failed ({error!r}), scheduled for a delayed retry.")
+            RETRIED.inc()
+        else:
+            log.error(f"Payment processing failed after all retries ({error!r}). Rejecting to DLQ.")
+            await message.reject(requeue=False)
+            REJECTED.inc()
+
+    @staticmethod
+    def _trace_parent(message: IncomingMessage):
+        """Контекст трассы из заголовков; время в очереди пишется отдельным спаном."""
+        headers = message.headers or {}
+        parent = parse_traceparent(headers.get(TRACEPARENT_HEADER))
+        published_ns = headers.get(PUBLISHED_AT_HEADER)
+        if parent is not None and isinstance(published_ns, int):
+            record_span(
+                f"queue.wait {message.routing_key}", parent, published_ns, time.time_ns()
+            )
+        return parent
 
-    async def _process_message(self, message: AbstractIncomingMessage) -> None:
+    async def _process_message(self, message: IncomingMessage) -> None:
         """
         Обрабатывает входящее сообщение.
         Подтверждение (ACK) отправляется только после успешной обработки.
-        При любой ошибке сообщение реджектится.
+        Временные ошибки БД уходят на отложенный повтор, остальные — в DLQ.
         """
+        started = time.perf_counter()
         try:
             body = json.loads(message.body.decode())
             msg_id_hdr = message.headers.get("message_id")
@@ -108,13 +137,27 @@ class RabbitMQConsumer:
             )
             
             # Вся бизнес-логика, включая коммит в БД, происходит здесь.
-            await self.on_message_callback(payment_request)
+            span_attributes = {}
+            with track_statements() as stats, start_span(
+                "payment.process", self._trace_parent(message),
+                kind=KIND_CONSUMER, attributes=span_attributes,
+            ):
+                await self.on_message_callback(payment_request)
+                span_attributes["db.statements"] = stats.count
+            observe_operation(f"message {message.routing_key}", stats)
             
             # Подтверждаем сообщение только после успешного выполнения колбэка
             await message.ack()
-            log.info(f"Successfully processed and ACKed message {msg_id_hdr}")
+            ACKED.inc()
+            log.info(f"Successfully processed and ACKed message {msg_id_hdr} ({stats.count} SQL statements)")
 
-        except Exception:
+        except Exception as e:
+            if is_transient(e):
+                await self._retry_or_reject(message, e)
+                return
             log.exception(f"Failed to process message. Rejecting to DLQ.")
             # Отклоняем сообщение, чтобы оно ушло в DLQ и не было потеряно
-            await message.reject(requeue=False)
\ No newline at end of file
+            await message.reject(requeue=False)
+            REJECTED.inc()
+        finally:
+            CONSUMER_PROCESSING_SECONDS.observe(time.perf_counter() - started)
\ No newline at end of file
@@ -1,70 +1,88 @@
 import asyncio
 import json
 import logging
+import time
 from typing import Callable
 
-import aio_pika
-from sqlalchemy import select
+from sqlalchemy import extract, func, select
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
-from tenacity import retry, stop_after_attempt, wait_fixed
 
-from app.core.config import RabbitMQSettings
+from app.core.metrics import registry
+from app.core.tracing import (
+    KIND_PRODUCER,
+    PUBLISHED_AT_HEADER,
+    TRACEPARENT_HEADER,
+    parse_traceparent,
+    record_span,
+)
 from app.infrastructure.database.models import OutboxMessage
+from app.infrastructure.messaging.bus import MessageBus
 
 log = logging.getLogger(__name__)
 POLL_INTERVAL = 2.0
 
+PUBLISH_BATCH_SIZE = registry.histogram(
+    "outbox_publish_batch_size", "Сообщений outbox в одной пачке публикации",
+    buckets=(1, 5, 10, 25, 50, 100),
+)
+PUBLISH_CONFIRM_SECONDS = registry.histogram(
+    "outbox_publish_confirm_seconds", "Время от отправки сообщения до publisher confirm брокера"
+)
+PUBLISHED = registry.counter("outbox_published_total", "Опубликованные сообщения outbox", ["topic"])
+PUBLISH_FAILURES = registry.counter("outbox_publish_failures_total", "Неудачные публикации outbox")
+OUTBOX_BACKLOG = registry.gauge(
+    "outbox_backlog", "Неопубликованные сообщения outbox (с отсечкой OUTBOX_BACKLOG_LIMIT)", ["shard"]
+)
+OUTBOX_OLDEST_AGE = registry.gauge(
+    "outbox_oldest_unpublished_age_seconds", "Возраст самого старого неопубликованного сообщения", ["shard"]
+)
+# Счет строк идет по частичному индексу, отсечка ограничивает его цену при аварии
+OUTBOX_BACKLOG_LIMIT = 1_000_000
+
+def register_outbox_metrics(session_factories: list[async_sessionmaker[AsyncSession]]) -> None:
+    """Замеряет backlog outbox при каждом сборе метрик, а не в цикле публикации."""
+    unpublished = OutboxMessage.is_published.is_(False)
+
+    async def collect() -> None:
+        for shard, session_factory in enumerate(session_factories):
+            async with session_factory() as session:
+                async with session.begin():
+                    backlog = select(OutboxMessage.id).where(unpublished).limit(OUTBOX_BACKLOG_LIMIT).subquery()
+                    count = await session.scalar(select(func.count()).select_from(backlog))
+                    age = await session.scalar(
+                        select(extract("epoch", func.now() - func.min(OutboxMessage.created_at))).where(unpublished)
+                    )
+            OUTBOX_BACKLOG.labels(shard).set(count)
+            OUTBOX_OLDEST_AGE.labels(shard).set(float(age or 0))
+
+    registry.add_collector(collect)
+
 class OutboxPublisher:
     def __init__(
         self,
         db_session_factory: async_sessionmaker[AsyncSession],
-        rabbitmq_settings: RabbitMQSettings,
+        bus: MessageBus,
     ):
         self.db_session_factory = db_session_factory
-        self.rabbitmq_settings = rabbitmq_settings
+        self.bus = bus
         self._stopped = asyncio.Event()
-        self.connection: aio_pika.abc.AbstractRobustConnection | None = None
-        self.channel: aio_pika.abc.AbstractChannel | None = None
-        self.exchange: aio_pika.abc.AbstractExchange | None = None
-
-    @retry(stop=stop_after_attempt(5), wait=wait_fixed(2))
-    async def _get_connection(self):
-        return await aio_pika.connect_robust(self.rabbitmq_settings.url)
-
-    async def _setup(self):
-        self.connection = await self._get_connection()
-        self.channel = await self.connection.channel(publisher_confirms=True)
-        self.exchange = await self.channel.declare_exchange(
-            "store_exchange", aio_pika.ExchangeType.TOPIC, durable=True
-        )
-        log.info("Outbox Publisher connection and channel set up.")
 
     async def run(self) -> None:
-        await self._setup()
         log.info("Outbox Publisher started.")
         while not self._stopped.is_set():
             try:
                 await self._publish_pending_messages()
             except Exception as e:
+                # Переподключение к брокеру — забота шины (robust-соединение aio-pika)
                 log.error(f"Outbox publisher cycle failed: {e}", exc_info=True)
-                if not self.connection or self.connection.is_closed:
-                    try:
-                        await self._setup()
-                    except Exception as setup_exc:
-                        log.error(f"Failed to re-setup publisher connection: {setup_exc}")
                 await asyncio.sleep(POLL_INTERVAL * 2)
             await asyncio.sleep(POLL_INTERVAL)
 
     async def stop(self) -> None:
         self._stopped.set()
         log.info("Outbox Publisher stopping.")
-        if self.connection and not self.connection.is_closed:
-            await self.connection.close()
 
     async def _publish_pending_messages(self) -> None:
-        if self.exchange is None:
-            raise RuntimeError("Exchange is not initialized in OutboxPublisher.")
-
         async with self.db_session_factory() as session:
             async with session.begin():
                 stmt = (
@@ -78,19 +96,35 @@ class OutboxPublisher:
 
                 if not messages_to_publish:
                     return
+                PUBLISH_BATCH_SIZE.observe(len(messages_to_publish))
 
                 for msg in messages_to_publish:
+                    # Контекст трассы едет в заголовках AMQP, а не в теле сообщения
+                    payload = dict(msg.payload)
+                    trace = payload.pop("trace", None)
+                    parent = parse_traceparent(trace["traceparent"]) if trace else None
+                    headers = {"message_id": str(msg.id)}
+                    context = None
+                    if parent is not None:
+                        context = parent.child()
+                        headers[TRACEPARENT_HEADER] = context.traceparent()
                     try:
-                        await self.exchange.publish(
-                            aio_pika.Message(
-                                body=json.dumps(msg.payload, default=str).encode(),
-                                headers={"message_id": str(msg.id)},
-                                delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
-                            ),
-                            routing_key=msg.topic,
-                        )
+                        started = time.perf_counter()
+                        started_ns = time.time_ns()
+                        if context is not None:
+                            headers[PUBLISHED_AT_HEADER] = started_ns
+                        await self.bus.publish(msg.topic, json.dumps(payload, default=str).encode(), headers)
+                        PUBLISH_CONFIRM_SECONDS.observe(time.perf_counter() - started)
+                        if context is not None:
+                            record_span(f"outbox.wait {msg.topic}", parent, trace["created_ns"], started_ns)
+                            record_span(
+                                f"outbox.publish {msg.topic}", parent, started_ns, time.time_ns(),
+                                kind=KIND_PRODUCER, context=context,
+                            )
+                        PUBLISHED.labels(msg.topic).inc()
                         msg.is_published = True
                     except Exception:
+                        PUBLISH_FAILURES.inc()
                         log.exception(f"Failed to publish message {msg.id}. "
                                       "Transaction will be rolled back, and it will be retried.")
                         raise
\ No newline at end of file
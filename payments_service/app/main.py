@@ -1,86 +1,156 @@
 import asyncio
 import logging
 from contextlib import asynccontextmanager
-from fastapi import FastAPI
-from sqlalchemy.exc import OperationalError
-from tenacity import (
-    retry,
-    stop_after_attempt,
-    wait_fixed,
-    retry_if_exception_type,
-    RetryCallState
-)
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse
 
+from app.api.admin import router as admin_router
+from app.api.middleware import DeadlineMiddleware, StatementCountMiddleware, TracingMiddleware
+from app.api.responses import FastJSONResponse
 from app.api.v1.router import api_router
 from app.core.config import settings
+from app.core.deadline import DeadlineExceeded
+from app.core.loop_monitor import loop_monitor
+from app.core.metrics import CONTENT_TYPE, registry
+from app.core.readiness import readiness
+from app.core.tracing import exporter
 from app.domain.models import PaymentRequest
 from app.infrastructure.database.models import Base
-from app.infrastructure.database.session import async_engine, AsyncSessionLocal
-from app.infrastructure.messaging.consumer import RabbitMQConsumer
-from app.infrastructure.messaging.publisher import OutboxPublisher
+from app.infrastructure.database.schema import ensure_schema
+from app.infrastructure.database.session import shard_router
+from app.infrastructure.database.warmup import exercise_hot_statements, warm_up_pool
+from app.infrastructure.messaging.bus import message_bus
+from app.infrastructure.messaging.consumer import MessageConsumer
+from app.infrastructure.messaging.publisher import OutboxPublisher, register_outbox_metrics
+from app.application.idempotency import IdempotencyKeyPurger, IdempotencyKeyReused
 from app.application.services import PaymentService
 
 log = logging.getLogger(__name__)
 
-publisher: OutboxPublisher | None = None
-consumer: RabbitMQConsumer | None = None
-
-def _log_on_retry(retry_state: RetryCallState):
-    """Логгирует информацию при повторной попытке."""
-    if retry_state.outcome and retry_state.outcome.failed:
-        log.error(
-            f"Retrying payment processing, attempt {retry_state.attempt_number} failed.",
-            exc_info=retry_state.outcome.exception()
-        )
+publishers: list[OutboxPublisher] = []
+consumer: MessageConsumer | None = None
 
-@retry(
-    stop=stop_after_attempt(3),
-    wait=wait_fixed(1),
-    retry=retry_if_exception_type(OperationalError),
-    retry_error_callback=_log_on_retry
-)
 async def handle_payment_request(payment_request: PaymentRequest):
     """
     Создает сервис и обрабатывает запрос.
-    Эта функция будет вызываться повторно в случае временных сбоев.
+    При временном сбое БД consumer повторит сообщение через очередь ожидания.
     """
-    service = PaymentService(session_factory=AsyncSessionLocal)
+    service = PaymentService(shards=shard_router)
     await service.process_payment_request(payment_request)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global publisher, consumer
-    log.info("Payments Service starting up...")
-    
-    async with async_engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
-    
-    publisher = OutboxPublisher(AsyncSessionLocal, settings.rabbitmq)
-    consumer = RabbitMQConsumer(settings.rabbitmq, handle_payment_request)
-    
-    publisher_task = asyncio.create_task(publisher.run())
-    consumer_task = asyncio.create_task(consumer.start())
+    global publishers, consumer
+    log.info(f"Payments Service starting up with {shard_router.shard_count} shard(s)...")
+
+    readiness.begin()
+
+    # Схема нужна до первого запроса; шарды проверяются параллельно
+    await readiness.step(
+        "schema",
+        asyncio.gather(*(ensure_schema(engine, Base.metadata) for engine in shard_router.engines)),
+    )
+
+    # Outbox каждого шарда разбирает свой publisher, соединение с брокером общее
+    publishers = [
+        OutboxPublisher(session_factory, message_bus)
+        for session_factory in shard_router.session_factories
+    ]
+    consumer = MessageConsumer(message_bus, handle_payment_request)
+
+    idempotency_purger = IdempotencyKeyPurger(
+        PaymentService(shards=shard_router).purge_idempotency_keys,
+        settings.idempotency.PURGE_INTERVAL_SECONDS,
+        settings.idempotency.PURGE_BATCH_SIZE,
+    )
+    purger_task = asyncio.create_task(idempotency_purger.run())
+    exporter_task = asyncio.create_task(exporter.run())
+    monitor_task = asyncio.create_task(loop_monitor.run())
+    publisher_tasks: list[asyncio.Task] = []
+
+    async def connect_broker() -> None:
+        # Шаги повторяются по отдельности: выполненный не запускается второй раз
+        await readiness.retry_step("broker", message_bus.connect)
+        # Publisher'ы не ждут прогрева БД: сообщения outbox уходят сразу
+        publisher_tasks.extend(asyncio.create_task(publisher.run()) for publisher in publishers)
+        await readiness.retry_step("consumer", consumer.start)
+
+    async def warm_up() -> None:
+        """Прогрев пулов шардов и подключение к брокеру параллельно; после них /ready отвечает 200."""
+        connections = settings.startup.WARMUP_CONNECTIONS
+        await asyncio.gather(
+            readiness.retry_step(
+                "database",
+                lambda: asyncio.gather(*(
+                    warm_up_pool(engine, connections, exercise_hot_statements)
+                    for engine in shard_router.engines
+                )),
+            ),
+            connect_broker(),
+        )
+        readiness.mark_ready()
+
+    startup_task = asyncio.create_task(warm_up())
 
     yield
 
     log.info("Payments Service shutting down...")
-    if publisher:
+    startup_task.cancel()
+    await asyncio.gather(startup_task, return_exceptions=True)
+    for publisher in publishers:
         await publisher.stop()
     if consumer:
         await consumer.stop()
-    
-    await asyncio.gather(publisher_task, consumer_task, return_exceptions=True)
+    await idempotency_purger.stop()
+    await exporter.stop()
+    await loop_monitor.stop()
+
+    await asyncio.gather(*publisher_tasks, purger_task, exporter_task, monitor_task, return_exceptions=True)
+    await message_bus.close()
+    await shard_router.dispose()
     log.info("Background tasks finished.")
 
 app = FastAPI(
     title="Payments Service",
     description="Сервис для управления счетами и проведения оплат.",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse,
 )
 
+register_outbox_metrics(shard_router.session_factories)
+
+app.add_middleware(DeadlineMiddleware)
+app.add_middleware(TracingMiddleware)
+app.add_middleware(StatementCountMiddleware)
 app.include_router(api_router)
+if settings.profiler.ENABLED:
+    app.include_router(admin_router)
+
+@app.exception_handler(DeadlineExceeded)
+async def deadline_exceeded_handler(request: Request, exc: DeadlineExceeded):
+    return JSONResponse(status_code=504, content={"detail": str(exc)})
+
+@app.exception_handler(IdempotencyKeyReused)
+async def idempotency_key_reused_handler(request: Request, exc: IdempotencyKeyReused):
+    return JSONResponse(status_code=422, content={"detail": str(exc)})
 
 @app.get("/health")
 def health_check():
-    return {"status": "ok"}
\ No newline at end of file
+    return {"status": "ok"}
+
+@app.get("/ready")
+def readiness_check():
+    """200 после прогрева пулов шардов и подключения к брокеру, до этого 503."""
+    if not readiness.ready:
+        return JSONResponse(status_code=503, content=readiness.snapshot())
+    return readiness.snapshot()
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return Response(await registry.collect(), media_type=CONTENT_TYPE)
+
+@app.get("/loop")
+def event_loop_state():
+    """Квантили задержки event loop и стеки последних долгих блокировок."""
+    return loop_monitor.snapshot()
\ No newline at end of file
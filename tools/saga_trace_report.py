@@ -0,0 +1,145 @@
+"""
+Разбивка времени саги заказа по стадиям из файлов спанов (*.otlp.jsonl).
+
+Спаны группируются по trace_id; для каждой стадии (сервис + имя спана)
+считаются p50/p95/p99/среднее и доля в сквозном времени трассы — от начала
+первого спана до конца последнего. Стадии выводятся в порядке саги: по
+медиане смещения начала стадии от начала трассы.
+
+    python tools/saga_trace_report.py /var/log/traces
+    python tools/saga_trace_report.py traces/ --final-span order.status_update --json
+
+Спаны queue.wait и outbox.wait начинаются по часам одного хоста, а
+заканчиваются по часам другого: расхождение часов между хостами попадает
+прямо в их длительность (отрицательные интервалы обрезаются до нуля при
+записи). Для сравнения стадий держите хосты под NTP/chrony и смотрите на
+перцентили, а не на отдельные трассы.
+"""
+import argparse
+import json
+import statistics
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+def _service_name(resource: dict) -> str:
+    for attribute in resource.get("attributes", []):
+        if attribute.get("key") == "service.name":
+            return attribute["value"].get("stringValue", "unknown")
+    return "unknown"
+
+def load_traces(paths: list[Path]) -> dict[str, list[dict]]:
+    traces: dict[str, list[dict]] = defaultdict(list)
+    files = []
+    for path in paths:
+        files.extend(sorted(path.glob("*.otlp.jsonl")) if path.is_dir() else [path])
+    for file in files:
+        with open(file) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                for resource_spans in json.loads(line).get("resourceSpans", []):
+                    service = _service_name(resource_spans.get("resource", {}))
+                    for scope_spans in resource_spans.get("scopeSpans", []):
+                        for span in scope_spans.get("spans", []):
+                            traces[span["traceId"]].append({
+                                "stage": f"{service}: {span['name']}",
+                                "start": int(span["startTimeUnixNano"]),
+                                "end": int(span["endTimeUnixNano"]),
+                            })
+    return traces
+
+def percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q * (len(ordered) - 1))))
+    return ordered[index]
+
+def build_report(traces: dict[str, list[dict]], final_span: str | None) -> dict:
+    end_to_end: list[float] = []
+    durations: dict[str, list[float]] = defaultdict(list)
+    offsets: dict[str, list[float]] = defaultdict(list)
+
+    for spans in traces.values():
+        if final_span and not any(s["stage"].endswith(f": {final_span}") for s in spans):
+            continue
+        trace_start = min(s["start"] for s in spans)
+        end_to_end.append((max(s["end"] for s in spans) - trace_start) / 1e6)
+        # Стадия может встретиться в трассе несколько раз (повторная доставка)
+        per_trace: dict[str, float] = defaultdict(float)
+        first_start: dict[str, int] = {}
+        for span in spans:
+            per_trace[span["stage"]] += (span["end"] - span["start"]) / 1e6
+            first_start[span["stage"]] = min(first_start.get(span["stage"], span["start"]), span["start"])
+        for stage, duration in per_trace.items():
+            durations[stage].append(duration)
+            offsets[stage].append((first_start[stage] - trace_start) / 1e6)
+
+    if not end_to_end:
+        return {"traces": 0, "stages": []}
+
+    mean_total = statistics.fmean(end_to_end)
+    stages = []
+    for stage in sorted(durations, key=lambda name: statistics.median(offsets[name])):
+        values = durations[stage]
+        mean = statistics.fmean(values)
+        stages.append({
+            "stage": stage,
+            "count": len(values),
+            "p50_ms": round(percentile(values, 0.50), 3),
+            "p95_ms": round(percentile(values, 0.95), 3),
+            "p99_ms": round(percentile(values, 0.99), 3),
+            "mean_ms": round(mean, 3),
+            # Доля от среднего сквозного времени с учетом трасс, где стадии не было
+            "share": round(mean * len(values) / len(end_to_end) / mean_total, 4),
+        })
+    return {
+        "traces": len(end_to_end),
+        "end_to_end": {
+            "p50_ms": round(percentile(end_to_end, 0.50), 3),
+            "p95_ms": round(percentile(end_to_end, 0.95), 3),
+            "p99_ms": round(percentile(end_to_end, 0.99), 3),
+            "mean_ms": round(mean_total, 3),
+        },
+        "stages": stages,
+    }
+
+def print_report(report: dict) -> None:
+    if not report["traces"]:
+        print("No complete traces found.")
+        return
+    total = report["end_to_end"]
+    print(f"Traces: {report['traces']}")
+    print(
+        f"End-to-end: p50 {total['p50_ms']:.1f} ms, p95 {total['p95_ms']:.1f} ms, "
+        f"p99 {total['p99_ms']:.1f} ms, mean {total['mean_ms']:.1f} ms"
+    )
+    print()
+    width = max(len(s["stage"]) for s in report["stages"])
+    print(f"{'stage':<{width}}  {'count':>6}  {'p50':>9}  {'p95':>9}  {'p99':>9}  {'mean':>9}  {'share':>6}")
+    for s in report["stages"]:
+        print(
+            f"{s['stage']:<{width}}  {s['count']:>6}  {s['p50_ms']:>9.2f}  {s['p95_ms']:>9.2f}  "
+            f"{s['p99_ms']:>9.2f}  {s['mean_ms']:>9.2f}  {s['share']:>6.1%}"
+        )
+    print()
+    print("Stages overlap (HTTP spans contain the outbox write), so shares do not sum to 100%.")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="+", type=Path, help="Каталоги или файлы *.otlp.jsonl")
+    parser.add_argument(
+        "--final-span", default="order.status_update",
+        help="Учитывать только трассы с этим спаном (дошедшие до конца саги); пустая строка — все",
+    )
+    parser.add_argument("--json", action="store_true", help="Вывести отчет в JSON")
+    args = parser.parse_args()
+
+    report = build_report(load_traces(args.paths), args.final_span or None)
+    if args.json:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        print_report(report)
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file